@@ -7,69 +7,194 @@
 # Script can be improved but for testing purposes, in this case it was enough
 
 import os
-import subprocess
+import sys
 import shutil
-import psutil
 import logging
 import json
 import time
-from pprint import pprint
+import argparse
 
-# Configure logging
-logging.basicConfig(
-    filename="PECmd_looper.log", 
-    level=logging.INFO, 
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+import bulk_copy
+import columnar
+import dir_index
+import json_stream
+import log_queue
+import metrics
+import parse_cache
+import path_table
+import prefetch_watch
+import run_archive
+import run_store
+import snapshot_diff
 
+# Fields of PECmd output written into the log by process_json_files
+SUMMARY_KEYS = ("ExecutableName", "Hash", "LastRun", "RunCount")
+SUMMARY_COUNT_KEYS = ("Directories", "FilesLoaded")
 
 
 
-def start_and_close_program(program_path,program_name):
+
+
+def close_process_trees(processes, timeout=5):
     """
-    Starts Google program from the specified path, waits for 15 seconds, then closes it.
+    Closes started programs together with all their child processes: terminate first,
+    kill what is still running after the timeout. Other processes with the same name are left alone.
+    All programs are closed at the same time.
 
-    :param program_path: Full path to the Google program executable.
+    :param processes: subprocess.Popen objects of the started programs.
+    :param timeout: (Optional) Seconds to wait after terminate and after kill.
+    :return: List of (processes closed, shutdown seconds) per started program.
     """
-    try:
-        # Start program
-        process = subprocess.Popen(program_path, shell=True)
-        logging.info(f"Started program: {program_path}")
-        print(f"Started program: {program_path}")
-
-        # Wait 15 seconds
-        time.sleep(30)
-
-        # Find and close program processes
-        closed = False
-        for proc in psutil.process_iter(attrs=['pid', 'name']):
-            if program_name in proc.info['name'].lower():
-                proc.terminate()  # Terminate program
-                closed = True
-
-        if closed:
-            logging.info("Closed Google program after 15 seconds.")
-            print("Closed Google program.")
+    import psutil  # Only needed when programs are started (option 9)
+
+    started = time.perf_counter()
+
+    trees = []
+    for process in processes:
+        try:
+            parent = psutil.Process(process.pid)
+            trees.append(parent.children(recursive=True) + [parent])  # Collect before children are orphaned
+        except psutil.NoSuchProcess:
+            trees.append([])
+
+    owner = {proc.pid: index for index, procs in enumerate(trees) for proc in procs}
+    finished = [started] * len(trees)
+
+    def on_exit(proc):
+        index = owner[proc.pid]
+        finished[index] = max(finished[index], time.perf_counter())
+
+    procs = [proc for tree in trees for proc in tree]
+    for proc in procs:
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+
+    gone, alive = psutil.wait_procs(procs, timeout=timeout, callback=on_exit)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(alive, timeout=timeout, callback=on_exit)
+
+    for process in processes:
+        process.poll()  # Reap the started process
+
+    return [(len(tree), finished[index] - started) for index, tree in enumerate(trees)]
+
+
+
+
+def start_and_close_programs(programs, max_wait=30, settle=2, terminate_timeout=5):
+    """
+    Starts all programs at once, waits until their Prefetch files are written (or for max_wait seconds),
+    then closes every started program with its child processes.
+
+    :param programs: List of (program_path, watch), watch is (source_folder, prefix, suffix)
+                     of the program's Prefetch files or None for a fixed max_wait seconds wait.
+    :param max_wait: (Optional) Seconds to wait, upper bound when watch is set.
+    :param settle: (Optional) Seconds the Prefetch files must stay unchanged to be considered written.
+    :param terminate_timeout: (Optional) Seconds a program gets to exit before it is killed.
+    :return: List of dictionaries per program: program, pid, launch/wait/shutdown seconds,
+             closed process count and prefetch_watch.wait_for_prefetch result.
+    """
+    import subprocess
+
+    results = []
+    launched = []  # (result, process, watch, baseline)
+
+    # Start programs
+    for program_path, watch in programs:
+        result = {"program": program_path, "pid": None, "launch": 0.0, "wait": 0.0, "shutdown": 0.0, "closed": 0, "wait_result": None}
+        results.append(result)
+        try:
+            baseline = prefetch_watch.snapshot(*watch) if watch else None
+            started = time.perf_counter()
+            process = subprocess.Popen([program_path])
+            result["launch"] = time.perf_counter() - started
+            result["pid"] = process.pid
+            launched.append((result, process, watch, baseline))
+            logging.info(f"Started program: {program_path} (PID {process.pid})")
+            print(f"Started program: {program_path}")
+        except Exception as e:
+            logging.error(f"Error starting {program_path}: {e}")
+            print(f"Error: {e}")
+
+    # Wait for Prefetch write or fixed time, programs run in parallel so waits overlap
+    wait_start = time.perf_counter()
+    for result, process, watch, baseline in launched:
+        remaining = max(0.0, max_wait - (time.perf_counter() - wait_start))
+        if watch:
+            wait_result = prefetch_watch.wait_for_prefetch(*watch, baseline=baseline, max_wait=remaining, settle=settle)
+            result["wait_result"] = wait_result
+            logging.info(f"Prefetch wait: {wait_result['waited']:.1f} seconds, changed: {', '.join(wait_result['changed']) or 'none'}, timed out: {wait_result['timed_out']}")
         else:
-            logging.warning("No running program process found to close.")
-            print("No running program process found to close.")
+            time.sleep(remaining)
+        result["wait"] = time.perf_counter() - wait_start
 
+    # Close started programs
+    try:
+        closed = close_process_trees([process for _, process, _, _ in launched], terminate_timeout)
     except Exception as e:
-        logging.error(f"Error: {e}")
+        logging.error(f"Error closing programs: {e}")
         print(f"Error: {e}")
+        closed = []
+
+    for (result, _, _, _), (count, shutdown) in zip(launched, closed):
+        result["closed"] = count
+        result["shutdown"] = shutdown
+        if count:
+            logging.info(f"Closed {result['program']}: {count} processes | Launch: {result['launch']:.2f}s | Wait: {result['wait']:.1f}s | Shutdown: {shutdown:.2f}s")
+            print(f"Closed program: {result['program']}")
+        else:
+            logging.warning(f"Program already exited, nothing to close: {result['program']}")
+            print("No running program process found to close.")
+
+    return results
 
 
 
 
-def copy_prefetch_files(source_folder, destination_folder, prefix="", suffix=""):
+def start_and_close_program(program_path,program_name,watch=None,max_wait=30,settle=2):
+    """
+    Starts the program from the specified path, waits, then closes it. With watch set it waits until the
+    program's Prefetch files are written and unchanged for settle seconds (see prefetch_watch.py), at most
+    max_wait seconds, without watch it waits max_wait seconds. Only the started process and its child
+    processes are closed, found by PID (see start_and_close_programs).
+
+    :param program_path: Full path to the program executable.
+    :param program_name: Program name used in messages.
+    :param watch: (Optional) (source_folder, prefix, suffix) of the Prefetch files written for the program.
+    :param max_wait: (Optional) Seconds to wait, upper bound when watch is set.
+    :param settle: (Optional) Seconds the Prefetch files must stay unchanged to be considered written.
+    :return: prefetch_watch.wait_for_prefetch result when watch is set, otherwise None.
+    """
+    result = start_and_close_programs([(program_path, watch)], max_wait, settle)[0]
+    if result["closed"]:
+        print(f"Closed {program_name}.")
+    return result["wait_result"]
+
+
+
+
+def copy_prefetch_files(source_folder, destination_folder, prefix="", suffix="", workers=4, method="copy", skip_unchanged=True, verify_digest=False,
+                        names=None):
     """
     Copies Prefetch files from the source folder to the destination folder, 
     filtering by specified prefix and suffix.
+    Files already in the destination with the same size and mtime are skipped (see bulk_copy.py).
 
     :param source_folder: Folder where Prefetch files are located.
     :param destination_folder: Folder where filtered Prefetch files will be copied.
     :param prefix: (Optional) Prefix to filter files.
     :param suffix: (Optional) Suffix to filter files.
+    :param workers: (Optional) Number of files copied at the same time.
+    :param method: (Optional) "copy", "reflink" or "hardlink" (only for sources that are not rewritten, e.g. mounted images).
+    :param skip_unchanged: (Optional) Skip files that are already in the destination.
+    :param verify_digest: (Optional) Compare file content (SHA-256) instead of mtime when sizes match.
+    :param names: (Optional) Exact Prefetch file names to copy (see prefetch_hash.py), others with the prefix are left out.
     """
     if not os.path.exists(source_folder):
         logging.error(f"Source folder not found: {source_folder}")
@@ -81,10 +206,10 @@ def copy_prefetch_files(source_folder, destination_folder, prefix="", suffix="")
         logging.info(f"Created destination folder: {destination_folder}")
 
     # Collect matching Prefetch files
-    matching_files = [
-        file for file in os.listdir(source_folder)
-        if file.startswith(prefix) and file.endswith(suffix)
-    ]
+    index = dir_index.get_index(source_folder)
+    matching_files = [info.name for info in index.files(prefix, suffix, names=names)]
+    metrics.count("files_scanned", len(index.entries))
+    metrics.count("files_matched", len(matching_files))
 
     if not matching_files:
         logging.warning("No matching Prefetch files found.")
@@ -92,32 +217,50 @@ def copy_prefetch_files(source_folder, destination_folder, prefix="", suffix="")
         return
 
     # Copy matching files
-    for file in matching_files:
-        source_path = os.path.join(source_folder, file)
-        destination_path = os.path.join(destination_folder, file)
+    report = bulk_copy.bulk_copy(source_folder, destination_folder, matching_files, workers, method, skip_unchanged, verify_digest)
 
-        try:
-            shutil.copy2(source_path, destination_path)  # Copy with metadata
-            logging.info(f"Copied: {source_path} -> {destination_path}")
-            print(f"Copied: {file} -> {destination_folder}")
+    for file, used in report["copied"]:
+        log_queue.file_event(f"Copied ({used}): {os.path.join(source_folder, file)} -> {os.path.join(destination_folder, file)}",
+                             f"Copied: {file} -> {destination_folder}")
+    for file, reason in report["skipped"]:
+        log_queue.file_event(f"Skipped ({reason}): {os.path.join(source_folder, file)}", f"Skipped unchanged: {file}")
+    for file, error in report["failed"]:
+        logging.error(f"Error copying {file}: {error}")
+        print(f"Error copying {file}: {error}")
 
-        except Exception as e:
-            logging.error(f"Error copying {file}: {e}")
-            print(f"Error copying {file}: {e}")
+    metrics.count("files_copied", len(report["copied"]))
+    metrics.count("bytes_copied", report["bytes_copied"])
+    metrics.count("files_skipped", len(report["skipped"]))
+    metrics.count("bytes_skipped", report["bytes_skipped"])
+    log_queue.stage_summary(f"Copied {len(report['copied'])} files, skipped {len(report['skipped'])} unchanged, {len(report['failed'])} failed.")
+    print(f"Copied {report['bytes_copied']} bytes, skipped {report['bytes_skipped']} bytes of unchanged files.")
+    return report
 
 
 
 
 
 
-def process_files(process_search, folder_path, command_template):
+def process_files(process_search, folder_path, command_template, backend="pecmd", workers=1, timeout=None, cache_folder=None, names=None):
     """
     Finds all files in the specified folder that match the prefix 'MSEDGE.EXE-' 
     and executes a given command using cmd.exe for each file.
+    With backend "native" files are parsed in-process by prefetch_parser instead,
+    no command is executed and no JSON is written, parsed records are returned.
+    Files are analyzed by up to `workers` concurrent workers (see analyze_pool.py).
     
     :param folder_path: The directory to scan for matching files.
     :param command_template: The command template where '{}' will be replaced by the file path.
+    :param backend: (Optional) "pecmd" (default) to run command_template, "native" to parse in-process,
+                    "native-summary" to read only the fields process_records needs.
+    :param workers: (Optional) Number of files analyzed at the same time.
+    :param timeout: (Optional) Seconds after which the command for one file is killed.
+    :param cache_folder: (Optional) Parse cache location (see parse_cache.py), only changed files are analyzed.
+                         With backend "pecmd" cached output is written back as {filename}.json into folder_path.
+    :param names: (Optional) Exact file names to analyze (see prefetch_hash.py).
     """
+    import analyze_pool  # Parser backends are loaded on first use
+
     prefix,suffix = process_search
 
     if not os.path.exists(folder_path):
@@ -126,10 +269,9 @@ def process_files(process_search, folder_path, command_template):
     
     # Collect matching file paths
     file_paths = [
-        os.path.join(folder_path, file)
-        for file in os.listdir(folder_path)
-            if file.startswith(prefix) and file.endswith(suffix)
+        info.path for info in dir_index.get_index(folder_path).files(prefix, suffix, names=names)
     ]
+    metrics.count("files_scanned", len(file_paths))
 
     if not file_paths:
         logging.warning("No matching files found.")
@@ -137,33 +279,110 @@ def process_files(process_search, folder_path, command_template):
     
     logging.info(f"Found {len(file_paths)} matching files.")
 
-    # Iterate over files and execute the command
+    analyze_backend = analyze_pool.get_backend(backend, command_template)
+    cache = parse_cache.ParseCache(cache_folder, analyze_backend.version_key()) if cache_folder else None
+
+    # Take unchanged files from the cache, analyze only the rest
+    cached = {}
+    pending_paths = file_paths
+    if cache:
+        for file_path in file_paths:
+            record = cache.get(file_path)
+            if record is None:
+                continue
+            cached[file_path] = record
+            if not analyze_backend.in_process:
+                write_json_output(record, folder_path, file_path)
+        pending_paths = [file_path for file_path in file_paths if file_path not in cached]
+
+    results = {
+        file_path: (record, error)
+        for file_path, record, error in analyze_pool.analyze_files(pending_paths, analyze_backend, workers, timeout=timeout)
+    }
+
+    records = []
+    failed = 0
     for file_path in file_paths:
+        if file_path in cached:
+            log_queue.file_event(f"Taken from parse cache: {file_path}")
+            metrics.count("files_cached")
+            record = cached[file_path]
+        else:
+            record, error = results[file_path]
+            if error:
+                logging.error(f"Error processing {file_path}: {error}")
+                failed += 1
+                continue
 
-        filename = os.path.splitext(os.path.basename(file_path))[0]
+            log_queue.file_event(f"Successfully processed: {file_path}")
+            metrics.count("files_parsed")
+            if cache and record is None:
+                record = read_json_output(folder_path, file_path)
+            if cache and record is not None:
+                cache.put(file_path, record)
 
-        command = command_template.format(file_path,filename)
-        logging.info(f"Executing: {command}")
+        if analyze_backend.in_process:
+            records.append(record)
 
-        try:
-            subprocess.run(command, shell=True, check=True)
-            logging.info(f"Successfully processed: {file_path}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Error processing {file_path}: {e}")
+    log_queue.stage_summary(f"Analyzed {len(file_paths) - failed} files ({len(cached)} from parse cache), {failed} failed.")
+
+    if cache:
+        cache.save()
+        cache.log_stats()
 
+    return records
 
 
 
 
 
 
-def process_json_files(analysis_search,folder_path,counter):
+
+def json_output_path(folder_path, file_path):
+    """
+    Returns where the command template (PECmd) writes JSON output for the Prefetch file: {folder_path}\\{filename}.json
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(folder_path, f"{filename}.json")
+
+
+
+
+def read_json_output(folder_path, file_path):
+    """
+    Loads the JSON output written by the command template for the Prefetch file, None if missing.
+    """
+    try:
+        with open(json_output_path(folder_path, file_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError) as e:
+        logging.error(f"Error reading output of {file_path}: {e}")
+        return None
+
+
+
+
+def write_json_output(record, folder_path, file_path):
+    """
+    Writes a cached record as if the command template (PECmd) produced it.
+    """
+    with open(json_output_path(folder_path, file_path), "w", encoding="utf-8") as f:
+        json.dump(record, f)
+
+
+
+
+
+
+
+def process_json_files(analysis_search,folder_path,counter,store=None):
     """
     Reads JSON files in the given folder that match the naming pattern "202501241*_PECmd_Output.json",
     extracts "ExecutableName" and "Hash", and prints them in the format "ExecutableName-Hash"
     along with "LastRun" and "RunCount".
     
     :param folder_path: The directory to scan for JSON files.
+    :param store: (Optional) run_store.RunStore, records are also saved there under run number counter.
     """
     prefix,suffix = analysis_search
 
@@ -173,10 +392,9 @@ def process_json_files(analysis_search,folder_path,counter):
     
     # Collect matching JSON file paths
     json_files = [
-        os.path.join(folder_path, file)
-        for file in os.listdir(folder_path)
-        if file.startswith(prefix) and file.endswith(suffix)
-    ]
+        info.path for info in dir_index.get_index(folder_path).files(prefix, suffix)
+    ] + columnar.find(folder_path)
+    metrics.count("json_files_scanned", len(json_files))
 
     if not json_files:
         logging.warning("No matching JSON files found.")
@@ -184,41 +402,171 @@ def process_json_files(analysis_search,folder_path,counter):
     
     logging.info(f"Found {len(json_files)} matching JSON files.")
     logging.warning(f"### RUN {counter} ###")
-    # Iterate through JSON files
+    rows = []
+    # Iterate through JSON files, only needed keys are decoded and list fields are only counted
     for json_file in json_files:
         try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)  # Load JSON content
-
-            # Extract necessary fields
-            executable_name = data.get("ExecutableName", "Unknown")
-            hash_value = data.get("Hash", "NoHash")
-            last_run = data.get("LastRun", "Unknown")
-            run_count = data.get("RunCount", "Unknown")
-            run_count = data.get("RunCount", "Unknown")
-
-            directories = data.get("Directories", "Unknown").split(",")
-            directories_count =len(directories)
-            filesloaded = data.get("FilesLoaded", "Unknown").split(",")
-            filesloaded_count =len(filesloaded)
-            
-
-            # Format and print output
-            formatted_output = f"{executable_name}-{hash_value}"
-            logging.warning(f"{formatted_output} | Last Run: {last_run} | Run Count: {run_count} | Dir Count: {directories_count} | File Count: {filesloaded_count}")
+            with metrics.timer("json_decode_seconds"):
+                for data in json_stream.iter_records(json_file, SUMMARY_KEYS, SUMMARY_COUNT_KEYS):
+                    rows.append(log_record(data))
+            metrics.count("json_bytes_read", os.path.getsize(json_file))
 
             #logging.info(f"Processed: {json_file}")
 
         except (json.JSONDecodeError, FileNotFoundError, KeyError) as e:
             logging.error(f"Error processing {json_file}: {e}")
 
+    metrics.count("records_extracted", len(rows))
+    if store:
+        store.add_run(counter, rows)
+
+
 
 
 
 
 
+def process_records(records, counter, store=None):
+    """
+    Same output as process_json_files but for records already parsed in-process
+    (process_files with backend "native"), no JSON files are read.
+
+    :param records: List of parsed Prefetch records.
+    :param counter: Run number written into the log.
+    :param store: (Optional) run_store.RunStore, records are also saved there under run number counter.
+    """
+    if not records:
+        logging.warning("No parsed records found.")
+        return
+
+    logging.info(f"Found {len(records)} parsed records.")
+    logging.warning(f"### RUN {counter} ###")
+    rows = [log_record(record) for record in records]
+
+    metrics.count("records_extracted", len(rows))
+    if store:
+        store.add_run(counter, rows)
+
+
+
+
+
+
+
+def log_record(data):
+    """
+    Extracts "ExecutableName", "Hash", "LastRun", "RunCount" and the number of
+    "Directories" and "FilesLoaded" entries from one record and writes them into the log.
+    Returns the extracted values as a row for run_store.RunStore.
 
-def view_json_files(folder_path,analysis_search):
+    :param data: PECmd JSON content, a record from prefetch_parser or from json_stream.iter_records
+                 (with "DirectoriesCount" and "FilesLoadedCount" instead of the lists).
+    """
+    # Extract necessary fields
+    executable_name = data.get("ExecutableName", "Unknown")
+    hash_value = data.get("Hash", "NoHash")
+    last_run = data.get("LastRun", "Unknown")
+    run_count = data.get("RunCount", "Unknown")
+
+    # Same as len(value.split(",")) without building the list
+    if "DirectoriesCount" in data:
+        directories_count = data["DirectoriesCount"]
+    else:
+        directories_count = data.get("Directories", "Unknown").count(",") + 1
+    if "FilesLoadedCount" in data:
+        filesloaded_count = data["FilesLoadedCount"]
+    else:
+        filesloaded_count = data.get("FilesLoaded", "Unknown").count(",") + 1
+
+
+    # Format and print output
+    formatted_output = f"{executable_name}-{hash_value}"
+    logging.warning(f"{formatted_output} | Last Run: {last_run} | Run Count: {run_count} | Dir Count: {directories_count} | File Count: {filesloaded_count}")
+
+    return {
+        "executable": executable_name,
+        "hash": hash_value,
+        "last_run": last_run,
+        "run_count": run_count,
+        "dir_count": directories_count,
+        "file_count": filesloaded_count,
+    }
+
+
+
+
+
+
+
+def output_choices(analysis_search, folder_path):
+    """
+    Returns (label, file path, record name) of every matching JSON file and of every record of the
+    columnar container (see columnar.py) in the folder, record name is None for JSON files.
+    """
+    prefix, suffix = analysis_search
+    choices = [(info.name, info.path, None) for info in dir_index.get_index(folder_path).files(prefix, suffix)]
+    for container_path in columnar.find(folder_path):
+        names = sorted(name for name in columnar.ColumnarReader(container_path).index if name.startswith(prefix))
+        choices.extend((f"{columnar.CONTAINER_NAME}: {name}", container_path, name) for name in names)
+    return choices
+
+
+
+
+def load_output(file_path, record_name=None):
+    """
+    Loads a JSON file, or one record of a columnar container when record_name is given.
+    """
+    if record_name is not None:
+        return columnar.ColumnarReader(file_path).record(record_name)
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+
+
+def load_output_entry(file_path, record_name, table):
+    """
+    path_table.PrefetchEntry of the first record of a JSON file or of a record of a columnar container.
+    """
+    if record_name is not None:
+        # Entries split like json_stream does for JSON files, so both compare equal
+        return path_table.PrefetchEntry.from_record(columnar.ColumnarReader(file_path).record(record_name, joined=False), table)
+    return next(path_table.load_entries(file_path, table), None) or path_table.PrefetchEntry("Unknown", "NoHash")
+
+
+
+
+def write_run_container(folder_path, analysis_search, records=None):
+    """
+    Writes the analyze results of the work folder as one columnar container (see columnar.py)
+    instead of one JSON file per Prefetch file. Records parsed in-process are written directly,
+    otherwise the PECmd JSON files are packed into the container and deleted.
+
+    :param folder_path: Work folder.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    :param records: (Optional) Records parsed in-process (backend "native").
+    """
+    if not os.path.exists(folder_path):
+        logging.error(f"Folder not found: {folder_path}")
+        return
+
+    if records:
+        count, size = len(records), columnar.write_records(os.path.join(folder_path, columnar.CONTAINER_NAME), records)
+    else:
+        count, size, packed = columnar.pack_folder(folder_path, *analysis_search, delete=True)
+        index = dir_index.get_index(folder_path)
+        for json_file in packed:
+            index.discard(os.path.basename(json_file))
+        metrics.count("json_files_packed", len(packed))
+
+    metrics.count("container_bytes", size)
+    logging.info(f"Wrote {count} records into {os.path.join(folder_path, columnar.CONTAINER_NAME)} ({size} bytes)")
+
+
+
+
+def view_json_files(analysis_search,folder_path):
     """
     Lists JSON files in the given folder that match the naming pattern "202501241*_PECmd_Output.json",
     allows the user to select one, and displays its contents in a nicely formatted way.
@@ -232,12 +580,9 @@ def view_json_files(folder_path,analysis_search):
         print(f"Error: Folder not found: {folder_path}")
         return
 
-    # Collect matching JSON file paths
-    json_files = [
-        os.path.join(folder_path, file)
-        for file in os.listdir(folder_path)
-        if file.startswith(prefix) and file.endswith(suffix)
-    ]
+    # Collect matching JSON files and records of the columnar container
+    json_files = output_choices(analysis_search, folder_path)
+    metrics.count("json_files_scanned", len(json_files))
 
     if not json_files:
         logging.warning("No matching JSON files found.")
@@ -246,8 +591,8 @@ def view_json_files(folder_path,analysis_search):
 
     # Display available JSON files
     print("\nAvailable JSON files:")
-    for idx, file_path in enumerate(json_files, start=1):
-        print(f"{idx}. {os.path.basename(file_path)}")
+    for idx, (label, _, _) in enumerate(json_files, start=1):
+        print(f"{idx}. {label}")
 
     # Get user selection
     try:
@@ -259,12 +604,11 @@ def view_json_files(folder_path,analysis_search):
         print("Invalid input. Please enter a number.")
         return
 
-    selected_file = json_files[choice]
+    _, selected_file, record_name = json_files[choice]
 
     # Load and display JSON content
     try:
-        with open(selected_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = load_output(selected_file, record_name)
 
         print("\n---- JSON Content ----")
         print(json.dumps(data, indent=4, sort_keys=True))  # Nicely formatted JSON output
@@ -272,7 +616,7 @@ def view_json_files(folder_path,analysis_search):
 
         logging.info(f"Displayed JSON file: {selected_file}")
 
-    except (json.JSONDecodeError, FileNotFoundError) as e:
+    except (json.JSONDecodeError, FileNotFoundError, ValueError) as e:
         logging.error(f"Error reading JSON file {selected_file}: {e}")
         print(f"Error: Unable to read the file. {e}")
 
@@ -288,6 +632,8 @@ def compare_json_files(analysis_search,folder_path):
     
     :param folder_path: The directory to scan for JSON files.
     """
+    from pprint import pprint
+
     prefix,suffix = analysis_search
 
     if not os.path.exists(folder_path):
@@ -295,12 +641,9 @@ def compare_json_files(analysis_search,folder_path):
         print(f"Error: Folder not found: {folder_path}")
         return
 
-    # Collect matching JSON file paths
-    json_files = [
-        os.path.join(folder_path, file)
-        for file in os.listdir(folder_path)
-        if file.startswith(prefix) and file.endswith(suffix)
-    ]
+    # Collect matching JSON files and records of the columnar container
+    json_files = output_choices(analysis_search, folder_path)
+    metrics.count("json_files_scanned", len(json_files))
 
     if len(json_files) < 2:
         logging.warning("Not enough JSON files found for comparison.")
@@ -309,8 +652,8 @@ def compare_json_files(analysis_search,folder_path):
 
     # Display available JSON files
     print("\nAvailable JSON files:")
-    for idx, file_path in enumerate(json_files, start=1):
-        print(f"{idx}. {os.path.basename(file_path)}")
+    for idx, (label, _, _) in enumerate(json_files, start=1):
+        print(f"{idx}. {label}")
 
     # Get user selection for two files
     try:
@@ -324,29 +667,24 @@ def compare_json_files(analysis_search,folder_path):
         print("Invalid input. Please enter numbers.")
         return
 
-    file1, file2 = json_files[choice1], json_files[choice2]
+    (_, file1, name1), (_, file2, name2) = json_files[choice1], json_files[choice2]
 
     # Load JSON files
     try:
-        with open(file1, "r", encoding="utf-8") as f1, open(file2, "r", encoding="utf-8") as f2:
-            data1, data2 = json.load(f1), json.load(f2)
-
-        # Extract necessary fields
-        exe_hash1 = f"{data1.get('ExecutableName', 'Unknown')}-{data1.get('Hash', 'NoHash')}"
-        exe_hash2 = f"{data2.get('ExecutableName', 'Unknown')}-{data2.get('Hash', 'NoHash')}"
-
-        directories1 = set(data1.get("Directories", "").split(",")) if "Directories" in data1 else set()
-        directories2 = set(data2.get("Directories", "").split(",")) if "Directories" in data2 else set()
+        # Only the first record of each JSON file is compared, paths are compared as interned IDs
+        table = path_table.PathTable()
+        entry1 = load_output_entry(file1, name1, table)
+        entry2 = load_output_entry(file2, name2, table)
 
-        files_loaded1 = set(data1.get("FilesLoaded", "").split(",")) if "FilesLoaded" in data1 else set()
-        files_loaded2 = set(data2.get("FilesLoaded", "").split(",")) if "FilesLoaded" in data2 else set()
+        exe_hash1 = entry1.name
+        exe_hash2 = entry2.name
 
         # Calculate differences
-        dir_diff1 = directories1 - directories2  # Items in file1 but not in file2
-        dir_diff2 = directories2 - directories1  # Items in file2 but not in file1
+        dir_diff1 = table.resolve(entry1.difference(entry2, "Directories"))  # Items in file1 but not in file2
+        dir_diff2 = table.resolve(entry2.difference(entry1, "Directories"))  # Items in file2 but not in file1
 
-        files_diff1 = files_loaded1 - files_loaded2  # Items in file1 but not in file2
-        files_diff2 = files_loaded2 - files_loaded1  # Items in file2 but not in file1
+        files_diff1 = table.resolve(entry1.difference(entry2, "FilesLoaded"))  # Items in file1 but not in file2
+        files_diff2 = table.resolve(entry2.difference(entry1, "FilesLoaded"))  # Items in file2 but not in file1
 
         # Display results if they are similar but have differences
         print("\nComparison Results:")
@@ -371,7 +709,7 @@ def compare_json_files(analysis_search,folder_path):
 
         logging.info(f"Compared files: {file1} and {file2}")
 
-    except (json.JSONDecodeError, FileNotFoundError, KeyError) as e:
+    except (json.JSONDecodeError, FileNotFoundError, KeyError, ValueError) as e:
         logging.error(f"Error reading JSON files: {e}")
         print(f"Error: Unable to read the files. {e}")
 
@@ -391,23 +729,26 @@ def delete_all_files(folder_path):
         return
 
     file_count = 0
+    index = dir_index.get_index(folder_path)
 
-    for file in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file)
-        
-        if os.path.isfile(file_path):  # Ensure it's a file, not a directory
-            try:
-                os.remove(file_path)
-                logging.info(f"Deleted: {file_path}")
-                print(f"Deleted: {file_path}")
-                file_count += 1
-            except Exception as e:
-                logging.error(f"Error deleting {file_path}: {e}")
-                print(f"Error deleting {file_path}: {e}")
+    for info in index.files():  # Only files, subdirectories stay intact
+        file_path = info.path
+
+        try:
+            os.remove(file_path)
+            index.discard(info.name)
+            metrics.count("files_deleted")
+            log_queue.file_event(f"Deleted: {file_path}", f"Deleted: {file_path}")
+            file_count += 1
+        except Exception as e:
+            logging.error(f"Error deleting {file_path}: {e}")
+            print(f"Error deleting {file_path}: {e}")
 
     if file_count == 0:
         print("No files found to delete.")
         logging.warning("No files found to delete.")
+    else:
+        log_queue.stage_summary(f"Deleted {file_count} files from {folder_path}")
 
 
 
@@ -427,31 +768,490 @@ def move_specific_files(analysis_search, folder_path, counter):
         print(f"Error: Source folder not found: {folder_path}")
         return
 
-    if not os.path.exists(folder_path+f"\\{counter}"):
-        os.makedirs(folder_path+f"\\{counter}")  # Create destination if it doesn't exist
-        logging.info(f'Created destination folder: {folder_path}+"\\"{counter}')
+    run_folder = os.path.join(folder_path, str(counter))  # folder_path\\{counter}
 
-    file_count = 0
+    if not os.path.exists(run_folder):
+        os.makedirs(run_folder)  # Create destination if it doesn't exist
+        logging.info(f"Created destination folder: {run_folder}")
 
-    for file in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file)
+    file_count = 0
+    index = dir_index.get_index(folder_path)
 
-        # Check if it's a file and matches the allowed extensions
-        if os.path.isfile(file_path) and file.lower().endswith(suffix):
-            destination_path = os.path.join(folder_path+f"\\{counter}", file)
+    # Files matching the allowed extensions and the columnar container
+    for info in index.files(suffix=suffix, ignore_case=True) + index.files(columnar.CONTAINER_NAME, columnar.SUFFIX):
+        file_path = info.path
+        file = info.name
 
-            try:
-                shutil.move(file_path, folder_path+f"\\{counter}")
-                logging.info(f"Moved: {file_path} -> {folder_path+f"\\{counter}"}")
-                print(f"Moved: {file} -> {folder_path+f"\\{counter}"}")
-                file_count += 1
-            except Exception as e:
-                logging.error(f"Error moving {file_path}: {e}")
-                print(f"Error moving {file_path}: {e}")
+        try:
+            shutil.move(file_path, run_folder)
+            index.discard(file)
+            metrics.count("files_moved")
+            metrics.count("bytes_moved", info.size)
+            log_queue.file_event(f"Moved: {file_path} -> {run_folder}", f"Moved: {file} -> {run_folder}")
+            file_count += 1
+        except Exception as e:
+            logging.error(f"Error moving {file_path}: {e}")
+            print(f"Error moving {file_path}: {e}")
 
     if file_count == 0:
         print("No matching files found to move.")
         logging.warning("No matching files found to move.")
+    else:
+        log_queue.stage_summary(f"Moved {file_count} files to {run_folder}")
+
+
+
+
+def diff_all_runs(analysis_search, folder_path, report_path="snapshot_diff.json", archive_folder=None):
+    """
+    Compares 'Directories' and 'FilesLoaded' of every record across all run folders
+    (folder_path\\{counter}) in one pass, prints a summary and saves all differences as JSON.
+    Runs of the run archive are compared instead when archive_folder contains runs.
+
+    :param folder_path: Work folder containing the run folders.
+    :param report_path: (Optional) Where the differences are saved.
+    :param archive_folder: (Optional) Run archive written by option 9 (see run_archive.py).
+    """
+    if archive_folder and os.path.exists(archive_folder) and run_archive.RunArchive(archive_folder).runs():
+        diffs = snapshot_diff.diff_archive(archive_folder, analysis_search)
+    elif not os.path.exists(folder_path):
+        logging.error(f"Folder not found: {folder_path}")
+        print(f"Error: Folder not found: {folder_path}")
+        return
+    else:
+        diffs = snapshot_diff.diff_run_folders(folder_path, analysis_search)
+    if not diffs:
+        print("No differences found between runs.")
+        return
+
+    print("\nDifferences between runs:")
+    for diff in diffs:
+        counts = " | ".join(
+            f"{field}: +{len(diff[field]['added'])} -{len(diff[field]['removed'])}"
+            for field in snapshot_diff.LIST_FIELDS
+        )
+        print(f"RUN {diff['previous_run']} -> {diff['run']} | {diff['record']} ({diff['status']}) | {counts}")
+
+    snapshot_diff.write_diff_report(diffs, report_path)
+    print(f"\nAll differences saved to {report_path}")
+    logging.info(f"Compared all runs of {archive_folder or folder_path}, {len(diffs)} differences saved to {report_path}")
+
+
+
+
+def show_timeline(analysis_search, folder_path, archive_folder=None, csv_path="execution_timeline.csv"):
+    """
+    Builds the execution timeline of all runs (see timeline.py), prints new execution times per run
+    and runs where Run Count grew without new run times, saves the merged timeline as CSV.
+
+    :param folder_path: Work folder containing the run folders.
+    :param archive_folder: (Optional) Run archive, used instead of the run folders when it contains runs.
+    :param csv_path: (Optional) Where the merged timeline is saved.
+    """
+    import timeline  # NumPy is only needed for this option
+
+    if archive_folder and os.path.exists(archive_folder) and run_archive.RunArchive(archive_folder).runs():
+        builder = timeline.load_archive(archive_folder, analysis_search)
+    elif os.path.exists(folder_path):
+        builder = timeline.load_run_folders(folder_path, analysis_search)
+    else:
+        logging.error(f"Folder not found: {folder_path}")
+        print(f"Error: Folder not found: {folder_path}")
+        return
+
+    records = builder.build()
+    if not len(records):
+        print("No runs found.")
+        return
+
+    events = records.events()
+    print(f"\n{len(records)} records, {len(events['key'])} distinct execution times.")
+
+    summary = records.run_summary()
+    print("\nNew execution times per run:")
+    for run, count, new_times, run_count_delta in zip(
+        summary["run"].tolist(), summary["records"].tolist(), summary["new_times"].tolist(), summary["run_count_delta"].tolist()
+    ):
+        print(f"RUN {run} | Records: {count} | New run times: {new_times} | Run Count growth: {run_count_delta}")
+
+    silent = records.silent_runs()
+    print("\nRun Count grew without new run times:")
+    for key, run, previous_run, delta, new_times in zip(
+        silent["key"].tolist(), silent["run"].tolist(), silent["previous_run"].tolist(),
+        silent["run_count_delta"].tolist(), silent["new_times"].tolist()
+    ):
+        _, executable, hash_value = records.key_names[key]
+        print(f"RUN {previous_run} -> {run} | {executable}-{hash_value} | Run Count +{delta} | New run times: {new_times}")
+
+    records.write_csv(csv_path)
+    print(f"\nMerged timeline saved to {csv_path}")
+    logging.info(f"Execution timeline of {len(records)} records saved to {csv_path}")
+
+
+
+
+def show_similar_records(analysis_search, folder_path, corpus_output=None, threshold=0.8, csv_path="similar_records.csv"):
+    """
+    Clusters records with nearly the same FilesLoaded (see similarity.py), e.g. one program under
+    several paths or renamed. Uses the merged corpus of option C when it exists, otherwise the
+    JSON files of the work folder and its run folders.
+
+    :param folder_path: Work folder.
+    :param corpus_output: (Optional) Output folder of corpus mode containing corpus.jsonl.
+    :param threshold: (Optional) Minimum estimated Jaccard similarity of FilesLoaded.
+    :param csv_path: (Optional) Where all clusters are saved.
+    """
+    import similarity  # NumPy is only needed for this option
+
+    prefix, suffix = analysis_search
+    corpus_path = os.path.join(corpus_output, "corpus.jsonl") if corpus_output else None
+    if corpus_path and os.path.exists(corpus_path):
+        builder = similarity.load_files([corpus_path])
+    elif os.path.exists(folder_path):
+        json_files = [info.path for info in dir_index.get_index(folder_path).files(prefix, suffix)]
+        builder = similarity.load_files(json_files + columnar.find(folder_path))
+        for run, run_folder in snapshot_diff.find_run_folders(folder_path):
+            run_files = [info.path for info in dir_index.get_index(run_folder).files(prefix, suffix)] + columnar.find(run_folder)
+            similarity.load_files(run_files, builder=builder, host=f"RUN {run}")
+    else:
+        logging.error(f"Folder not found: {folder_path}")
+        print(f"Error: Folder not found: {folder_path}")
+        return
+
+    if not len(builder):
+        print("No records found.")
+        return
+
+    index = builder.build(threshold=threshold)
+    groups = index.clusters()
+    similarity.print_clusters(index, groups)
+    index.write_csv(csv_path, groups, exact=True)
+    print(f"\nClusters saved to {csv_path}")
+    logging.info(f"{len(groups)} clusters of similar records out of {len(index)} records saved to {csv_path}")
+
+
+
+
+def archive_run_files(archive, folder_path, counter, records=None):
+    """
+    Stores the .pf files and PECmd output of the work folder as run `counter` in the run archive.
+    Unlike move_specific_files the .pf evidence is kept and unchanged files are stored only once.
+
+    :param archive: run_archive.RunArchive.
+    :param folder_path: Work folder.
+    :param counter: Run number.
+    :param records: (Optional) Records parsed in-process (backend "native"), stored as {filename}.json.
+    """
+    if not os.path.exists(folder_path):
+        logging.error(f"Source folder not found: {folder_path}")
+        print(f"Error: Source folder not found: {folder_path}")
+        return
+
+    named_records = {
+        os.path.basename(json_output_path(folder_path, record["SourceFilename"])): record
+        for record in records or () if "SourceFilename" in record
+    }
+    stats = archive.archive_run(counter, folder_path, (".pf", ".json", columnar.SUFFIX), named_records)
+    metrics.count("files_archived", stats["files"])
+    metrics.count("bytes_archived", stats["bytes_stored"])
+    metrics.count("bytes_deduplicated", stats["bytes_deduplicated"])
+    print(f"Archived run {counter}: {stats['files']} files, {stats['bytes_stored']} new bytes, {stats['bytes_deduplicated']} bytes already stored")
+    return stats
+
+
+
+
+
+def copy_step(source_index, destination_folder, method="copy", skip_unchanged=True, verify_digest=False):
+    """
+    Pipeline step of copy_prefetch_files: copies one Prefetch file into the work folder unless it is unchanged.
+
+    :param source_index: dir_index.DirectoryIndex of the source folder.
+    :param destination_folder: Work folder, must exist.
+    :param method: (Optional) "copy", "reflink" or "hardlink" (see bulk_copy.py).
+    :param skip_unchanged: (Optional) Skip files already in the work folder with the same size and mtime.
+    :param verify_digest: (Optional) Compare file content (SHA-256) instead of mtime when sizes match.
+    """
+    import async_pipeline
+
+    destination_index = dir_index.get_index(destination_folder)
+    destination_index.refresh(force=True)
+
+    def copy_one(source_info, destination_path):
+        if skip_unchanged and bulk_copy.is_unchanged(source_info, destination_index.get(source_info.name), verify_digest):
+            return None
+        with metrics.timer("copy_file_seconds"):
+            return bulk_copy.copy_file(source_info.path, destination_path, method)
+
+    async def step(item):
+        source_info = source_index.stat(item.name)  # Rewritten in place without changing the folder mtime
+        if source_info is None:
+            raise async_pipeline.StepError("Source file not found")
+
+        item.path = os.path.join(destination_folder, item.name)
+        used = await async_pipeline.in_executor(None, copy_one, source_info, item.path)
+        if used is None:
+            metrics.count("files_skipped")
+            metrics.count("bytes_skipped", source_info.size)
+            log_queue.file_event(f"Skipped (unchanged): {source_info.path}", f"Skipped unchanged: {item.name}")
+        else:
+            metrics.count("files_copied")
+            metrics.count("bytes_copied", source_info.size)
+            log_queue.file_event(f"Copied ({used}): {source_info.path} -> {item.path}", f"Copied: {item.name} -> {destination_folder}")
+        return item
+
+    return step
+
+
+
+
+def analyze_step(folder_path, analyze_backend, executor, timeout=None, cache=None):
+    """
+    Pipeline step of process_files: analyzes one Prefetch file of the work folder.
+
+    :param folder_path: Work folder, PECmd writes {filename}.json here.
+    :param analyze_backend: Backend from analyze_pool.get_backend.
+    :param executor: Executor from analyze_pool.get_executor, shared by all workers of the stage.
+    :param timeout: (Optional) Seconds after which the command for one file is killed.
+    :param cache: (Optional) parse_cache.ParseCache, only used from the event loop thread.
+    """
+    import analyze_pool
+    import async_pipeline
+
+    async def step(item):
+        record = cache.get(item.path) if cache else None
+        if record is not None:
+            log_queue.file_event(f"Taken from parse cache: {item.path}")
+            metrics.count("files_cached")
+            if not analyze_backend.in_process:
+                write_json_output(record, folder_path, item.path)
+            item.result = record if analyze_backend.in_process else None
+            return item
+
+        result, error, seconds = await async_pipeline.in_executor(executor, analyze_pool.run_one, analyze_backend, item.path, timeout)
+        analyze_pool.record_result(item.path, result, error, seconds, analyze_backend)
+        if error:
+            raise async_pipeline.StepError(error)
+
+        log_queue.file_event(f"Successfully processed: {item.path}")
+        metrics.count("files_parsed")
+        if cache:
+            record = result if analyze_backend.in_process else read_json_output(folder_path, item.path)
+            if record is not None:
+                cache.put(item.path, record)
+        item.result = result
+        return item
+
+    return step
+
+
+
+
+def extract_step(folder_path, in_process):
+    """
+    Pipeline step of process_json_files/process_records: writes the record of one file into the log.
+
+    :param folder_path: Work folder with the PECmd output.
+    :param in_process: True when the analyze step returned parsed records (no JSON files).
+    """
+    import async_pipeline
+
+    def read_records(json_file):
+        with metrics.timer("json_decode_seconds"):
+            records = list(json_stream.iter_records(json_file, SUMMARY_KEYS, SUMMARY_COUNT_KEYS))
+        metrics.count("json_bytes_read", os.path.getsize(json_file))
+        return records
+
+    async def step(item):
+        if in_process:
+            records = [item.result] if item.result else []
+        else:
+            try:
+                records = await async_pipeline.in_executor(None, read_records, json_output_path(folder_path, item.path))
+            except json.JSONDecodeError as e:
+                raise async_pipeline.StepError(e)
+
+        item.rows = [log_record(record) for record in records]
+        metrics.count("records_extracted", len(item.rows))
+        return item
+
+    return step
+
+
+
+
+def archive_step(archive, folder_path, files):
+    """
+    Pipeline step of archive_run_files: stores the Prefetch file and its output of one file in the run archive.
+    The manifest is written by the caller once all files passed (archive.write_manifest).
+
+    :param archive: run_archive.RunArchive.
+    :param folder_path: Work folder.
+    :param files: Dictionary filled with the manifest entries of the stored files.
+    """
+    import async_pipeline
+
+    def store(item):
+        entries = {}
+        stats = []
+        paths = [item.path] if item.result is not None else [item.path, json_output_path(folder_path, item.path)]
+        for path in paths:
+            digest, size, stored = archive.add_file(path)
+            entries[os.path.basename(path)] = {"digest": digest, "size": size, "mtime_ns": os.stat(path).st_mtime_ns}
+            stats.append((size, stored))
+        if item.result is not None:
+            digest, size, stored = archive.add_bytes(json.dumps(item.result).encode("utf-8"))
+            entries[os.path.basename(json_output_path(folder_path, item.path))] = {"digest": digest, "size": size, "mtime_ns": None}
+            stats.append((size, stored))
+        return entries, stats
+
+    async def step(item):
+        entries, stats = await async_pipeline.in_executor(None, store, item)
+        files.update(entries)
+        for size, stored in stats:
+            metrics.count("files_archived")
+            metrics.count("bytes_archived" if stored else "bytes_deduplicated", size)
+        return item
+
+    return step
+
+
+
+
+def move_step(folder_path, run_folder):
+    """
+    Pipeline step of move_specific_files: moves the JSON output of one file into the run folder (folder_path\\{counter}).
+    """
+    import async_pipeline
+
+    async def step(item):
+        json_file = json_output_path(folder_path, item.path)
+        if os.path.exists(json_file):
+            await async_pipeline.in_executor(None, shutil.move, json_file, run_folder)
+            metrics.count("files_moved")
+            log_queue.file_event(f"Moved: {json_file} -> {run_folder}", f"Moved: {os.path.basename(json_file)} -> {run_folder}")
+        return item
+
+    return step
+
+
+
+
+def run_pipelined(source_folder, folder_path, pfcopy_search, command_template, counter, backend="pecmd", store=None, archive=None,
+                  move_output=False, copy_workers=4, copy_method="copy", skip_unchanged=True, analyze_workers=1, analyze_timeout=None,
+                  cache_folder=None, queue_size=8, names=None):
+    """
+    Copy, analyze, extract and archive (or move) of options 8 and 9 as one streaming pipeline (see async_pipeline.py).
+    Every Prefetch file goes to the next stage as soon as it is ready instead of waiting for the whole folder.
+
+    :param source_folder: Folder where Prefetch files are located.
+    :param folder_path: Work folder.
+    :param pfcopy_search: (prefix, suffix) of the Prefetch files.
+    :param command_template: Command template of the "pecmd" backend.
+    :param counter: Run number.
+    :param backend: (Optional) "pecmd", "native" or "native-summary".
+    :param store: (Optional) run_store.RunStore, extracted rows are saved under run number counter.
+    :param archive: (Optional) run_archive.RunArchive, files are archived as run counter.
+    :param move_output: (Optional) Without archive move the JSON output into folder_path\\{counter} (option 9).
+    :param copy_workers: (Optional) Number of files copied at the same time.
+    :param copy_method: (Optional) "copy", "reflink" or "hardlink".
+    :param skip_unchanged: (Optional) Skip files already in the work folder.
+    :param analyze_workers: (Optional) Number of files analyzed at the same time.
+    :param analyze_timeout: (Optional) Seconds after which the command for one file is killed.
+    :param cache_folder: (Optional) Parse cache location.
+    :param queue_size: (Optional) Maximum number of files waiting in front of each stage.
+    :param names: (Optional) Exact Prefetch file names to process (see prefetch_hash.py).
+    :return: (finished, dropped) lists of async_pipeline.PipelineItem.
+    """
+    import analyze_pool
+    import async_pipeline  # asyncio is only loaded when the pipeline is used
+
+    prefix, suffix = pfcopy_search
+
+    if not os.path.exists(source_folder):
+        logging.error(f"Source folder not found: {source_folder}")
+        print(f"Error: Source folder not found: {source_folder}")
+        return [], []
+    os.makedirs(folder_path, exist_ok=True)
+
+    source_index = dir_index.get_index(source_folder)
+    items = [async_pipeline.PipelineItem(info.name, info.path) for info in source_index.files(prefix, suffix, names=names)]
+    metrics.count("files_scanned", len(source_index.entries))
+    metrics.count("files_matched", len(items))
+    if not items:
+        logging.warning("No matching Prefetch files found.")
+        print("No matching Prefetch files found.")
+        return [], []
+
+    analyze_backend = analyze_pool.get_backend(backend, command_template)
+    cache = parse_cache.ParseCache(cache_folder, analyze_backend.version_key()) if cache_folder else None
+    archived = {}
+
+    logging.warning(f"### RUN {counter} ###")
+    with analyze_pool.get_executor(analyze_backend, analyze_workers) as executor:
+        stages = [
+            async_pipeline.Stage("copy", copy_step(source_index, folder_path, copy_method, skip_unchanged), copy_workers),
+            async_pipeline.Stage("analyze", analyze_step(folder_path, analyze_backend, executor, analyze_timeout, cache), analyze_workers),
+            async_pipeline.Stage("extract", extract_step(folder_path, analyze_backend.in_process)),
+        ]
+        if archive:
+            stages.append(async_pipeline.Stage("archive", archive_step(archive, folder_path, archived)))
+        elif move_output:
+            run_folder = os.path.join(folder_path, str(counter))  # folder_path\\{counter}
+            os.makedirs(run_folder, exist_ok=True)
+            stages.append(async_pipeline.Stage("move", move_step(folder_path, run_folder)))
+
+        finished, dropped = async_pipeline.run_pipeline(items, stages, queue_size)
+
+    if cache:
+        cache.save()
+        cache.log_stats()
+    if archive:
+        archive.write_manifest(counter, archived)
+        print(f"Archived run {counter}: {len(archived)} files")
+
+    finished.sort(key=lambda item: item.name)
+    if store:
+        store.add_run(counter, [row for item in finished for row in item.rows])
+    for item in dropped:
+        print(f"Error: {item.name}: {item.error}")
+    print(f"Pipeline finished {len(finished)} files, {len(dropped)} failed.")
+    return finished, dropped
+
+
+
+
+
+def show_run_history(store):
+    """
+    Lets the user select two stored runs and displays the RunCount change per hash
+    and the files whose LastRun did not move.
+
+    :param store: run_store.RunStore with stored runs.
+    """
+    runs = store.runs()
+    if len(runs) < 2:
+        print("At least two stored runs are required for comparison.")
+        return
+
+    print(f"\nStored runs: {', '.join(str(run) for run in runs)}")
+    try:
+        run_a = int(input("\nEnter the first run: "))
+        run_b = int(input("Enter the second run: "))
+    except ValueError:
+        print("Invalid input. Please enter numbers.")
+        return
+
+    print(f"\nRun Count change RUN {run_a} -> RUN {run_b}:")
+    for executable, hash_value, count_a, count_b, delta in store.run_count_deltas(run_a, run_b):
+        print(f"{executable}-{hash_value} | {count_a} -> {count_b} | Delta: {delta}")
+
+    print(f"\nLast Run not moved RUN {run_a} -> RUN {run_b}:")
+    for executable, hash_value, last_run, count_a, count_b in store.unchanged_last_run(run_a, run_b):
+        print(f"{executable}-{hash_value} | Last Run: {last_run} | Run Count: {count_a} -> {count_b}")
+
+    logging.info(f"Displayed run history: {run_a} -> {run_b}")
+
 
 
 
@@ -466,6 +1266,11 @@ def get_menu():
                 3 - Analyze and extract
                 4 - View json files
                 5 - Compare JSON files (References)
+                6 - Run history (Run Count change / Last Run not moved)
+                7 - Compare all runs (References, from option 9 run archive or run folders)
+                T - Execution timeline (all runs, new run times, Run Count without new run times)
+                C - Corpus mode (Prefetch folders/zip files of many hosts)
+                S - Similar records (clusters with nearly the same Files Loaded, corpus or runs)
                 8 - SpeedTest (0->1->2->delete) WARN!!
                 9 - SpeedTest x 10 (with looping)
                 X - Exit
@@ -482,136 +1287,436 @@ def get_menu():
 
 
 
-def main():
+def default_config():
+    """
+    Script parameters. A JSON config file (--config) and command line options override them,
+    keys of the config file are the names below.
+    """
+    return {
+        #PARAMETERS
+        "folder": r"C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch",  # Change this to your destination folder (Work folder)
+        "cmd_template": r'"C:\\Users\\4n6mole\\Desktop\\Tools\\Get-ZimmermanTools\\net9\\PECmd.exe" -f "{}" --json C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch --jsonf C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch\\{}.json',  # Modify with your actual command
+        "parser_backend": "pecmd",  # "pecmd" - run cmd_template (PECmd.exe), "native" - parse in-process with prefetch_parser (no JSON files), "native-summary" - only fields written into the log (fastest)
+        "analyze_workers": 1,  # Number of files analyzed at the same time
+        "analyze_timeout": None,  # Seconds after which analysis of one file is stopped (None - no limit)
+        "cache_folder": None,  # Parse cache of unchanged .pf files, e.g. r"C:\\Users\\4n6mole\\Desktop\\Testing\\PrefetchCache" (None - disabled)
+        "copy_workers": 4,  # Number of Prefetch files copied at the same time
+        "copy_method": "copy",  # "copy" - kernel copy, "reflink" - copy-on-write clone, "hardlink" - only for read-only sources (mounted images)
+        "skip_unchanged": True,  # Do not copy files already in the work folder with the same size and mtime
+        "archive_folder": None,  # Option 9 stores every run's .pf and .json files here deduplicated, e.g. r"C:\\Users\\4n6mole\\Desktop\\Testing\\PrefetchArchive" (None - move into folder\\{counter})
+        "output_format": "json",  # "columnar" - analyze results of a run are stored in one compressed file (results.pfcol, see columnar.py) instead of one JSON file per Prefetch file (not used by the pipeline)
+        "pipeline": False,  # Options 8 and 9 stream every file through copy -> analyze -> extract -> archive/move as soon as it is ready (see async_pipeline.py, Python 3.11+)
+        "pipeline_queue_size": 8,  # Max files waiting in front of each pipeline stage
+        "results_db": None,  # Run history database, e.g. "PECmd_looper.db" next to the log (None - disabled)
+        "log_file": "PECmd_looper.log",
+        "log_mode": "direct",  # "direct" - every record is written when logged, "queue" - records are written in batches by a background thread (see log_queue.py)
+        "log_detail": "file",  # "file" - one log and terminal line per copied/analyzed/moved/deleted file, "stage" - one summary line per stage
+
+        #KEYWORDS TO COPY RELEVANT PF FILES
+        "source": r"C:\\Windows\\Prefetch",  # Change this to your source folder
+        "pf_copy_prefix": "CHROME.EXE-",  # Also used to identify files for processing with PECmd.exe and for analysis
+        "pf_copy_suffix": ".pf",
+        "analysis_file_suffix": ".json",
+        "target_paths": None,  # [executable path, ...] - copy and analyze only the Prefetch files of these paths (hash of the path, see prefetch_hash.py), pf_copy_prefix still applies (None - all files with the prefix)
+        "volume_map": None,  # {"C:": "\\DEVICE\\HARDDISKVOLUME2"} - device path of the volumes in target_paths (None - try HARDDISKVOLUME1-8)
+
+        #TEST SUBJECT PROGRAM
+        "program_path": r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",  # Change this path if needed
+        "program_name": "chrome.exe",  # Check in task manager
+        "test_programs": None,  # [[program path, Prefetch file prefix], ...] - all programs are started and closed at the same time in option 9 (None - program_path with pf_copy_prefix)
+        "counter": 4,  # ON WHAT LOOP IS SCRIPT - Can be adjusted to represent actual run count
+        "last_run": 5,  # Option 9 loops until this run number
+        "prefetch_wait": 30,  # Max seconds to wait for Prefetch write after start (fixed wait when watch_prefetch is False)
+        "prefetch_settle": 2,  # Seconds Prefetch files must stay unchanged to be considered written
+        "watch_prefetch": True,  # Wait for Prefetch write in source folder instead of fixed time
+
+        #CORPUS MODE (option C)
+        "corpus_folder": r"C:\\Users\\4n6mole\\Desktop\\Testing\\Collections",  # One folder or .zip file of Prefetch files per host
+        "corpus_output": r"C:\\Users\\4n6mole\\Desktop\\Testing\\CorpusResults",  # Per-host results and merged corpus.jsonl, finished hosts are skipped on restart
+        "corpus_workers": None,  # Worker processes (None - number of CPUs)
+        "similarity_threshold": 0.8,  # Option S: minimum share of common Files Loaded (estimated Jaccard similarity) of records in one cluster
+
+        #METRICS
+        "metrics_folder": None,  # Per run JSONL metrics (durations, counters, timings per stage) are written here, e.g. "metrics" (None - disabled)
+        "profile_stage": None,  # Stage to profile, e.g. "analyze" or "extract" (None - disabled)
+        "profile_mode": "cprofile",  # "cprofile" - function times (.prof file in metrics_folder), "tracemalloc" - top memory allocations
+    }
+
+
+
+
+# Subcommand -> menu option
+COMMANDS = {
+    "copy": "0",
+    "analyze": "1",
+    "extract": "2",
+    "analyze-extract": "3",
+    "view": "4",
+    "compare": "5",
+    "history": "6",
+    "diff": "7",
+    "timeline": "T",
+    "similar": "S",
+    "corpus": "C",
+    "speedtest": "8",
+    "loop": "9",
+    "delete": "delete",
+}
+
+
+
+
+def load_config(config_path=None, overrides=None):
+    """
+    Returns default_config() updated with the JSON config file and the overrides (None values are ignored).
 
-    PARAMETERS = ""
-    #PARAMETERS
-    folder = r"C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch"  # Change this to your destination folder (Work folder)
-    cmd_template = r'"C:\\Users\\4n6mole\\Desktop\\Tools\\Get-ZimmermanTools\\net9\\PECmd.exe" -f "{}" --json C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch --jsonf C:\\Users\\4n6mole\\Desktop\\Testing\\Prefetch\\{}.json'  # Modify with your actual command
-    
-    #KEYWORDS TO COPY RELEVANT PF FILES
-    
-    destination = folder 
-    source = r"C:\\Windows\\Prefetch"  # Change this to your source folder
+    :param config_path: (Optional) JSON file with parameters to change.
+    :param overrides: (Optional) Dictionary of parameters, e.g. from the command line.
+    """
+    config = default_config()
+    changes = {}
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as f:
+            changes.update(json.load(f))
+    changes.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    unknown = set(changes) - set(config)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    config.update(changes)
+    return config
+
+
+
+
+def configure_logging(log_file, mode="direct", detail="file"):
+    """
+    :param log_file: Log file.
+    :param mode: (Optional) "direct" - every record is written when logged, "queue" - records are written
+                 in batches by a background thread (see log_queue.py).
+    :param detail: (Optional) "file" - one line per file, "stage" - one summary line per stage.
+    """
+    log_queue.set_detail(detail)
+    if mode == "queue":
+        log_queue.start(log_file, log_queue.LOG_FORMAT)
+    elif mode == "direct":
+        logging.basicConfig(
+            filename=log_file,
+            level=logging.INFO,
+            format=log_queue.LOG_FORMAT
+        )
+    else:
+        raise ValueError(f"Unknown log mode: {mode}")
+
+
+
+
+def run_option(option, config, store=None, archive=None):
+    """
+    Runs one menu option (or subcommand) with the given parameters.
+
+    :param option: Menu option, e.g. "0" or "9".
+    :param config: Parameters from load_config.
+    :param store: (Optional) run_store.RunStore.
+    :param archive: (Optional) run_archive.RunArchive, option 9 opens archive_folder when not given.
+    :return: False for an unknown option.
+    """
+    folder = config["folder"]
+    cmd_template = config["cmd_template"]
+    parser_backend = config["parser_backend"]
+    analyze_workers = config["analyze_workers"]
+    analyze_timeout = config["analyze_timeout"]
+    cache_folder = config["cache_folder"]
+    copy_workers = config["copy_workers"]
+    copy_method = config["copy_method"]
+    skip_unchanged = config["skip_unchanged"]
+    archive_folder = config["archive_folder"]
+    pipeline = config["pipeline"]
+    columnar_output = config["output_format"] == "columnar"
+    pipeline_queue_size = config["pipeline_queue_size"]
+
+    destination = folder
+    source = config["source"]
     delete_files_in_folder_path = destination #Used for multiple testings to empty e.g. destination path
 
-    #KEYWORDS TO IDENTIFY RELEVANT FILES FOR PROCESSING WITH PRCmd.exe
-    pf_copy_prefix = "CHROME.EXE-"
-    pf_copy_suffix = ".pf"
+    pf_copy_prefix = config["pf_copy_prefix"]
+    pf_copy_suffix = config["pf_copy_suffix"]
     pfcopy_search = (pf_copy_prefix, pf_copy_suffix)
-
     process_search = (pf_copy_prefix, pf_copy_suffix)
-
-    #KEYWORDS TO IDENTIFY RELEVANT FILES FOR ANALYSIS
-    analysis_file_suffix = ".json"
-    analysis_search = (pf_copy_prefix, analysis_file_suffix)
-
-    #TEST SUBJECT PROGRAM
-    program_path = r"C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"  # Change this path if needed
-    program_name = "chrome.exe" #Check in task manager
-    counter = 4 #ON WHAT LOOP IS SCRIPT - Can be adjusted to represent actual run count
-
-
-    #MENU
-    menu_input = get_menu() # Call menu - Option 9 uses hidden delete option, it deletes content (.pf and .json files) of folder specified in variable delete_files_in_folder_path
-
-    while menu_input != "X":                   
-                       
-        if menu_input == "0":
-            logging.info("Fetching Prefetch files...")
-            copy_prefetch_files(source, destination, pfcopy_search)
-            logging.info("Copy operation completed...")
-
-        elif menu_input == "1":
-            logging.info("Analyzing Prefetch files...")
-            process_files(process_search, folder, cmd_template)
-            logging.info("Analysis completed...")
-
-        elif menu_input == "2": 
-            logging.info("Extracting data from json files...")
-            process_json_files(analysis_search, folder, counter=0)
-            logging.info("Extracting from JSON files completed...")
-
-        elif menu_input == "3":
-            logging.info("Analyzing Prefetch files...")
-            process_files(process_search, folder, cmd_template)
-            logging.info("Analysis completed...")
-            logging.info("Extracting data from json files...")
-            process_json_files(analysis_search, folder, counter=0)
-            logging.info("Extracting from JSON files completed...")
-
-        elif menu_input == "4":
-            logging.info("Extracting data from json files...")
+    analysis_search = (pf_copy_prefix, config["analysis_file_suffix"])
+
+    if config["target_paths"]:
+        import prefetch_hash  # Only needed when programs are selected by path
+
+        target_names = prefetch_hash.candidate_names(config["target_paths"], config["volume_map"])
+    else:
+        target_names = None
+
+    test_programs = config["test_programs"] or [(config["program_path"], pf_copy_prefix)]
+    prefetch_wait = config["prefetch_wait"]
+    prefetch_settle = config["prefetch_settle"]
+    watch_prefetch = config["watch_prefetch"]
+
+    corpus_folder = config["corpus_folder"]
+    corpus_output = config["corpus_output"]
+    corpus_workers = config["corpus_workers"]
+    similarity_threshold = config["similarity_threshold"]
+
+    metrics_folder = config["metrics_folder"]
+    profile_stage = config["profile_stage"]
+    profile_mode = config["profile_mode"]
+
+    metrics.start_run(metrics_folder, 0, profile_stage, profile_mode)
+
+    if option == "0":
+        with metrics.stage("copy", "Fetching Prefetch files"):
+            copy_prefetch_files(source, destination, *pfcopy_search, copy_workers, copy_method, skip_unchanged, names=target_names)
+
+    elif option == "1":
+        with metrics.stage("analyze", "Analyzing Prefetch files"):
+            records = process_files(process_search, folder, cmd_template, parser_backend, analyze_workers, analyze_timeout, cache_folder, target_names)
+            if columnar_output:
+                write_run_container(folder, analysis_search, records)
+
+    elif option == "2": 
+        with metrics.stage("extract", "Extracting data from json files"):
+            process_json_files(analysis_search, folder, 0, store)
+
+    elif option == "3":
+        with metrics.stage("analyze", "Analyzing Prefetch files"):
+            records = process_files(process_search, folder, cmd_template, parser_backend, analyze_workers, analyze_timeout, cache_folder, target_names)
+            if columnar_output:
+                write_run_container(folder, analysis_search, records)
+        with metrics.stage("extract", "Extracting data from json files"):
+            if parser_backend != "pecmd":
+                process_records(records, 0, store)
+            else:
+                process_json_files(analysis_search, folder, 0, store)
+
+    elif option == "4":
+        with metrics.stage("view", "Extracting data from json files"):
             view_json_files(analysis_search, folder)
-            logging.info("Extraction completed...")
-        
-        elif menu_input == "5":
-            logging.info("Compare JSON files (Directories and Files Loaded)...")
+
+    elif option == "5":
+        with metrics.stage("compare", "Compare JSON files (Directories and Files Loaded)"):
             compare_json_files(analysis_search, folder)
-            logging.info("Comparison completed...")
 
-        elif menu_input == "delete":
-            logging.info("Delete Prefetch files and json output files...")
+    elif option == "6":
+        if store:
+            show_run_history(store)
+        else:
+            print("Run history database is disabled (results_db).")
+
+    elif option == "7":
+        with metrics.stage("diff", "Compare all run folders (Directories and Files Loaded)"):
+            diff_all_runs(analysis_search, folder, archive_folder=archive_folder)
+
+    elif option == "T":
+        with metrics.stage("timeline", "Build execution timeline of all runs"):
+            show_timeline(analysis_search, folder, archive_folder)
+
+    elif option == "S":
+        with metrics.stage("similar", "Cluster records with nearly the same Files Loaded"):
+            show_similar_records(analysis_search, folder, corpus_output, similarity_threshold)
+
+    elif option == "C":
+        import corpus  # Process pool and zip support are only needed for this option
+
+        with metrics.stage("corpus", "Process multi-host corpus"):
+            corpus.run_corpus(corpus_folder, corpus_output, corpus_workers, parser_backend == "native-summary")
+            merged_path, count = corpus.merge_results(corpus_output)
+            print(f"{count} records merged into {merged_path}")
+
+    elif option == "delete":
+        with metrics.stage("delete", "Delete Prefetch files and json output files"):
+            delete_all_files(delete_files_in_folder_path)
+
+    elif option == "8" and pipeline:
+
+        with metrics.stage("pipeline", "Copy, analyze and extract as one pipeline"):
+            run_pipelined(source, destination, pfcopy_search, cmd_template, 0, parser_backend, store, None, False,
+                          copy_workers, copy_method, skip_unchanged, analyze_workers, analyze_timeout, cache_folder, pipeline_queue_size,
+                          target_names)
+
+        with metrics.stage("delete", "Delete Prefetch files and json output files"):
             delete_all_files(delete_files_in_folder_path)
-            logging.info("Deletion completed...")
 
-        elif menu_input == "8":
+    elif option == "8":
 
-            logging.info("Fetching Prefetch files...")
-            copy_prefetch_files(source, destination, pfcopy_search)
-            logging.info("Copy operation completed...")
+        with metrics.stage("copy", "Fetching Prefetch files"):
+            copy_prefetch_files(source, destination, *pfcopy_search, copy_workers, copy_method, skip_unchanged, names=target_names)
 
-            logging.info("Analyzing Prefetch files...")
-            process_files(process_search, folder, cmd_template)
-            logging.info("Analysis completed...")
+        with metrics.stage("analyze", "Analyzing Prefetch files"):
+            records = process_files(process_search, folder, cmd_template, parser_backend, analyze_workers, analyze_timeout, cache_folder, target_names)
+            if columnar_output:
+                write_run_container(folder, analysis_search, records)
 
-            logging.info("Extracting data from json files...")
-            process_json_files(analysis_search, folder, counter=0)
-            logging.info("Extracting from JSON files completed...")
+        with metrics.stage("extract", "Extracting data from json files"):
+            if parser_backend != "pecmd":
+                process_records(records, 0, store)
+            else:
+                process_json_files(analysis_search, folder, 0, store)
 
-            logging.info("Compare JSON files (Directories and Files Loaded)...")
+        with metrics.stage("delete", "Delete Prefetch files and json output files"):
             delete_all_files(delete_files_in_folder_path)
-            logging.info("Deletion completed...")
-
-        elif menu_input == "9":
-            #10 LOOP  
-            while counter <= 5: 
-                logging.warning(f"### RUN {counter} ###")
-
-                logging.info("Start/Close program...")
-                start_and_close_program(program_path,program_name)
-                logging.info("Start/Close completed...")
-
-                logging.info("Fetching Prefetch files...")
-                copy_prefetch_files(source, destination, pfcopy_search)
-                logging.info("Copy operation completed...")
-
-                logging.info("Analyzing Prefetch files...")
-                process_files(process_search, folder, cmd_template)
-                logging.info("Analysis completed...")
-
-                logging.info("Extracting data from json files...")
-                process_json_files(analysis_search, folder,counter)
-                logging.info("Extracting from JSON files completed...")
-                
-                logging.info("Move Prefetch files...")
-                move_specific_files(analysis_search, destination, counter)
-                logging.info("Move completed...")
-
-                logging.info("Compare JSON files (Directories and Files Loaded)...")
+
+    elif option == "9":
+        if archive is None and archive_folder:
+            archive = run_archive.RunArchive(archive_folder)  # Created here, other options only read existing archives
+        prefetch_waits = []
+        #10 LOOP
+        counter = config["counter"]
+        while counter <= config["last_run"]:
+            metrics.start_run(metrics_folder, counter, profile_stage, profile_mode)
+            logging.warning(f"### RUN {counter} ###")
+
+            with metrics.stage("start_close", "Start/Close program"):
+                programs = [
+                    (test_program, (source, test_prefix, pf_copy_suffix) if watch_prefetch else None)
+                    for test_program, test_prefix in test_programs
+                ]
+                program_results = start_and_close_programs(programs, prefetch_wait, prefetch_settle)
+                prefetch_waits.append(max(result["wait"] for result in program_results))
+                metrics.observe("prefetch_wait_seconds", prefetch_waits[-1])
+
+            if pipeline:
+                with metrics.stage("pipeline", "Copy, analyze, extract and archive/move as one pipeline"):
+                    run_pipelined(source, destination, pfcopy_search, cmd_template, counter, parser_backend, store, archive, True,
+                                  copy_workers, copy_method, skip_unchanged, analyze_workers, analyze_timeout, cache_folder, pipeline_queue_size,
+                                  target_names)
+            else:
+                with metrics.stage("copy", "Fetching Prefetch files"):
+                    copy_prefetch_files(source, destination, *pfcopy_search, copy_workers, copy_method, skip_unchanged, names=target_names)
+
+                with metrics.stage("analyze", "Analyzing Prefetch files"):
+                    records = process_files(process_search, folder, cmd_template, parser_backend, analyze_workers, analyze_timeout, cache_folder, target_names)
+                    if columnar_output:
+                        write_run_container(folder, analysis_search, records)
+
+                with metrics.stage("extract", "Extracting data from json files"):
+                    if parser_backend != "pecmd":
+                        process_records(records, counter, store)
+                    else:
+                        process_json_files(analysis_search, folder, counter, store)
+
+                if archive:
+                    with metrics.stage("archive", "Archive Prefetch files and output"):
+                        archive_run_files(archive, destination, counter, records if parser_backend != "pecmd" and not columnar_output else None)
+                else:
+                    with metrics.stage("move", "Move Prefetch files"):
+                        move_specific_files(analysis_search, destination, counter)
+
+            with metrics.stage("delete", "Delete Prefetch files and json output files"):
                 delete_all_files(delete_files_in_folder_path)
-                logging.info("Deletion completed...")
-                time.sleep(10)
 
-                counter=counter+1
+            # Let Prefetch writes after program close finish before next run
+            with metrics.stage("settle", "Wait for Prefetch writes after close"):
+                if watch_prefetch:
+                    prefetch_watch.wait_for_prefetch(source, pf_copy_prefix, pf_copy_suffix, max_wait=10, settle=prefetch_settle, require_change=False)
+                else:
+                    time.sleep(10)
+
+            counter=counter+1
+            config["counter"] = counter  # Next option 9 in the same session continues here
+
+        if prefetch_waits:
+            logging.info(f"Prefetch waits per run (seconds): {', '.join(f'{waited:.1f}' for waited in prefetch_waits)}")
+
+    else:
+        print("Invalid option...")
+        metrics.end_run()
+        return False
+
+    metrics.end_run()
+    return True
+
+
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Prefetch testing loop. Without a command the interactive menu is shown.",
+    )
+    parser.add_argument("--config", help="JSON file with parameters (names as in default_config)")
+    parser.add_argument("--folder", help="Work folder")
+    parser.add_argument("--source", help="Prefetch source folder")
+    parser.add_argument("--prefix", dest="pf_copy_prefix", help="Prefetch file prefix, e.g. CHROME.EXE-")
+    parser.add_argument("--target-path", dest="target_paths", action="append", help="Executable path whose Prefetch files are selected exactly (repeatable)")
+    parser.add_argument("--backend", dest="parser_backend", choices=("pecmd", "native", "native-summary"), help="Analyze backend")
+    parser.add_argument("--cmd-template", dest="cmd_template", help="Command run per file by the pecmd backend")
+    parser.add_argument("--workers", dest="analyze_workers", type=int, help="Files analyzed at the same time")
+    parser.add_argument("--copy-workers", dest="copy_workers", type=int, help="Files copied at the same time")
+    parser.add_argument("--pipeline", dest="pipeline", action="store_true", default=None, help="Options 8/9 as streaming pipeline")
+    parser.add_argument("--log-file", dest="log_file", help="Log file")
+    parser.add_argument("--log-detail", dest="log_detail", choices=log_queue.DETAILS, help="One log line per file or per stage")
+    parser.add_argument("--metrics-folder", dest="metrics_folder", help="Metrics folder")
+
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    for name, help_text in (
+        ("copy", "0 - Copy Prefetch files"),
+        ("analyze", "1 - Only analyze"),
+        ("extract", "2 - Only extract from json"),
+        ("analyze-extract", "3 - Analyze and extract"),
+        ("view", "4 - View json files (interactive)"),
+        ("compare", "5 - Compare JSON files (interactive)"),
+        ("history", "6 - Run history (interactive)"),
+        ("diff", "7 - Compare all runs"),
+        ("timeline", "T - Execution timeline"),
+        ("delete", "Delete all files in the work folder"),
+        ("speedtest", "8 - Copy, analyze, extract, delete"),
+    ):
+        commands.add_parser(name, help=help_text)
+
+    loop = commands.add_parser("loop", help="9 - Start/close programs and run copy, analyze, extract, archive/move, delete per run")
+    loop.add_argument("--start", dest="counter", type=int, help="First run number")
+    loop.add_argument("--end", dest="last_run", type=int, help="Last run number")
+
+    similar = commands.add_parser("similar", help="S - Clusters of records with nearly the same Files Loaded")
+    similar.add_argument("--threshold", dest="similarity_threshold", type=float, help="Minimum estimated Jaccard similarity")
+
+    corpus_parser = commands.add_parser("corpus", help="C - Corpus mode (Prefetch folders/zip files of many hosts)")
+    corpus_parser.add_argument("--corpus-folder", dest="corpus_folder", help="One folder or zip file per host")
+    corpus_parser.add_argument("--corpus-output", dest="corpus_output", help="Output folder")
+    corpus_parser.add_argument("--corpus-workers", dest="corpus_workers", type=int, help="Worker processes")
+    return parser
+
+
+
+
+def main(argv=None):
+    """
+    Runs one subcommand non-interactively, or the interactive menu when no command is given.
+    Returns the process exit code.
+
+    :param argv: (Optional) Command line arguments, sys.argv[1:] by default.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    overrides = {key: value for key, value in vars(args).items() if key not in ("config", "command")}
+    try:
+        config = load_config(args.config, overrides)
+        configure_logging(config["log_file"], config["log_mode"], config["log_detail"])
+    except (OSError, ValueError) as e:
+        parser.error(f"Invalid config: {e}")
 
-        else:
-            print("Invalid option...")
-        
-        menu_input = get_menu()
+    store = run_store.RunStore(config["results_db"]) if config["results_db"] else None
 
-    print("Hope you had fun...")
+    try:
+        if args.command:
+            return 0 if run_option(COMMANDS[args.command], config, store) else 2
+
+        #MENU
+        menu_input = get_menu() # Call menu - Option 9 uses hidden delete option, it deletes content (.pf and .json files) of folder specified in variable delete_files_in_folder_path
+        while menu_input != "X":
+            run_option(menu_input, config, store)
+            menu_input = get_menu()
+        print("Hope you had fun...")
+        return 0
+    finally:
+        if store:
+            store.close()
+        log_queue.stop()  # Queued records are written before the exit code is returned
 
 if __name__ == "__main__":
 
-    main()
+    sys.exit(main())
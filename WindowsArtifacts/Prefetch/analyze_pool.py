@@ -0,0 +1,192 @@
+# Bounded worker pool for the analyze stage of PECmd_looper.py.
+#
+# Backends:
+#   CommandBackend - runs a command template per file (PECmd.exe or the local stand-in pecmd_standin.py)
+#   NativeBackend  - parses files in-process with prefetch_parser (no process spawn),
+#                    optionally only the summary fields (lazily decoded, see PrefetchRecord)
+#
+# Command backends run in a thread pool (every worker waits on its own subprocess),
+# in-process backends run in a process pool so parsing uses all cores.
+
+import os
+import time
+import shlex
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import log_queue
+import metrics
+import prefetch_parser
+
+
+
+
+def _kill_tree(process):
+    """
+    Kills the shell of a command together with everything it started (PECmd.exe),
+    killing only the shell would leave PECmd writing into the work folder.
+    """
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)  # Own session, see CommandBackend
+        except ProcessLookupError:
+            pass
+    else:
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    process.kill()
+    process.wait()
+
+
+
+
+class CommandBackend:
+    """
+    Executes a command template for every file, e.g. PECmd.exe writing {filename}.json.
+    '{}' placeholders are replaced by the file path and the file name without extension.
+    """
+    in_process = False
+    metric = "subprocess_seconds"
+
+    def __init__(self, command_template):
+        self.command_template = command_template
+
+    def __call__(self, file_path, timeout=None):
+        filename = os.path.splitext(os.path.basename(file_path))[0]
+
+        command = self.command_template.format(file_path, filename)
+        log_queue.file_event(f"Executing: {command}")
+
+        # Started in its own session, the whole process tree is killed when the timeout expires
+        process = subprocess.Popen(command, shell=True, start_new_session=os.name == "posix")
+        try:
+            returncode = process.wait(timeout=timeout)
+        except BaseException:  # Timeout or Ctrl+C
+            _kill_tree(process)
+            raise
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command)
+        return None
+
+    def version_key(self):
+        """
+        Identifies the command output for caching: the template plus size and mtime of the executable.
+        """
+        try:
+            executable = shlex.split(self.command_template, posix=False)[0].strip('"')
+            stat = os.stat(executable)
+            return f"command|{self.command_template}|{stat.st_size}|{stat.st_mtime_ns}"
+        except (IndexError, ValueError, OSError):
+            return f"command|{self.command_template}"
+
+
+
+
+class NativeBackend:
+    """
+    Parses files in-process with prefetch_parser and returns the parsed records.
+    Timeout is not enforced, parsing time is bounded by the file size.
+    """
+    in_process = True
+    metric = "parse_seconds"
+
+    def __init__(self, summary=False):
+        """
+        :param summary: (Optional) Only read header fields and Directories/FilesLoaded counts (prefetch_parser.summarize_prefetch).
+        """
+        self.summary = summary
+
+    def __call__(self, file_path, timeout=None):
+        if self.summary:
+            return prefetch_parser.summarize_prefetch(file_path)
+        return prefetch_parser.parse_prefetch(file_path)
+
+    def version_key(self):
+        return f"native|{prefetch_parser.PARSER_VERSION}" + ("|summary" if self.summary else "")
+
+
+
+
+def get_backend(name, command_template=""):
+    """
+    Returns the analyze backend for the given name.
+
+    :param name: "pecmd" (command template, PECmd.exe or stand-in script), "native" or
+                 "native-summary" (only fields written into the log, no Directories/FilesLoaded lists).
+    :param command_template: Command template used by the "pecmd" backend.
+    """
+    if name == "native":
+        return NativeBackend()
+    if name == "native-summary":
+        return NativeBackend(summary=True)
+    if name == "pecmd":
+        return CommandBackend(command_template)
+    raise ValueError(f"Unknown analyze backend: {name}")
+
+
+
+
+def run_one(backend, file_path, timeout):
+    """
+    Runs the backend for one file and returns (result, error, seconds) so that a failing file
+    never stops the other workers, any error is returned (and logged by the caller).
+    Seconds are measured here because process pool workers cannot record metrics of the parent.
+    """
+    start = time.perf_counter()
+    try:
+        return backend(file_path, timeout), None, time.perf_counter() - start
+    except subprocess.TimeoutExpired as e:
+        return None, f"Timed out after {e.timeout} seconds", time.perf_counter() - start
+    except (subprocess.CalledProcessError, prefetch_parser.PrefetchParseError, OSError) as e:
+        return None, str(e), time.perf_counter() - start
+    except Exception as e:  # e.g. struct.error of a truncated file, the file fails, not the batch
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+
+
+def record_result(file_path, result, error, seconds, backend):
+    """
+    Records the per-file metrics in the calling process and drops the duration from the result tuple.
+    """
+    metrics.observe(getattr(backend, "metric", "analyze_seconds"), seconds)
+    metrics.count("analyze_errors" if error else "files_analyzed")
+    return file_path, result, error
+
+
+
+
+def get_executor(backend, workers=1, mode=None):
+    """
+    Returns the executor suited to the backend: a process pool for in-process backends, threads otherwise.
+
+    :param backend: Analyze backend.
+    :param workers: (Optional) Number of workers.
+    :param mode: (Optional) "thread" or "process" to override the choice.
+    """
+    if mode is None:
+        mode = "process" if getattr(backend, "in_process", False) else "thread"
+    executor_class = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+    return executor_class(max_workers=max(1, workers))
+
+
+
+
+def analyze_files(file_paths, backend, workers=1, mode=None, timeout=None):
+    """
+    Runs the backend over all files with a bounded number of workers.
+    Results keep the order of file_paths.
+
+    :param file_paths: Files to analyze.
+    :param backend: CommandBackend, NativeBackend or any picklable callable(file_path, timeout).
+    :param workers: (Optional) Number of concurrent workers, 1 runs files one by one.
+    :param mode: (Optional) "thread" or "process", by default "process" for in-process backends.
+    :param timeout: (Optional) Timeout in seconds per file.
+    :return: List of (file_path, result, error) tuples, error is None on success.
+    """
+    if workers <= 1 or len(file_paths) <= 1:
+        return [record_result(file_path, *run_one(backend, file_path, timeout), backend) for file_path in file_paths]
+
+    with get_executor(backend, workers, mode) as executor:
+        futures = [executor.submit(run_one, backend, file_path, timeout) for file_path in file_paths]
+        return [record_result(file_path, *future.result(), backend) for file_path, future in zip(file_paths, futures)]
@@ -0,0 +1,176 @@
+# Streaming pipeline for options 8 and 9 of PECmd_looper.py (requires Python 3.11+).
+#
+# Instead of copying the whole folder, then analyzing the whole folder and so on, every file
+# moves to the next stage as soon as it is ready:
+#
+#   feed -> [queue] -> copy (n workers) -> [queue] -> analyze (n workers) -> [queue] -> extract -> ...
+#
+# Queues are bounded, a slow stage makes the stages before it wait (backpressure) instead of
+# piling up files in memory. A run takes about as long as its slowest stage instead of the
+# sum of all stages.
+#
+# Steps are async functions taking and returning a PipelineItem. Blocking work (file copies,
+# PECmd, parsing) runs in an executor via in_executor(). A step reports a failure of its file
+# by raising StepError (or OSError), the file is dropped and logged, all other files continue.
+# Any other exception, KeyboardInterrupt or cancellation stops all stages (asyncio.TaskGroup)
+# and is raised to the caller.
+
+import time
+import asyncio
+import logging
+
+import metrics
+
+_DONE = object()  # End of input marker, one per worker of the receiving stage
+
+
+
+
+class StepError(Exception):
+    """
+    Raised by a step when its file cannot be processed, only this file is dropped.
+    """
+    pass
+
+
+
+
+class PipelineItem:
+    """
+    One file travelling through the pipeline. Steps fill in the fields they produce.
+    """
+    __slots__ = ("name", "source_path", "path", "result", "rows", "error", "seconds")
+
+    def __init__(self, name, source_path=None):
+        self.name = name
+        self.source_path = source_path
+        self.path = None       # File in the work folder
+        self.result = None     # Parsed record (in-process backends) or None (PECmd wrote JSON)
+        self.rows = []         # Extracted rows for run_store.RunStore
+        self.error = None      # "stage: message" of the dropped file
+        self.seconds = {}      # Stage name -> seconds spent on this file
+
+
+
+
+class Stage:
+    """
+    Step function with the number of files it processes at the same time.
+    """
+
+    def __init__(self, name, step, workers=1):
+        """
+        :param name: Stage name used in metrics ("{name}_file_seconds") and log messages.
+        :param step: async function(item) returning the item for the next stage, or None to drop it.
+        :param workers: (Optional) Number of concurrent step calls.
+        """
+        self.name = name
+        self.step = step
+        self.workers = max(1, workers)
+
+
+
+
+async def in_executor(executor, function, *args):
+    """
+    Runs a blocking function in the executor (None - default thread pool) and returns its result.
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+
+
+async def _feed(items, outbox, workers):
+    for item in items:
+        await outbox.put(item)
+    for _ in range(workers):
+        await outbox.put(_DONE)
+
+
+
+
+async def _worker(stage, inbox, outbox, dropped):
+    while True:
+        item = await inbox.get()
+        if item is _DONE:
+            return
+
+        start = time.perf_counter()
+        try:
+            item = await stage.step(item)
+        except (StepError, OSError) as e:
+            item.error = f"{stage.name}: {e}"
+            dropped.append(item)
+            metrics.count("pipeline_dropped")
+            logging.error(f"Pipeline {stage.name} failed for {item.name}: {e}")
+            continue
+        finally:
+            metrics.observe(f"{stage.name}_file_seconds", time.perf_counter() - start)
+
+        if item is not None:
+            item.seconds[stage.name] = time.perf_counter() - start
+            await outbox.put(item)
+
+
+
+
+async def _run_stage(stage, inbox, outbox, next_workers, dropped):
+    """
+    Runs all workers of one stage, then tells every worker of the next stage that input ended.
+    """
+    async with asyncio.TaskGroup() as group:
+        for _ in range(stage.workers):
+            group.create_task(_worker(stage, inbox, outbox, dropped))
+    for _ in range(next_workers):
+        await outbox.put(_DONE)
+
+
+
+
+async def _collect(inbox, finished):
+    while True:
+        item = await inbox.get()
+        if item is _DONE:
+            return
+        finished.append(item)
+
+
+
+
+async def run_pipeline_async(items, stages, queue_size=8):
+    """
+    Passes every item through all stages, items flow independently of each other.
+
+    :param items: Iterable of PipelineItem.
+    :param stages: List of Stage in processing order.
+    :param queue_size: (Optional) Maximum number of items waiting in front of each stage.
+    :return: (finished, dropped) lists of PipelineItem, finished in completion order.
+    """
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    finished = []
+    dropped = []
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(_feed(items, queues[0], stages[0].workers if stages else 1))
+        for index, stage in enumerate(stages):
+            next_workers = stages[index + 1].workers if index + 1 < len(stages) else 1
+            group.create_task(_run_stage(stage, queues[index], queues[index + 1], next_workers, dropped))
+        group.create_task(_collect(queues[-1], finished))
+
+    return finished, dropped
+
+
+
+
+def run_pipeline(items, stages, queue_size=8):
+    """
+    Synchronous entry point of run_pipeline_async, for callers outside an event loop.
+    A failing stage raises an ExceptionGroup with the error of every failed task.
+    """
+    start = time.perf_counter()
+    finished, dropped = asyncio.run(run_pipeline_async(items, stages, queue_size))
+    logging.info(
+        f"Pipeline {' -> '.join(stage.name for stage in stages)}: {len(finished)} files finished, "
+        f"{len(dropped)} dropped in {time.perf_counter() - start:.2f} seconds"
+    )
+    return finished, dropped
@@ -0,0 +1,262 @@
+# Benchmark of the PECmd_looper.py stages on a synthetic Prefetch corpus (see synthetic_corpus.py).
+#
+# Every stage function of PECmd_looper.py is run on its own: copy, analyze, extract, compare,
+# move and delete. Per stage the wall time, throughput, p50/p95 latency of the per-file
+# operation and the peak traced memory are written as JSON, together with the corpus
+# parameters and git commit, so results of different commits can be compared.
+# tracemalloc slows allocation heavy code a lot, peak memory is measured in an extra pass
+# that is not timed.
+#
+# Example:
+#   python bench_prefetch.py --files 500 --files-loaded 200 --runs 10 --output bench.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+import metrics
+import synthetic_corpus
+
+STAGES = ("copy", "analyze", "extract", "compare", "move", "delete")
+
+
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile, None for no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+
+
+@contextlib.contextmanager
+def timed_calls(owner, name, latencies, generator=False):
+    """
+    Replaces owner.name with a wrapper recording the duration of every call in latencies.
+    With generator=True the time until the returned generator is exhausted is recorded.
+    """
+    original = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    def generator_wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            yield from original(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    setattr(owner, name, generator_wrapper if generator else wrapper)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
+
+
+def run_stage(name, function, unit_calls, trace_memory):
+    """
+    Runs one stage and returns its measurements.
+
+    :param name: Stage name.
+    :param function: Stage callable without arguments.
+    :param unit_calls: List of (owner, attribute, generator) timed as the per-file operation
+                       or the name of the metrics.py histogram recorded by the stage itself.
+    :param trace_memory: Measure peak memory with tracemalloc.
+    """
+    latencies = []
+    recorder = metrics.start_run()
+    with contextlib.ExitStack() as stack:
+        if isinstance(unit_calls, str):
+            latencies = recorder.histograms[unit_calls]
+        else:
+            for owner, attribute, generator in unit_calls:
+                stack.enter_context(timed_calls(owner, attribute, latencies, generator))
+        devnull = stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(devnull))  # Stages print every file
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            function()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+
+    return {
+        "stage": name,
+        "seconds": seconds,
+        "units": len(latencies),
+        "units_per_second": len(latencies) / seconds if seconds else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+
+def run_benchmark(base_folder, history, backend="native", workers=1, compress=True, trace_memory=True):
+    """
+    Runs all stages once on a fresh copy of the corpus.
+
+    :param base_folder: Empty scratch folder.
+    :param history: Output of synthetic_corpus.generate_states(), the last run is the current state.
+    :param backend: Analyze backend, "native", "native-summary" or "pecmd" (runs pecmd_standin.py).
+    :param workers: Analyze workers.
+    :param compress: MAM compress the generated Prefetch files.
+    :param trace_memory: Measure peak memory per stage, slows the stages down.
+    :return: List of stage measurements.
+    """
+    import PECmd_looper
+    import json_stream
+    import snapshot_diff
+
+    source = os.path.join(base_folder, "source")
+    work = os.path.join(base_folder, "work")
+    runs_folder = os.path.join(base_folder, "runs")
+
+    synthetic_corpus.write_prefetch_files(source, history[-1], compress=compress)
+    for run, state in enumerate(history, 1):
+        synthetic_corpus.write_json_outputs(os.path.join(runs_folder, str(run)), state)
+
+    standin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pecmd_standin.py")
+    command_template = f'"{sys.executable}" "{standin}" -f "{{}}" --json "{work}"'
+
+    records = []
+    stages = [
+        ("copy", lambda: PECmd_looper.copy_prefetch_files(source, work, "", ".pf"),
+         "copy_file_seconds"),  # bulk_copy times every file, also in its worker threads
+        ("analyze", lambda: records.extend(
+            PECmd_looper.process_files(("", ".pf"), work, command_template, backend, workers) or ()),
+         "parse_seconds" if backend != "pecmd" else "subprocess_seconds"),  # Works with process pool workers
+        ("extract", lambda: PECmd_looper.process_json_files(("", ".json"), work, 1),
+         [(json_stream, "iter_records", True)]),
+        ("compare", lambda: snapshot_diff.diff_run_folders(runs_folder, ("", ".json")),
+         [(snapshot_diff, "load_snapshot", False)]),
+        ("move", lambda: PECmd_looper.move_specific_files(("", ".json"), work, 1),
+         [(shutil, "move", False)]),
+        ("delete", lambda: PECmd_looper.delete_all_files(work),
+         [(os, "remove", False)]),
+    ]
+
+    results = []
+    for name, function, unit_calls in stages:
+        if name == "extract" and backend != "pecmd":
+            # Native analyze returns records, extract reads PECmd JSON output as in the pecmd flow
+            synthetic_corpus.write_json_outputs(work, history[-1])
+        results.append(run_stage(name, function, unit_calls, trace_memory))
+    return results
+
+
+
+
+def summarize(repeats, memory=None):
+    """
+    Median seconds per stage over all repeats with the latencies of the median repeat.
+
+    :param repeats: Stage measurements of every timed repeat.
+    :param memory: (Optional) Stage measurements of the memory pass.
+    """
+    summary = []
+    for index, name in enumerate(STAGES):
+        samples = sorted((repeat[index] for repeat in repeats), key=lambda result: result["seconds"])
+        median = dict(samples[len(samples) // 2])
+        median["repeats"] = [sample["seconds"] for sample in samples]
+        median["peak_memory_bytes"] = memory[index]["peak_memory_bytes"] if memory else None
+        summary.append(median)
+    return summary
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PECmd_looper.py stages on a synthetic Prefetch corpus")
+    parser.add_argument("--files", type=int, default=200, help="Prefetch files per run")
+    parser.add_argument("--files-loaded", type=int, default=150, help="FilesLoaded entries per file")
+    parser.add_argument("--directories", type=int, default=30, help="Directories entries per file")
+    parser.add_argument("--runs", type=int, default=5, help="Run snapshots for the compare stage")
+    parser.add_argument("--churn", type=float, default=0.1, help="Fraction of files and entries changed between runs")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    parser.add_argument("--backend", choices=("native", "native-summary", "pecmd"), default="native", help="Analyze backend, pecmd runs pecmd_standin.py")
+    parser.add_argument("--workers", type=int, default=1, help="Analyze workers")
+    parser.add_argument("--uncompressed", action="store_true", help="Write uncompressed Prefetch files (Windows 8 style)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass, no peak memory")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the whole benchmark, median is reported")
+    parser.add_argument("--output", help="JSON result file, default stdout")
+    args = parser.parse_args()
+
+    history = synthetic_corpus.generate_states(args.files, args.files_loaded, args.directories, args.runs, args.churn, args.seed)
+
+    repeats = []
+    with tempfile.TemporaryDirectory(prefix="bench_prefetch_") as scratch:
+        # PECmd_looper logs at INFO like a real run, but into the scratch folder
+        logging.basicConfig(filename=os.path.join(scratch, "PECmd_looper.log"), level=logging.INFO,
+                            format="%(asctime)s - %(levelname)s - %(message)s")
+        passes = [False] * args.repeat + ([] if args.no_memory else [True])
+        for repeat, trace_memory in enumerate(passes):
+            base_folder = os.path.join(scratch, str(repeat))
+            os.makedirs(base_folder)
+            repeats.append(run_benchmark(base_folder, history, args.backend, args.workers,
+                                         not args.uncompressed, trace_memory))
+            shutil.rmtree(base_folder)
+        logging.shutdown()
+
+    memory = None if args.no_memory else repeats.pop()
+
+    result = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "stages": summarize(repeats, memory),
+    }
+
+    text = json.dumps(result, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+
+
+if __name__ == "__main__":
+
+    main()
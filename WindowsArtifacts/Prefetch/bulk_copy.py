@@ -0,0 +1,193 @@
+# Bulk copy for the copy stage of PECmd_looper.py.
+#
+# Files whose copy in the destination has the same size and mtime (optionally the same
+# SHA-256 digest) are skipped. Changed files are copied by a small thread pool using the
+# cheapest primitive the platform offers:
+#   "copy"     - os.copy_file_range, then os.sendfile, then a buffered copy (Windows)
+#   "reflink"  - copy-on-write clone (Linux FICLONE, e.g. Btrfs/XFS), falls back to "copy"
+#   "hardlink" - os.link, falls back to "copy". Only for sources that are never rewritten
+#                in place (mounted images), a live Prefetch file would change the link too.
+# mtime is always copied to the destination, so the next run can skip the file by stat only.
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+import dir_index
+import metrics
+import parse_cache
+
+COPY_METHODS = ("copy", "reflink", "hardlink")
+FICLONE = 0x40049409  # Linux ioctl, clones the whole file
+
+
+
+
+def is_unchanged(source_info, destination_info, verify_digest=False):
+    """
+    True when the destination already holds the same file.
+
+    :param source_info: dir_index.FileInfo of the source.
+    :param destination_info: dir_index.FileInfo of the destination or None.
+    :param verify_digest: (Optional) Compare SHA-256 digests when sizes match, even if mtime differs.
+    """
+    if destination_info is None or destination_info.size != source_info.size:
+        return False
+    if source_info.inode and source_info.inode == destination_info.inode:
+        try:
+            if os.path.samestat(os.stat(source_info.path), os.stat(destination_info.path)):
+                return True  # Hard link to the same file (same device and inode)
+        except OSError:
+            return False
+    if verify_digest:
+        return parse_cache.file_digest(source_info.path) == parse_cache.file_digest(destination_info.path)
+    return destination_info.mtime_ns == source_info.mtime_ns
+
+
+
+
+def _kernel_copy(source_path, destination_path):
+    """
+    Copies file content in the kernel where possible, no data passes through Python buffers.
+    """
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        size = os.fstat(source.fileno()).st_size
+
+        for name in ("copy_file_range", "sendfile"):
+            function = getattr(os, name, None)
+            if function is None:
+                continue
+            offset = 0
+            try:
+                while offset < size:
+                    if name == "copy_file_range":
+                        sent = function(source.fileno(), destination.fileno(), size - offset, offset, offset)
+                    else:
+                        sent = function(destination.fileno(), source.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                if offset >= size:
+                    return
+            except OSError:
+                pass  # Not supported for this filesystem pair, try the next primitive
+            destination.seek(0)
+            destination.truncate()
+
+        source.seek(0)
+        shutil.copyfileobj(source, destination, 1024 * 1024)
+
+
+
+
+def _reflink(source_path, destination_path):
+    import fcntl  # Not available on Windows, caller falls back to copy
+
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+
+
+
+
+def copy_file(source_path, destination_path, method="copy"):
+    """
+    Copies one file with the given method, falls back to a plain kernel copy when the method
+    is not supported. Returns the method actually used.
+
+    :param source_path: File to copy.
+    :param destination_path: Target file path, replaced when it exists.
+    :param method: (Optional) "copy", "reflink" or "hardlink".
+    """
+    # A destination linked to another file (e.g. the source, by an earlier "hardlink" run) is replaced
+    # before any method opens it, writing through the link would truncate the source Prefetch file
+    try:
+        stat = os.lstat(destination_path)
+        if method == "hardlink" or stat.st_nlink > 1 or os.path.islink(destination_path):
+            os.remove(destination_path)
+    except FileNotFoundError:
+        pass
+
+    used = "copy"
+    if method == "hardlink":
+        try:
+            os.link(source_path, destination_path)
+            return "hardlink"
+        except OSError:
+            pass
+    elif method == "reflink" and sys.platform.startswith("linux"):
+        try:
+            _reflink(source_path, destination_path)
+            used = "reflink"
+        except (OSError, ImportError):
+            pass
+
+    if used == "copy":
+        _kernel_copy(source_path, destination_path)
+    shutil.copystat(source_path, destination_path)  # Keeps mtime for the next skip check
+    return used
+
+
+
+
+def bulk_copy(source_folder, destination_folder, names, workers=4, method="copy", skip_unchanged=True, verify_digest=False):
+    """
+    Copies the named files from source to destination folder, unchanged files are skipped.
+
+    :param source_folder: Folder with the files.
+    :param destination_folder: Target folder, must exist.
+    :param names: File names to copy.
+    :param workers: (Optional) Number of files copied at the same time.
+    :param method: (Optional) "copy", "reflink" or "hardlink", see module description.
+    :param skip_unchanged: (Optional) Skip files already present with same size and mtime.
+    :param verify_digest: (Optional) Decide by SHA-256 digest instead of mtime when sizes match.
+    :return: Dictionary with "copied", "skipped" and "failed" lists of (name, detail),
+             "bytes_copied", "bytes_skipped" and "seconds".
+    """
+    from concurrent.futures import ThreadPoolExecutor  # Not needed by callers using copy_file only
+
+    if method not in COPY_METHODS:
+        raise ValueError(f"Unknown copy method: {method}")
+
+    start = time.perf_counter()
+    source_index = dir_index.get_index(source_folder)
+    destination_index = dir_index.get_index(destination_folder)
+    destination_index.refresh(force=True)  # Catch files rewritten since the last scan
+
+    report = {"copied": [], "skipped": [], "failed": [], "bytes_copied": 0, "bytes_skipped": 0}
+    pending = []
+    for name in names:
+        source_info = source_index.stat(name)  # Prefetch files are rewritten in place, the cached stat can be old
+        if source_info is None:
+            report["failed"].append((name, "Source file not found"))
+            continue
+        if skip_unchanged and is_unchanged(source_info, destination_index.get(name), verify_digest):
+            report["skipped"].append((name, "unchanged"))
+            report["bytes_skipped"] += source_info.size
+            continue
+        pending.append(source_info)
+
+    def copy_one(source_info):
+        destination_path = os.path.join(destination_folder, source_info.name)
+        with metrics.timer("copy_file_seconds"):
+            return copy_file(source_info.path, destination_path, method)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(copy_one, source_info) for source_info in pending]
+        for source_info, future in zip(pending, futures):
+            try:
+                used = future.result()
+            except OSError as e:
+                report["failed"].append((source_info.name, str(e)))
+                continue
+            report["copied"].append((source_info.name, used))
+            report["bytes_copied"] += source_info.size
+
+    report["seconds"] = time.perf_counter() - start
+    logging.info(
+        f"Bulk copy {source_folder} -> {destination_folder}: {len(report['copied'])} copied "
+        f"({report['bytes_copied']} bytes), {len(report['skipped'])} unchanged skipped "
+        f"({report['bytes_skipped']} bytes), {len(report['failed'])} failed in {report['seconds']:.2f} seconds"
+    )
+    return report
@@ -0,0 +1,575 @@
+# Columnar container for the parsed records of one run, instead of one PECmd JSON file per .pf file.
+#
+# All records of a run are stored column by column in one file, every column is compressed
+# on its own (zlib), so reading one field of the whole run only decompresses that column:
+#   int   - array of 64-bit integers (RunCount, Size, ...)
+#   str   - string dictionary of the column plus one 32-bit ID per record (ExecutableName, LastRun, ...)
+#   json  - as str, values are JSON text (mixed or other types)
+#   list  - offset index per record plus 32-bit IDs into the path dictionary shared by all list
+#           columns (Directories, FilesLoaded), entry counts are read from the offsets alone.
+#           Entries are split with json_stream.split_entries, so records read from a container and
+#           from JSON files compare equal, list fields are joined again with ", " like PECmd
+# The footer holds the position of every column part and the "ExecutableName-Hash" -> row index.
+#
+# Layout:
+#   MAGIC | compressed column parts ... | compressed JSON footer | footer offset, footer size, END
+#
+# json_stream.iter_records reads containers like JSON files (the magic is checked), so all
+# loaders accept them, e.g. in run folders or in the run archive.
+#
+# Example:
+#   python columnar.py pack C:\\Testing\\Prefetch\\4 --delete
+#   python columnar.py show C:\\Testing\\Prefetch\\4\\results.pfcol --record CHROME.EXE-AED7BA3D
+#   python columnar.py column C:\\Testing\\Prefetch\\4\\results.pfcol RunCount
+
+import os
+import sys
+import json
+import zlib
+import struct
+import logging
+import argparse
+import tempfile
+from array import array
+
+import json_stream
+
+CONTAINER_NAME = "results.pfcol"  # Container of a run in the work folder and run folders
+SUFFIX = ".pfcol"
+MAGIC = b"PFCOL\x01\r\n"
+END = b"PFCE"
+TRAILER = struct.Struct("<QI4s")  # Footer offset, footer size, END
+LIST_FIELDS = ("Directories", "FilesLoaded")
+NULL_ID = 0xFFFFFFFF  # Absent value of str/json columns
+INT_NULL = -(1 << 63)  # Absent value of int columns
+
+
+
+
+def _strings_parts(strings):
+    """
+    Encodes a string list as UTF-8 bytes and an offset array.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array("Q", [0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    return b"".join(encoded), offsets
+
+
+def _write_atomic(path, chunks):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+
+
+class _Column:
+    """
+    Values of one field while writing, the kind is taken from the first value and widened to
+    json when a later value does not fit.
+    """
+
+    def __init__(self, kind, rows):
+        self.kind = kind
+        if kind == "int":
+            self.values = array("q", [INT_NULL]) * rows
+        else:
+            self.values = array("I", [NULL_ID]) * rows
+            self.ids = {}
+            self.strings = []
+
+
+    def _string_id(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+
+    def append(self, value):
+        if self.kind == "int":
+            if type(value) is int and value != INT_NULL:
+                self.values.append(value)
+                return
+            self._widen()
+        if self.kind == "str" and type(value) is not str:
+            self._widen()
+        self.values.append(self._string_id(value if self.kind == "str" else json.dumps(value)))
+
+
+    def pad(self):
+        self.values.append(INT_NULL if self.kind == "int" else NULL_ID)
+
+
+    def _widen(self):
+        """
+        Converts an int or str column into a json column.
+        """
+        if self.kind == "int":
+            values = [None if value == INT_NULL else value for value in self.values]
+        else:
+            values = [None if string_id == NULL_ID else self.strings[string_id] for string_id in self.values]
+        self.kind = "json"
+        self.values = array("I")
+        self.ids = {}
+        self.strings = []
+        for value in values:
+            self.values.append(NULL_ID if value is None else self._string_id(json.dumps(value)))
+
+
+    def parts(self):
+        if self.kind == "int":
+            return {"values": self.values.tobytes()}
+        data, offsets = _strings_parts(self.strings)
+        return {"ids": self.values.tobytes(), "strings": data, "string_offsets": offsets.tobytes()}
+
+
+
+
+class ColumnarWriter:
+    """
+    Collects records and writes them as one container.
+    """
+
+    def __init__(self, list_fields=LIST_FIELDS, level=6):
+        """
+        :param list_fields: (Optional) Fields holding ", " joined path lists (or lists of paths).
+        :param level: (Optional) zlib compression level.
+        """
+        self.list_fields = tuple(list_fields)
+        self.level = level
+        self.columns = {}  # field -> _Column, in order of appearance
+        self.lists = {field: (array("Q", [0]), array("I")) for field in self.list_fields}
+        self.path_ids = {}
+        self.paths = []
+        self.names = {}
+        self.rows = 0
+
+
+    def __len__(self):
+        return self.rows
+
+
+    def add(self, record):
+        """
+        Adds one PECmd-style record, a later record with the same ExecutableName-Hash replaces it in the index.
+        """
+        for field, value in record.items():
+            if field in self.lists or value is None:
+                continue
+            column = self.columns.get(field)
+            if column is None:
+                column = self.columns[field] = _Column("int" if type(value) is int else "str", self.rows)
+            column.append(value)
+
+        for field, column in self.columns.items():
+            if len(column.values) == self.rows:
+                column.pad()
+
+        path_ids = self.path_ids
+        for field, (offsets, ids) in self.lists.items():
+            value = record.get(field)
+            if value is None:  # Absent, no entries
+                offsets.append(len(ids))
+                continue
+            for path in json_stream.split_entries(value) if isinstance(value, str) else value:
+                path_id = path_ids.get(path)
+                if path_id is None:
+                    path_id = path_ids[path] = len(self.paths)
+                    self.paths.append(path)
+                ids.append(path_id)
+            offsets.append(len(ids))
+
+        self.names[f"{record.get('ExecutableName', 'Unknown')}-{record.get('Hash', 'NoHash')}"] = self.rows
+        self.rows += 1
+
+
+    def write(self, path):
+        """
+        Writes the container atomically (temporary file renamed to path), returns its size in bytes.
+        """
+        chunks = [MAGIC]
+        position = len(MAGIC)
+
+        def add_part(data):
+            nonlocal position
+            compressed = zlib.compress(data, self.level)
+            chunks.append(compressed)
+            position += len(compressed)
+            return [position - len(compressed), len(compressed)]
+
+        columns = {}
+        for field, column in self.columns.items():
+            columns[field] = {"kind": column.kind, "parts": {name: add_part(data) for name, data in column.parts().items()}}
+        for field, (offsets, ids) in self.lists.items():
+            columns[field] = {"kind": "list", "parts": {"offsets": add_part(offsets.tobytes()), "ids": add_part(ids.tobytes())}}
+
+        data, offsets = _strings_parts(self.paths)
+        footer = {
+            "count": self.rows,
+            "byteorder": sys.byteorder,
+            "columns": columns,
+            "paths": {"strings": add_part(data), "string_offsets": add_part(offsets.tobytes())},
+            "index": self.names,
+        }
+        footer_data = zlib.compress(json.dumps(footer).encode("utf-8"), self.level)
+        chunks.append(footer_data)
+        chunks.append(TRAILER.pack(position, len(footer_data), END))
+
+        _write_atomic(path, chunks)
+        return position + len(footer_data) + TRAILER.size
+
+
+
+
+def write_records(path, records, list_fields=LIST_FIELDS):
+    """
+    Writes the records as one container, returns its size in bytes.
+    """
+    writer = ColumnarWriter(list_fields)
+    for record in records:
+        writer.add(record)
+    return writer.write(path)
+
+
+
+
+def is_container(file_path):
+    """
+    True when the file starts with the container magic.
+    """
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def find(folder_path):
+    """
+    Returns [container path] when the folder has a run container, [] otherwise.
+    """
+    path = os.path.join(folder_path, CONTAINER_NAME)
+    return [path] if os.path.isfile(path) else []
+
+
+
+
+class ColumnarReader:
+    """
+    Reads columns of a container on demand, decoded columns are kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a columnar container: {path}")
+            f.seek(-TRAILER.size, os.SEEK_END)
+            footer_offset, footer_size, end = TRAILER.unpack(f.read(TRAILER.size))
+            if end != END:
+                raise ValueError(f"Truncated columnar container: {path}")
+            f.seek(footer_offset)
+            footer = json.loads(zlib.decompress(f.read(footer_size)))
+
+        self.count = footer["count"]
+        self.columns = footer["columns"]
+        self.index = footer["index"]
+        self.paths_parts = footer["paths"]
+        self.swap = footer["byteorder"] != sys.byteorder
+        self.cache = {}
+
+
+    def __len__(self):
+        return self.count
+
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+
+    def _read(self, location):
+        with open(self.path, "rb") as f:
+            f.seek(location[0])
+            return zlib.decompress(f.read(location[1]))
+
+
+    def _array(self, typecode, location):
+        values = array(typecode)
+        values.frombytes(self._read(location))
+        if self.swap:
+            values.byteswap()
+        return values
+
+
+    def _strings(self, parts):
+        data = self._read(parts["strings"])
+        offsets = self._array("Q", parts["string_offsets"])
+        return [data[offsets[index]:offsets[index + 1]].decode("utf-8") for index in range(len(offsets) - 1)]
+
+
+    def _cached(self, key, load):
+        if key not in self.cache:
+            self.cache[key] = load()
+        return self.cache[key]
+
+
+    def path_strings(self):
+        """
+        Path dictionary shared by the list columns (entries as json_stream.split_entries gives them,
+        also for containers written with the leading space of PECmd's ", ").
+        """
+        return self._cached(("paths",), lambda: [path[1:] if path[:1] == " " else path for path in self._strings(self.paths_parts)])
+
+
+    def list_ids(self, field):
+        """
+        (offsets, ids) of a list column, entries of row i are ids[offsets[i]:offsets[i + 1]].
+        """
+        parts = self.columns[field]["parts"]
+        return self._cached(
+            (field, "list"), lambda: (self._array("Q", parts["offsets"]), self._array("I", parts["ids"]))
+        )
+
+
+    def counts(self, field):
+        """
+        Number of list entries per row (0 - absent), read from the offset index only.
+        """
+        parts = self.columns[field]["parts"]
+        offsets = self._cached((field, "offsets"), lambda: self._array("Q", parts["offsets"]))
+        return [offsets[row + 1] - offsets[row] for row in range(self.count)]
+
+
+    def column(self, field):
+        """
+        Values of a field for all rows (None where absent), lists as lists of entries.
+        """
+        if field not in self.columns:
+            return [None] * self.count
+        return self._cached((field,), lambda: self._decode(field))
+
+
+    def joined(self, field):
+        """
+        List column as joined strings like PECmd writes them (None where absent).
+        """
+        return self._cached(
+            (field, "joined"), lambda: [None if entries is None else json_stream.join_entries(entries) for entries in self.column(field)]
+        )
+
+
+    def _decode(self, field):
+        meta = self.columns[field]
+        kind, parts = meta["kind"], meta["parts"]
+        if kind == "int":
+            return [None if value == INT_NULL else value for value in self._array("q", parts["values"])]
+        if kind == "list":
+            offsets, ids = self.list_ids(field)
+            paths = self.path_strings()
+            return [
+                [paths[path_id] for path_id in ids[offsets[row]:offsets[row + 1]]] if offsets[row + 1] > offsets[row] else None
+                for row in range(self.count)
+            ]
+
+        strings = self._strings(parts)
+        if kind == "json":
+            strings = [json.loads(string) for string in strings]
+        return [None if string_id == NULL_ID else strings[string_id] for string_id in self._array("I", parts["ids"])]
+
+
+    def rows(self, executable=None, hash_value=None):
+        """
+        Rows of an executable and/or hash, the ExecutableName-Hash index is used when both are given.
+        """
+        if executable is not None and hash_value is not None:
+            row = self.index.get(f"{executable}-{hash_value}")
+            return [] if row is None else [row]
+        executables = self.column("ExecutableName") if executable is not None else None
+        hashes = self.column("Hash") if hash_value is not None else None
+        return [
+            row for row in range(self.count)
+            if (executables is None or executables[row] == executable) and (hashes is None or hashes[row] == hash_value)
+        ]
+
+
+    def record(self, row, fields=None, joined=True):
+        """
+        One record as dictionary, absent values are left out.
+
+        :param row: Row number or "ExecutableName-Hash".
+        :param fields: (Optional) Fields to return, all by default.
+        :param joined: (Optional) Return list fields as joined strings like PECmd, else as lists of entries.
+        """
+        if isinstance(row, str):
+            row = self.index[row]
+        record = {}
+        for field in fields or self.columns:
+            if field not in self.columns:
+                continue
+            if self.columns[field]["kind"] == "list":
+                offsets, ids = self.list_ids(field)
+                if offsets[row + 1] > offsets[row]:
+                    paths = self.path_strings()
+                    entries = [paths[path_id] for path_id in ids[offsets[row]:offsets[row + 1]]]
+                    record[field] = json_stream.join_entries(entries) if joined else entries
+                continue
+            value = self.column(field)[row]
+            if value is not None:
+                record[field] = value
+        return record
+
+
+    def iter_records(self, keys=(), count_keys=(), list_keys=(), intern=None):
+        """
+        Same records as json_stream.iter_records, only the requested columns are decompressed.
+        List entries are interned once per distinct path instead of once per entry.
+        """
+        # Same precedence as json_stream: keys, then count_keys, then list_keys
+        stored_counts = {key: self.column(f"{key}Count") for key in count_keys if f"{key}Count" in self.columns}
+        count_keys = [key for key in count_keys if key in self.columns and key not in keys]
+        list_keys = [key for key in list_keys if key in self.columns and key not in keys and key not in count_keys]
+        keys = [key for key in keys if key in self.columns]
+        count_columns = {key: self.counts(key) for key in count_keys}
+        list_columns = {}
+        for key in list_keys:
+            if self.columns[key]["kind"] == "list":
+                paths = self.path_strings()
+                list_columns[key] = (self.list_ids(key), [intern(path) for path in paths] if intern else paths)
+        value_columns = {key: self.joined(key) if self.columns[key]["kind"] == "list" else self.column(key) for key in keys}
+
+        for row in range(self.count):
+            record = {key: values[row] for key, values in value_columns.items() if values[row] is not None}
+            for key, counts in count_columns.items():
+                if counts[row]:
+                    record[f"{key}Count"] = counts[row]
+            for key, values in stored_counts.items():  # native-summary records carry the count instead of the list
+                if f"{key}Count" not in record and values[row] is not None:
+                    record[f"{key}Count"] = values[row]
+            for key, ((offsets, ids), entries) in list_columns.items():
+                if offsets[row + 1] > offsets[row]:
+                    record[key] = [entries[path_id] for path_id in ids[offsets[row]:offsets[row + 1]]]
+            yield record
+
+
+
+
+def iter_records(file_path, keys=(), count_keys=(), list_keys=(), intern=None):
+    """
+    json_stream.iter_records for containers.
+    """
+    yield from ColumnarReader(file_path).iter_records(keys, count_keys, list_keys, intern)
+
+
+
+
+def pack_folder(folder_path, prefix="", suffix=".json", delete=False):
+    """
+    Packs the PECmd JSON files of a folder into its container (CONTAINER_NAME), records already
+    in a container of the folder are kept.
+
+    :param folder_path: Work folder or run folder.
+    :param prefix: (Optional) Prefix of the JSON files.
+    :param suffix: (Optional) Suffix of the JSON files.
+    :param delete: (Optional) Delete the JSON files after the container is written.
+    :return: (number of records, container size in bytes, packed JSON files).
+    """
+    json_files = sorted(
+        os.path.join(folder_path, name) for name in os.listdir(folder_path)
+        if name.startswith(prefix) and name.endswith(suffix) and os.path.isfile(os.path.join(folder_path, name))
+    )
+    container_path = os.path.join(folder_path, CONTAINER_NAME)
+
+    # Records of the JSON files replace records with the same ExecutableName-Hash
+    records = {}
+    if os.path.isfile(container_path):
+        reader = ColumnarReader(container_path)
+        for row in range(len(reader)):
+            record = reader.record(row)
+            records[f"{record.get('ExecutableName', 'Unknown')}-{record.get('Hash', 'NoHash')}"] = record
+
+    packed = []
+    for json_file in json_files:
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Error reading {json_file}: {e}")
+            continue
+        for record in data if isinstance(data, list) else [data]:
+            records[f"{record.get('ExecutableName', 'Unknown')}-{record.get('Hash', 'NoHash')}"] = record
+        packed.append(json_file)
+
+    writer = ColumnarWriter()
+    for record in records.values():
+        writer.add(record)
+    size = writer.write(container_path) if len(writer) else 0
+    if delete and size:
+        for json_file in packed:
+            os.remove(json_file)
+    return len(writer), size, packed
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar container of parsed Prefetch records (one file per run)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack = commands.add_parser("pack", help="Pack the PECmd JSON files of a folder into its container")
+    pack.add_argument("folder")
+    pack.add_argument("--prefix", default="")
+    pack.add_argument("--delete", action="store_true", help="Delete the JSON files after packing")
+
+    show = commands.add_parser("show", help="Fields and records of a container")
+    show.add_argument("container")
+    show.add_argument("--record", help="ExecutableName-Hash of the record to print")
+    show.add_argument("--executable", help="Print all records of this executable")
+
+    column = commands.add_parser("column", help="Print one field of all records")
+    column.add_argument("container")
+    column.add_argument("field")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        json_size = sum(
+            entry.stat().st_size for entry in os.scandir(args.folder)
+            if entry.is_file() and entry.name.startswith(args.prefix) and entry.name.endswith(".json")
+        )
+        count, size, packed = pack_folder(args.folder, args.prefix, delete=args.delete)
+        print(f"{count} records from {len(packed)} JSON files -> {os.path.join(args.folder, CONTAINER_NAME)} ({size} bytes)"
+              + (f", JSON files: {json_size} bytes" if json_size else ""))
+        return
+
+    reader = ColumnarReader(args.container)
+    if args.command == "column":
+        for executable, hash_value, value in zip(reader.column("ExecutableName"), reader.column("Hash"), reader.column(args.field)):
+            print(f"{executable}-{hash_value}: {value}")
+        return
+
+    if args.record or args.executable:
+        rows = [reader.index[args.record]] if args.record else reader.rows(args.executable)
+        for row in rows:
+            print(json.dumps(reader.record(row), indent=4, sort_keys=True))
+        return
+    print(f"{len(reader)} records, fields: {', '.join(reader.fields)}")
+    for name in sorted(reader.index):
+        print(name)
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,302 @@
+# Corpus mode: Prefetch files collected from many hosts, one folder or zip file per host.
+#
+#   <corpus_folder>/HOST01/...any depth.../*.pf
+#   <corpus_folder>/HOST02.zip              (members ending with .pf, read without extracting)
+#
+# Hosts are parsed in-process with prefetch_parser, spread over a process pool. Every host
+# is written on its own (<output_folder>/hosts/<host>.jsonl plus a status file), a failing
+# file or host does not stop the others. A restart skips hosts whose input did not change
+# since their status file was written. merge_results() joins all hosts into one JSONL
+# dataset, every record tagged with "Host".
+#
+# Example:
+#   python corpus.py D:\Triage\Collections D:\Triage\Prefetch --workers 8
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import zipfile
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import prefetch_parser
+
+PREFETCH_SUFFIX = ".pf"
+
+
+
+
+def discover_hosts(corpus_folder):
+    """
+    Returns (host, path, kind) for every host folder ("dir") and zip file ("zip") ordered by host.
+    A folder and a zip file of the same host (HOST01 and HOST01.zip) would write the same results,
+    both are then named by their entry name (HOST01, HOST01.zip).
+
+    :param corpus_folder: Folder with one entry per host.
+    """
+    hosts = []
+    with os.scandir(corpus_folder) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                hosts.append((entry.name, entry.path, "dir"))
+            elif entry.is_file() and entry.name.lower().endswith(".zip"):
+                hosts.append((os.path.splitext(entry.name)[0], entry.path, "zip"))
+
+    # Result files are compared case-insensitively (Windows)
+    counts = {}
+    for host, _, _ in hosts:
+        counts[host.casefold()] = counts.get(host.casefold(), 0) + 1
+    renamed = []
+    for host, path, kind in hosts:
+        if counts[host.casefold()] > 1 and host != os.path.basename(path):
+            logging.warning(f"Host {host} found more than once, {path} is named {os.path.basename(path)}")
+            host = os.path.basename(path)
+        renamed.append((host, path, kind))
+
+    names = [host.casefold() for host, _, _ in renamed]
+    if len(set(names)) != len(names):
+        duplicates = sorted({host for host, _, _ in renamed if names.count(host.casefold()) > 1})
+        raise ValueError(f"Host names differ only in case: {', '.join(duplicates)}")
+    return sorted(renamed)
+
+
+
+
+def _host_files(path):
+    """
+    Prefetch files below a host folder, ordered by path.
+    """
+    files = []
+    for root, _, names in os.walk(path):
+        files.extend(os.path.join(root, name) for name in names if name.lower().endswith(PREFETCH_SUFFIX))
+    return sorted(files)
+
+
+
+
+def fingerprint(path, kind):
+    """
+    Identifies the input of a host: size and mtime of the zip file, or a digest of path, size and mtime
+    of every Prefetch file of the folder (any file added, removed or rewritten changes it).
+    """
+    if kind == "zip":
+        stat = os.stat(path)
+        return f"zip|{stat.st_size}|{stat.st_mtime_ns}"
+
+    digest = hashlib.sha256()
+    files = _host_files(path)
+    for file_path in files:
+        stat = os.stat(file_path)
+        digest.update(f"{os.path.relpath(file_path, path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return f"dir|{len(files)}|{digest.hexdigest()}"
+
+
+
+
+def _iter_host_prefetch(path, kind):
+    """
+    Yields (source name, file content) of every Prefetch file of a host.
+    Zip members are read one at a time, the archive is never extracted.
+    """
+    if kind == "zip":
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith(PREFETCH_SUFFIX):
+                    with archive.open(member) as f:
+                        yield f"{path}!{member.filename}", f.read()
+    else:
+        for file_path in _host_files(path):
+            with open(file_path, "rb") as f:
+                yield file_path, f.read()
+
+
+
+
+def _status_path(output_folder, host):
+    return os.path.join(output_folder, "hosts", f"{host}.status.json")
+
+
+def _records_path(output_folder, host):
+    return os.path.join(output_folder, "hosts", f"{host}.jsonl")
+
+
+
+
+def _write_atomic(path, text):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+
+
+def process_host(host, path, kind, output_folder, summary=False):
+    """
+    Parses all Prefetch files of one host and writes <host>.jsonl and <host>.status.json.
+    Runs in a pool worker, errors are reported in the returned status instead of raised.
+
+    :param host: Host name.
+    :param path: Host folder or zip file.
+    :param kind: "dir" or "zip".
+    :param output_folder: Corpus output folder.
+    :param summary: (Optional) Only header fields and Directories/FilesLoaded counts.
+    :return: Status dictionary: host, input, records, errors (list of "file: error"), seconds, failed.
+    """
+    start = time.perf_counter()
+    status = {"host": host, "input": None, "summary": summary, "records": 0, "errors": [], "failed": None}
+
+    try:
+        status["input"] = fingerprint(path, kind)
+        lines = []
+        for source, data in _iter_host_prefetch(path, kind):
+            try:
+                record = prefetch_parser.PrefetchRecord(data, source)
+                fields = record.summary() if summary else record.to_dict()
+            except prefetch_parser.PrefetchParseError as e:
+                status["errors"].append(f"{source}: {e}")
+                continue
+            lines.append(json.dumps({"Host": host, "SourceFilename": source, **fields}))
+
+        _write_atomic(_records_path(output_folder, host), "".join(line + "\n" for line in lines))
+        status["records"] = len(lines)
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+        status["failed"] = str(e)
+
+    status["seconds"] = time.perf_counter() - start
+    if status["failed"] is None:
+        _write_atomic(_status_path(output_folder, host), json.dumps(status))  # Marks the host done for resume
+    elif os.path.exists(_status_path(output_folder, host)):
+        os.remove(_status_path(output_folder, host))  # Results of an older input are not merged
+    return status
+
+
+
+
+def is_done(output_folder, host, path, kind, summary=False):
+    """
+    True when the host was processed before in the same mode and its input did not change since.
+    """
+    try:
+        with open(_status_path(output_folder, host), "r", encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (
+        os.path.exists(_records_path(output_folder, host))
+        and status.get("summary", False) == summary
+        and status.get("input") == fingerprint(path, kind)
+    )
+
+
+
+
+def run_corpus(corpus_folder, output_folder, workers=None, summary=False, resume=True, progress=print):
+    """
+    Processes every host of the corpus folder on a process pool.
+
+    :param corpus_folder: Folder with one folder or zip file per host.
+    :param output_folder: Where per-host results and the merged dataset are written.
+    :param workers: (Optional) Number of worker processes, default CPU count.
+    :param summary: (Optional) Only header fields and Directories/FilesLoaded counts.
+    :param resume: (Optional) Skip hosts already processed with unchanged input.
+    :param progress: (Optional) Called with one progress line per finished host.
+    :return: List of status dictionaries of the processed hosts (skipped hosts are not included).
+    """
+    os.makedirs(os.path.join(output_folder, "hosts"), exist_ok=True)
+    hosts = discover_hosts(corpus_folder)
+    pending = [host for host in hosts if not (resume and is_done(output_folder, *host, summary))]
+    skipped = len(hosts) - len(pending)
+    logging.info(f"Corpus {corpus_folder}: {len(hosts)} hosts, {skipped} unchanged since last run, {len(pending)} to process")
+    progress(f"{len(hosts)} hosts, {skipped} already done, {len(pending)} to process")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_host, host, path, kind, output_folder, summary): host
+            for host, path, kind in pending
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            host = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:  # Worker died (e.g. BrokenProcessPool), host stays pending for resume
+                status = {"host": host, "records": 0, "errors": [], "failed": str(e) or type(e).__name__, "seconds": 0.0}
+            results.append(status)
+
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / done * (len(pending) - done)
+            state = f"FAILED: {status['failed']}" if status["failed"] else f"{status['records']} records, {len(status['errors'])} errors"
+            line = f"[{done}/{len(pending)}] {host}: {state} ({status['seconds']:.1f}s), about {remaining:.0f}s left"
+            progress(line)
+            if status["failed"]:
+                logging.error(f"Corpus host {host} failed: {status['failed']}")
+            else:
+                logging.info(f"Corpus host {line}")
+                for error in status["errors"]:
+                    logging.error(f"Corpus host {host}: {error}")
+
+    return results
+
+
+
+
+def merge_results(output_folder, merged_name="corpus.jsonl"):
+    """
+    Joins the records of all finished hosts into one JSONL file, returns its path and record count.
+
+    :param output_folder: Corpus output folder.
+    :param merged_name: (Optional) File name of the merged dataset.
+    """
+    hosts_folder = os.path.join(output_folder, "hosts")
+    merged_path = os.path.join(output_folder, merged_name)
+    count = 0
+
+    handle, temp_path = tempfile.mkstemp(dir=output_folder, prefix=".tmp_")
+    with os.fdopen(handle, "w", encoding="utf-8") as merged:
+        for name in sorted(os.listdir(hosts_folder)):
+            if not name.endswith(".status.json"):
+                continue
+            host = name[:-len(".status.json")]
+            with open(_records_path(output_folder, host), "r", encoding="utf-8") as f:
+                for line in f:
+                    merged.write(line)
+                    count += 1
+    os.replace(temp_path, merged_path)
+
+    logging.info(f"Merged {count} corpus records into {merged_path}")
+    return merged_path, count
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse Prefetch files of many hosts (one folder or zip per host)")
+    parser.add_argument("corpus", help="Folder with one folder or zip file per host")
+    parser.add_argument("output", help="Output folder (per-host results, merged corpus.jsonl)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, default CPU count")
+    parser.add_argument("--summary", action="store_true", help="Only header fields and Directories/FilesLoaded counts")
+    parser.add_argument("--no-resume", action="store_true", help="Process all hosts again")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    results = run_corpus(args.corpus, args.output, args.workers, args.summary, not args.no_resume)
+    merged_path, count = merge_results(args.output)
+    print(f"{count} records merged into {merged_path}")
+    return 1 if any(status["failed"] for status in results) else 0
+
+
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Shared directory index for PECmd_looper.py stages.
+#
+# One os.scandir pass per folder keeps every file with its stat result (size, mtime, inode).
+# Stages query the index instead of listing the folder again. The folder is only scanned again
+# when its own mtime changed (files added, removed or renamed) or on refresh(force=True).
+
+import os
+import re
+import time
+import fnmatch
+from collections import namedtuple
+
+FileInfo = namedtuple("FileInfo", "name path size mtime_ns inode")
+
+# Directory mtime resolution differs per filesystem (FAT: 2 seconds), changes within this
+# window after a scan could go unnoticed, so such scans are never trusted.
+MTIME_RESOLUTION = 2.0
+
+_indexes = {}
+
+
+
+
+class DirectoryIndex:
+    """
+    Files of one folder with cached stat results.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.entries = {}  # name -> FileInfo
+        self.dir_mtime_ns = None
+        self.scanned_at = 0.0
+
+
+    def _is_current(self):
+        try:
+            dir_mtime_ns = os.stat(self.folder_path).st_mtime_ns
+        except OSError:
+            return False
+        return (
+            dir_mtime_ns == self.dir_mtime_ns
+            and self.scanned_at - dir_mtime_ns / 1e9 > MTIME_RESOLUTION
+        )
+
+
+    def refresh(self, force=False):
+        """
+        Scans the folder again unless nothing was added or removed since the last scan.
+        Returns (added, removed, changed) file names, changed are files with other size/mtime/inode.
+
+        :param force: (Optional) Scan even when the folder mtime did not change, e.g. to pick up rewritten files.
+        """
+        if not force and self._is_current():
+            return set(), set(), set()
+
+        try:
+            dir_mtime_ns = os.stat(self.folder_path).st_mtime_ns
+        except OSError:
+            removed = set(self.entries)
+            self.entries = {}
+            self.dir_mtime_ns = None
+            return set(), removed, set()
+
+        scanned_at = time.time()
+        entries = {}
+        with os.scandir(self.folder_path) as scan:
+            for entry in scan:
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()  # Free on Windows, taken from the directory listing
+                except OSError:
+                    continue
+                entries[entry.name] = FileInfo(entry.name, entry.path, stat.st_size, stat.st_mtime_ns, entry.inode())
+
+        added = entries.keys() - self.entries.keys()
+        removed = self.entries.keys() - entries.keys()
+        changed = {
+            name for name in entries.keys() & self.entries.keys()
+            if entries[name][2:] != self.entries[name][2:]
+        }
+
+        self.entries = entries
+        self.dir_mtime_ns = dir_mtime_ns
+        self.scanned_at = scanned_at
+        return added, removed, changed
+
+
+    def files(self, prefix="", suffix="", regex=None, glob=None, ignore_case=False, names=None):
+        """
+        Returns FileInfo of matching files ordered by name.
+
+        :param prefix: (Optional) File name prefix.
+        :param suffix: (Optional) File name suffix.
+        :param regex: (Optional) Regular expression the file name must match (re.search).
+        :param glob: (Optional) Shell pattern the file name must match, e.g. "CHROME.EXE-*.pf".
+        :param ignore_case: (Optional) Compare prefix and suffix case-insensitively.
+        :param names: (Optional) Exact file names, looked up directly instead of checking every file,
+                      e.g. prefetch_hash.candidate_names of the programs of interest.
+        """
+        self.refresh()
+
+        if ignore_case:
+            prefix, suffix = prefix.lower(), suffix.lower()
+        pattern = re.compile(regex) if isinstance(regex, str) else regex
+
+        matches = []
+        candidates = self.entries if names is None else self.entries.keys() & set(names)
+        for name in sorted(candidates):
+            compare_name = name.lower() if ignore_case else name
+            if not (compare_name.startswith(prefix) and compare_name.endswith(suffix)):
+                continue
+            if pattern is not None and not pattern.search(name):
+                continue
+            if glob is not None and not fnmatch.fnmatch(name, glob):
+                continue
+            matches.append(self.entries[name])
+        return matches
+
+
+    def get(self, name):
+        """
+        Returns FileInfo of the file with the exact name or None.
+        """
+        self.refresh()
+        return self.entries.get(name)
+
+
+    def stat(self, name):
+        """
+        Returns FileInfo of the file with the exact name from a new os.stat or None, and updates the index.
+        For files rewritten in place (live Prefetch files), which does not change the folder mtime.
+        """
+        path = os.path.join(self.folder_path, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.entries.pop(name, None)
+            return None
+        info = FileInfo(name, path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        self.entries[name] = info
+        return info
+
+
+    def discard(self, name):
+        """
+        Forgets a file removed or moved away by a stage.
+        """
+        self.entries.pop(name, None)
+
+
+
+
+def get_index(folder_path):
+    """
+    Returns the index shared by all stages for the folder.
+
+    :param folder_path: Folder to index.
+    """
+    key = os.path.normcase(os.path.abspath(folder_path))
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = DirectoryIndex(folder_path)
+    return index
@@ -0,0 +1,350 @@
+# Streaming reader for PECmd JSON output.
+#
+# Reads only the requested keys of every top-level object and skips the rest without
+# decoding it. Comma separated list fields (Directories, FilesLoaded) can be counted or
+# iterated entry by entry, the whole string is never held in memory. PECmd joins entries
+# with ", ", entries are split at "," without the space (split_entries), every loader and
+# the columnar container use the same entries.
+#
+# Works on single-object files ({filename}.json), JSON Lines (one object per line, PECmd
+# output for a whole folder) and top-level arrays of objects. Memory use is bounded by
+# CHUNK_SIZE plus the largest requested value.
+#
+# iter_records also reads columnar containers (columnar.py), detected by their magic.
+
+import re
+import json
+
+import columnar
+
+CHUNK_SIZE = 64 * 1024
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_CONTAINER_SPECIAL = re.compile(r'["{}\[\]]')
+_LITERAL_END = re.compile(r'[,}\]\s]')
+
+
+
+
+class _Scanner:
+    """
+    Incremental tokenizer over a text file, reading CHUNK_SIZE characters at a time.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+
+    def fill(self):
+        """
+        Drops consumed text and reads the next chunk, returns False at end of file.
+        """
+        chunk = self.f.read(CHUNK_SIZE)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, "" at end of file.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"Expecting '{char}'")
+        self.pos += 1
+
+
+    def string_pieces(self):
+        """
+        Consumes a string value and yields its raw (still escaped) content in pieces.
+        Pieces never end inside an escape sequence's first two characters.
+        """
+        self.expect('"')
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            if match is None:
+                if self.pos < len(self.buf):
+                    yield self.buf[self.pos:]
+                    self.pos = len(self.buf)
+                if not self.fill():
+                    raise self.error("Unterminated string")
+                continue
+
+            index = match.start()
+            if self.buf[index] == '"':
+                if index > self.pos:
+                    yield self.buf[self.pos:index]
+                self.pos = index + 1
+                return
+
+            # Backslash, keep it together with the escaped character
+            if index + 1 >= len(self.buf):
+                if index > self.pos:
+                    yield self.buf[self.pos:index]
+                self.pos = index
+                if not self.fill():
+                    raise self.error("Unterminated string")
+                continue
+            yield self.buf[self.pos:index + 2]
+            self.pos = index + 2
+
+
+    def raw_value(self, keep=True):
+        """
+        Consumes any value and returns its raw JSON text (None when keep is False).
+        """
+        char = self.peek()
+        parts = [] if keep else None
+
+        if char == '"':
+            for piece in self.string_pieces():
+                if keep:
+                    parts.append(piece)
+            return '"' + "".join(parts) + '"' if keep else None
+
+        if char in "{[":
+            depth = 0
+            while True:
+                match = _CONTAINER_SPECIAL.search(self.buf, self.pos)
+                if match is None:
+                    if keep:
+                        parts.append(self.buf[self.pos:])
+                    self.pos = len(self.buf)
+                    if not self.fill():
+                        raise self.error("Unterminated object or array")
+                    continue
+
+                index = match.start()
+                if keep:
+                    parts.append(self.buf[self.pos:index])
+                self.pos = index
+                special = self.buf[index]
+                if special == '"':
+                    pieces = self.string_pieces()
+                    if keep:
+                        parts.append('"')
+                        parts.extend(pieces)
+                        parts.append('"')
+                    else:
+                        for _ in pieces:
+                            pass
+                    continue
+
+                self.pos += 1
+                if keep:
+                    parts.append(special)
+                depth += 1 if special in "{[" else -1
+                if depth == 0:
+                    return "".join(parts) if keep else None
+
+        if not char:
+            raise self.error("Expecting value")
+
+        # Number, true, false, null
+        while True:
+            match = _LITERAL_END.search(self.buf, self.pos)
+            if match is not None:
+                if keep:
+                    parts.append(self.buf[self.pos:match.start()])
+                self.pos = match.start()
+                break
+            if keep:
+                parts.append(self.buf[self.pos:])
+            self.pos = len(self.buf)
+            if not self.fill():
+                break
+        return "".join(parts) if keep else None
+
+
+    def objects(self, on_value):
+        """
+        Walks all top-level objects (single object, JSON Lines or an array of objects).
+        on_value(index, key) is called with the scanner positioned at each value and must consume it.
+        Yields the index of every completed object.
+        """
+        index = 0
+        in_array = False
+        while True:
+            char = self.peek()
+            if not char:
+                if in_array:
+                    raise self.error("Unterminated array")
+                return
+
+            if char == "[" and not in_array:
+                in_array = True
+                self.pos += 1
+                continue
+            if in_array and char == ",":
+                self.pos += 1
+                continue
+            if in_array and char == "]":
+                in_array = False
+                self.pos += 1
+                continue
+
+            self.expect("{")
+            if self.peek() == "}":
+                self.pos += 1
+            else:
+                while True:
+                    key = json.loads(self.raw_value())
+                    self.expect(":")
+                    self.peek()
+                    on_value(index, key)
+                    char = self.peek()
+                    self.pos += 1
+                    if char == "}":
+                        break
+                    if char != ",":
+                        raise self.error("Expecting ',' delimiter")
+            yield index
+            index += 1
+
+
+
+
+def _entry(part):
+    return part[1:] if part[:1] == " " else part  # Space PECmd writes after every ","
+
+
+
+
+def split_entries(value):
+    """
+    Entries of a comma separated list field (PECmd: ", " joined), the same entries as
+    iter_records(list_keys=...) yields. join_entries(split_entries(value)) restores PECmd's value.
+    """
+    return [_entry(part) for part in value.split(",")]
+
+
+
+
+def join_entries(entries):
+    """
+    List field as PECmd writes it.
+    """
+    return ", ".join(entries)
+
+
+
+
+def _count_entries(scanner):
+    """
+    Counts the comma separated entries of the value at the scanner position
+    (same result as len(value.split(",")) for strings).
+    """
+    if scanner.peek() == '"':
+        return sum(piece.count(",") for piece in scanner.string_pieces()) + 1
+
+    value = json.loads(scanner.raw_value())
+    if isinstance(value, list):
+        return len(value)
+    return 0 if value is None else 1
+
+
+
+
+def _split_entries(scanner):
+    """
+    Yields the entries of the string value at the scanner position (same as split_entries).
+    Commas never appear inside escape sequences, so raw text can be split before decoding.
+    """
+    current = []
+    for piece in scanner.string_pieces():
+        parts = piece.split(",")
+        for part in parts[:-1]:
+            current.append(part)
+            yield _entry(json.loads('"' + "".join(current) + '"'))
+            current = []
+        current.append(parts[-1])
+    yield _entry(json.loads('"' + "".join(current) + '"'))
+
+
+
+
+def iter_records(file_path, keys=(), count_keys=(), list_keys=(), intern=None):
+    """
+    Yields one dictionary per top-level object with only the requested keys decoded.
+    For every key in count_keys present in the object the number of comma separated
+    entries is stored under "<key>Count" instead of the value, objects without the list
+    keep their own "<key>Count" (records of the native-summary backend).
+
+    :param file_path: PECmd JSON or JSON Lines output.
+    :param keys: Keys to decode.
+    :param count_keys: Keys holding comma separated lists (e.g. "Directories", "FilesLoaded") to count.
+    :param list_keys: Keys holding comma separated lists to return as lists of entries.
+    :param intern: (Optional) Function applied to every list entry, e.g. mapping paths to integer IDs.
+    """
+    if columnar.is_container(file_path):
+        yield from columnar.iter_records(file_path, keys, count_keys, list_keys, intern)
+        return
+
+    keys = set(keys)
+    count_keys = set(count_keys)
+    stored_count_keys = {f"{key}Count" for key in count_keys}
+    list_keys = set(list_keys)
+    record = {}
+
+    def on_value(index, key):
+        if key in keys:
+            record[key] = json.loads(scanner.raw_value())
+        elif key in count_keys:
+            record[f"{key}Count"] = _count_entries(scanner)
+        elif key in stored_count_keys:
+            record.setdefault(key, json.loads(scanner.raw_value()))  # The list, when present, is counted instead
+        elif key in list_keys and scanner.peek() == '"':
+            entries = _split_entries(scanner)
+            record[key] = [intern(entry) for entry in entries] if intern else list(entries)
+        else:
+            scanner.raw_value(keep=False)
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        scanner = _Scanner(f)
+        for _ in scanner.objects(on_value):
+            yield record
+            record = {}
+
+
+
+
+def iter_entries(file_path, key, record_index=None):
+    """
+    Yields the comma separated entries of a list field one by one as (record index, entry),
+    entries are the same as split_entries(value) would give.
+
+    :param file_path: PECmd JSON or JSON Lines output.
+    :param key: Field to iterate, e.g. "FilesLoaded".
+    :param record_index: (Optional) Only entries of the object with this index.
+    """
+    entries = []
+
+    def on_value(index, field):
+        if field != key or (record_index is not None and index != record_index) or scanner.peek() != '"':
+            scanner.raw_value(keep=False)
+            return
+
+        for entry in _split_entries(scanner):
+            entries.append((index, entry))
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        scanner = _Scanner(f)
+        for _ in scanner.objects(on_value):
+            yield from entries
+            entries.clear()
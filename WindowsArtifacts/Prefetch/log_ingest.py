@@ -0,0 +1,431 @@
+# Ingestion and queries of PECmd_looper result logs (First_batch_results.log, PECmd_looper.log, ...).
+#
+# Logs are read line by line with one compiled pattern (### RUN n ### markers and the
+# "EXE-HASH | Last Run: ... | Run Count: ..." lines written by log_record), other lines are
+# skipped. Rotated logs (PECmd_looper.log.1, .2, ... and .gz) are read oldest first as one log.
+# Parsed lines go into NumPy columns in chunks, so memory stays proportional to the rows,
+# not to the log size. The resulting LogTable keeps sorted indexes by hash, run and Last Run
+# time, queries are array slices and masks.
+#
+# Example:
+#   python log_ingest.py First_batch_results.log Second_batch_results.log --hash AED7BA3D
+#   python log_ingest.py "logs/*.log" --run 3 --since "2025-01-24 21:50:00" --csv run3.csv
+
+import os
+import re
+import csv
+import glob
+import gzip
+import time
+import logging
+import argparse
+
+import numpy as np
+
+CHUNK_ROWS = 65536
+UNKNOWN = -1  # Run Count / Dir Count / File Count not in the log
+NAT = np.iinfo(np.int64).min  # datetime64 NaT as int64
+RECORD_FIELDS = ("batch", "run", "note", "logged", "executable", "hash", "last_run", "run_count", "dir_count", "file_count", "marked")
+
+# One pass per line: run marker or record, with or without the logging timestamp.
+# Text after a record (e.g. "<-" added by hand to point at a line) marks the record.
+LINE_PATTERN = re.compile(
+    r"\s*(?:(?P<logged>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(?P<ms>\d{3}) - )?\s*WARNING - "
+    r"(?:### RUN (?P<run>\d+) ###\s*(?P<note>.*?)"
+    r"|(?P<exe>[^|]+?)-(?P<hash>[^|\s-]+) \| Last Run: (?P<last_run>[^|]*?) \| Run Count: (?P<run_count>[^|\s]*)"
+    r"(?: \| Dir Count: (?P<dirs>[^|\s]*) \| File Count: (?P<files>[^|\s]*))?(?P<mark>[^|]*?))\s*$"
+)
+ROTATED_PATTERN = re.compile(r"^(?P<base>.+?)\.(?P<number>\d+)(?:\.gz)?$")
+
+
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return UNKNOWN
+
+
+
+
+def _to_seconds(value):
+    """
+    Seconds since 1970 of a Last Run value, NAT when it is not a date ("Unknown", edited by hand, ...).
+    """
+    if not value[:1].isdigit():
+        return NAT
+    try:
+        return int(np.datetime64(value, "s").astype(np.int64))
+    except (ValueError, OverflowError):
+        return NAT
+
+
+
+
+def _to_datetimes(values, unit):
+    """
+    datetime64 array of the values, values that are not dates become NaT.
+    """
+    try:
+        return np.array(values, dtype=f"datetime64[{unit}]")
+    except (ValueError, OverflowError):
+        times = []
+        for value in values:
+            try:
+                times.append(np.datetime64(value, unit))
+            except (ValueError, OverflowError):
+                times.append(np.datetime64("NaT", unit))
+        return np.array(times, dtype=f"datetime64[{unit}]")
+
+
+
+
+def _open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+
+
+def expand_logs(paths):
+    """
+    Returns (batch name, log path) for all logs of the given paths, globs and rotated copies
+    (log.2, log.1, log) are read oldest first under the name of the current log.
+
+    :param paths: Log files or glob patterns.
+    """
+    files = []
+    for path in paths:
+        matches = sorted(glob.glob(path)) or [path]
+        files.extend(match for match in matches if os.path.isfile(match))
+
+    batches = {}
+    for path in dict.fromkeys(files):
+        match = ROTATED_PATTERN.match(os.path.basename(path))
+        if match:
+            base, age = match.group("base"), int(match.group("number"))
+        else:
+            base, age = os.path.basename(path).removesuffix(".gz"), 0
+        batches.setdefault((os.path.dirname(path), base), []).append((age, path))
+
+    return [
+        (base, path)
+        for (_, base), pieces in sorted(batches.items())
+        for _, path in sorted(pieces, reverse=True)
+    ]
+
+
+
+
+class LogIngest:
+    """
+    Parses log lines into column chunks, build() returns the LogTable.
+    """
+
+    def __init__(self):
+        self.batches = []       # batch id -> name
+        self.segments = []      # segment id -> (batch id, run, note, logged)
+        self.executables = {}   # name -> id
+        self.hashes = {}        # hash -> id
+        self.chunks = []
+        self.last_runs = {}     # Last Run text -> seconds, every value is parsed once
+        self.lines = 0
+        self._reset()
+
+
+    def _reset(self):
+        self.buffer = {name: [] for name in ("segment", "logged", "executable", "hash", "last_run", "run_count", "dir_count", "file_count", "marked")}
+
+
+    def _flush(self):
+        buffer = self.buffer
+        if not buffer["segment"]:
+            return
+        self.chunks.append({
+            "segment": np.array(buffer["segment"], dtype=np.int32),
+            "logged": _to_datetimes(buffer["logged"], "ms"),
+            "executable": np.array(buffer["executable"], dtype=np.int32),
+            "hash": np.array(buffer["hash"], dtype=np.int32),
+            "last_run": np.array(buffer["last_run"], dtype=np.int64).view("datetime64[s]"),
+            "run_count": np.array(buffer["run_count"], dtype=np.int64),
+            "dir_count": np.array(buffer["dir_count"], dtype=np.int64),
+            "file_count": np.array(buffer["file_count"], dtype=np.int64),
+            "marked": np.array(buffer["marked"], dtype=bool),
+        })
+        self._reset()
+
+
+    def add_log(self, batch, path):
+        """
+        Reads one log file, records before the first run marker belong to run -1.
+
+        :param batch: Batch name, rotated pieces of one log share it and continue its runs.
+        :param path: Log file (.gz is decompressed while reading).
+        """
+        if batch in self.batches:
+            batch_id = self.batches.index(batch)
+            segment = next((index for index in range(len(self.segments) - 1, -1, -1) if self.segments[index][0] == batch_id), None)
+        else:
+            batch_id = len(self.batches)
+            self.batches.append(batch)
+            segment = None
+
+        buffer = self.buffer
+        executables = self.executables
+        hashes = self.hashes
+        last_runs = self.last_runs
+        match_line = LINE_PATTERN.match
+
+        with _open_log(path) as f:
+            for line in f:
+                self.lines += 1
+                if "WARNING - " not in line:
+                    continue
+                match = match_line(line)
+                if match is None:
+                    continue
+
+                logged = match.group("logged")
+                logged = f"{logged}.{match.group('ms')}" if logged else "NaT"
+                if match.group("run") is not None:
+                    segment = len(self.segments)
+                    self.segments.append((batch_id, int(match.group("run")), match.group("note"), logged))
+                    continue
+
+                if segment is None:
+                    segment = len(self.segments)
+                    self.segments.append((batch_id, -1, "", logged))
+
+                executable = match.group("exe").strip()
+                hash_value = match.group("hash")
+                buffer["segment"].append(segment)
+                buffer["logged"].append(logged)
+                buffer["executable"].append(executables.setdefault(executable, len(executables)))
+                buffer["hash"].append(hashes.setdefault(hash_value, len(hashes)))
+                last_run = match.group("last_run")
+                seconds = last_runs.get(last_run)
+                if seconds is None:
+                    seconds = last_runs[last_run] = _to_seconds(last_run)
+                buffer["last_run"].append(seconds)
+                buffer["run_count"].append(_to_int(match.group("run_count")))
+                buffer["dir_count"].append(_to_int(match.group("dirs")))
+                buffer["file_count"].append(_to_int(match.group("files")))
+                buffer["marked"].append(bool(match.group("mark").strip()))
+
+                if len(buffer["segment"]) >= CHUNK_ROWS:
+                    self._flush()
+                    buffer = self.buffer
+
+
+    def build(self):
+        self._flush()
+        columns = {}
+        for name in ("segment", "logged", "executable", "hash", "last_run", "run_count", "dir_count", "file_count", "marked"):
+            parts = [chunk[name] for chunk in self.chunks]
+            columns[name] = np.concatenate(parts) if parts else np.array([], dtype=np.int32)
+        if not self.chunks:
+            for name in ("logged", "last_run"):
+                columns[name] = columns[name].astype("datetime64[s]")
+        return LogTable(
+            self.batches,
+            self.segments,
+            list(self.executables),
+            list(self.hashes),
+            columns,
+        )
+
+
+
+
+class LogTable:
+    """
+    Records of all ingested logs as columns with indexes by hash, run and Last Run time.
+    """
+
+    def __init__(self, batches, segments, executables, hashes, columns):
+        """
+        :param batches: Batch names.
+        :param segments: (batch id, run, note, marker time) per run marker.
+        :param executables: Executable names by id.
+        :param hashes: Hashes by id.
+        :param columns: Dictionary of equally long arrays, one entry per record.
+        """
+        self.batches = batches
+        self.segments = segments
+        self.executables = executables
+        self.hashes = hashes
+        self.columns = columns
+        self.ids = {
+            "hash": {value: index for index, value in enumerate(hashes)},
+            "executable": {value: index for index, value in enumerate(executables)},
+            "batch": {value: index for index, value in enumerate(batches)},
+        }
+
+        segment_batch = np.array([segment[0] for segment in segments] or [0], dtype=np.int32)
+        segment_run = np.array([segment[1] for segment in segments] or [0], dtype=np.int32)
+        self.batch = segment_batch[columns["segment"]]
+        self.run = segment_run[columns["segment"]]
+
+        # Indexes: row ids sorted by key, searchsorted finds the slice of one key or range
+        self.hash_order = np.argsort(columns["hash"], kind="stable")
+        self.run_order = np.argsort(self.run, kind="stable")
+        self.time_order = np.argsort(columns["last_run"], kind="stable")
+
+
+    def __len__(self):
+        return len(self.columns["segment"])
+
+
+    def _slice(self, order, keys, low, high=None):
+        sorted_keys = keys[order]
+        start = np.searchsorted(sorted_keys, low, side="left")
+        end = np.searchsorted(sorted_keys, low if high is None else high, side="right")
+        return order[start:end]
+
+
+    def select(self, run=None, hash_value=None, executable=None, batch=None, start=None, end=None):
+        """
+        Row ids of the matching records in log order.
+
+        :param run: (Optional) Run number (marker ### RUN n ###).
+        :param hash_value: (Optional) Prefetch hash, e.g. "AED7BA3D".
+        :param executable: (Optional) Executable name, e.g. "CHROME.EXE".
+        :param batch: (Optional) Batch (log) name.
+        :param start: (Optional) Earliest Last Run, "YYYY-MM-DD HH:MM:SS".
+        :param end: (Optional) Latest Last Run.
+        """
+        columns = self.columns
+        lookups = {}
+        for key, value in (("hash", hash_value), ("executable", executable), ("batch", batch)):
+            if value is None:
+                continue
+            if value not in self.ids[key]:
+                return np.array([], dtype=np.int64)
+            lookups[key] = self.ids[key][value]
+
+        # Candidates from the most selective index, remaining conditions as masks
+        if hash_value is not None:
+            rows = self._slice(self.hash_order, columns["hash"], lookups["hash"])
+        elif run is not None:
+            rows = self._slice(self.run_order, self.run, run)
+        elif start is not None or end is not None:
+            low = np.datetime64(start, "s") if start else np.datetime64("0001-01-01T00:00:00")
+            high = np.datetime64(end, "s") if end else np.datetime64("9999-12-31T23:59:59")
+            rows = self._slice(self.time_order, columns["last_run"], low, high)
+        else:
+            rows = np.arange(len(self))
+
+        mask = np.ones(len(rows), dtype=bool)
+        if run is not None:
+            mask &= self.run[rows] == run
+        for key, value_id in lookups.items():
+            mask &= (self.batch[rows] if key == "batch" else columns[key][rows]) == value_id
+        if start is not None:
+            mask &= columns["last_run"][rows] >= np.datetime64(start, "s")
+        if end is not None:
+            mask &= columns["last_run"][rows] <= np.datetime64(end, "s")
+        return np.sort(rows[mask])
+
+
+    def records(self, rows):
+        """
+        Returns the rows as dictionaries: batch, run, note, logged, executable, hash, last_run,
+        run_count, dir_count, file_count (None when unknown) and marked.
+        """
+        columns = self.columns
+        logged = np.datetime_as_string(columns["logged"][rows], unit="s")
+        last_run = np.datetime_as_string(columns["last_run"][rows], unit="s")
+        result = []
+        for index, row in enumerate(rows.tolist()):
+            batch_id, run, note, _ = self.segments[columns["segment"][row]]
+            result.append({
+                "batch": self.batches[batch_id],
+                "run": run,
+                "note": note,
+                "logged": None if logged[index] == "NaT" else logged[index].replace("T", " "),
+                "executable": self.executables[columns["executable"][row]],
+                "hash": self.hashes[columns["hash"][row]],
+                "last_run": None if last_run[index] == "NaT" else last_run[index].replace("T", " "),
+                **{
+                    name: None if columns[name][row] == UNKNOWN else int(columns[name][row])
+                    for name in ("run_count", "dir_count", "file_count")
+                },
+                "marked": bool(columns["marked"][row]),
+            })
+        return result
+
+
+    def runs(self):
+        """
+        Returns (batch, run, note, marker time, records) per run marker in log order.
+        """
+        counts = np.bincount(self.columns["segment"], minlength=len(self.segments))
+        return [
+            (self.batches[batch_id], run, note, None if logged == "NaT" else logged, int(count))
+            for (batch_id, run, note, logged), count in zip(self.segments, counts.tolist())
+        ]
+
+
+
+
+def ingest(paths):
+    """
+    Reads all logs of the paths (files, globs, rotated copies) and returns the LogTable.
+    """
+    started = time.perf_counter()
+    builder = LogIngest()
+    for batch, path in expand_logs(paths):
+        builder.add_log(batch, path)
+    table = builder.build()
+    logging.info(f"Ingested {builder.lines} log lines, {len(table)} records of {len(table.segments)} runs in {time.perf_counter() - started:.2f} seconds")
+    return table
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query PECmd_looper result logs without re-running PECmd")
+    parser.add_argument("logs", nargs="+", help="Log files or glob patterns, rotated copies (.1, .2, .gz) are included")
+    parser.add_argument("--run", type=int, help="Only this run number")
+    parser.add_argument("--hash", help="Only this Prefetch hash")
+    parser.add_argument("--executable", help="Only this executable name")
+    parser.add_argument("--batch", help="Only this log (batch) name")
+    parser.add_argument("--since", help="Earliest Last Run, e.g. \"2025-01-24 21:50:00\"")
+    parser.add_argument("--until", help="Latest Last Run")
+    parser.add_argument("--runs", action="store_true", help="List run markers instead of records")
+    parser.add_argument("--csv", help="Write the matching records to this CSV file instead of printing them")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    table = ingest(args.logs)
+    print(f"{len(table)} records, {len(table.segments)} runs in {len(table.batches)} logs ({time.perf_counter() - started:.2f}s)")
+
+    if args.runs:
+        for batch, run, note, logged, count in table.runs():
+            print(f"{batch} | RUN {run} {note} | {logged or 'no time'} | {count} records")
+        return
+
+    rows = table.select(args.run, args.hash, args.executable, args.batch, args.since, args.until)
+    records = table.records(rows)
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        print(f"{len(records)} records written to {args.csv}")
+        return
+
+    for record in records:
+        print(
+            f"{record['batch']} | RUN {record['run']} | {record['executable']}-{record['hash']} | "
+            f"Last Run: {record['last_run']} | Run Count: {record['run_count']}" + (" <-" if record["marked"] else "")
+        )
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,246 @@
+# Queued, batched logging for PECmd_looper.py.
+#
+# logging.basicConfig writes and flushes the log file for every record, from inside the per-file
+# loops (copy, analyze, extract, move, delete). With start() the root logger only puts records on a
+# queue, a background thread formats them and writes them in batches (one write per BATCH_SIZE
+# records or FLUSH_INTERVAL seconds), so a log call costs the same no matter how slow the disk is.
+# The lines in the log file are the same as with basicConfig (log_ingest.py reads both).
+#
+# Per-file lines (Copied/Moved/Deleted/Successfully processed ...) go through file_event(). With
+# detail "stage" they are neither logged nor printed, the loops log one summary line per stage
+# (stage_summary()) instead. Errors and the extracted records are always logged.
+#
+# stop() writes what is still queued and closes the file, it runs at exit (atexit) and in the
+# finally of PECmd_looper.main(), records logged before an error or Ctrl+C are not lost.
+
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import traceback
+from logging.handlers import QueueHandler
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+BATCH_SIZE = 512  # Records written with one write call
+FLUSH_INTERVAL = 1.0  # Seconds a record may wait in the queue before it is written
+DETAILS = ("file", "stage")
+
+# Logger of the per-file lines, its level can be changed on its own
+FILE_LOG = logging.getLogger("PECmd_looper.files")
+
+_STOP = object()
+_detail = "file"
+_active = None  # (QueueHandler, BatchWriter) after start()
+_registered = False
+
+
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are. QueueHandler formats and copies every record in the logging
+    thread, records here never leave the process, so only the arguments are merged into the message.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """
+    Formatter formatting the date and time once per second instead of for every record (same output).
+    """
+
+    def __init__(self, fmt=None, datefmt=None):
+        super().__init__(fmt, datefmt)
+        self.cached_second = None
+        self.cached_time = None
+
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        if second != self.cached_second:
+            self.cached_second = second
+            self.cached_time = time.strftime(self.default_time_format, self.converter(record.created))
+        return self.default_msec_format % (self.cached_time, record.msecs)
+
+
+
+
+class BatchWriter(threading.Thread):
+    """
+    Background thread writing queued log records into the log file in batches.
+    """
+
+    def __init__(self, log_file, formatter, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        """
+        :param log_file: Log file, records are appended.
+        :param formatter: logging.Formatter of the lines.
+        :param batch_size: (Optional) Records written with one write call.
+        :param flush_interval: (Optional) Max seconds between a record being queued and written.
+        """
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = queue.SimpleQueue()
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stream = open(log_file, "a")  # Same encoding as logging.FileHandler
+
+
+    def run(self):
+        pending = []
+        deadline = None
+        stopping = False
+
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            # Take everything already queued, up to one batch
+            while record is not None:
+                if record is _STOP:
+                    stopping = True
+                    break
+                line = self.format(record)
+                if line is not None:
+                    pending.append(line)
+                if len(pending) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    record = None
+
+            if pending and deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if pending and (stopping or len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self.write(pending)
+                pending = []
+                deadline = None
+
+        self.stream.close()
+
+
+    def format(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception:
+            traceback.print_exc(file=sys.stderr)  # Like logging.Handler.handleError, one bad record does not stop the writer
+            return None
+
+
+    def write(self, lines):
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except OSError:
+            traceback.print_exc(file=sys.stderr)
+
+
+    def stop(self):
+        """
+        Writes the queued records and waits for the thread to finish.
+        """
+        self.queue.put(_STOP)
+        self.join()
+
+
+
+
+def start(log_file, fmt=LOG_FORMAT, level=logging.INFO, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+    """
+    Sends all records of the root logger through a queue to a BatchWriter (instead of logging.basicConfig).
+    A writer started before is stopped first.
+
+    :param log_file: Log file, records are appended.
+    :param fmt: (Optional) Format of the lines.
+    :param level: (Optional) Level of the root logger.
+    :param batch_size: (Optional) Records written with one write call.
+    :param flush_interval: (Optional) Max seconds between a record being logged and written.
+    """
+    global _active, _registered
+
+    stop()
+    writer = BatchWriter(log_file, CachedTimeFormatter(fmt), batch_size, flush_interval)
+    writer.start()
+    handler = RecordQueueHandler(writer.queue)
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    _active = (handler, writer)
+
+    if not _registered:
+        atexit.register(stop)
+        _registered = True
+    return writer
+
+
+
+
+def stop():
+    """
+    Writes the queued records, closes the log file and removes the queue handler. Safe to call more than once.
+    """
+    global _active
+
+    if _active is None:
+        return
+    handler, writer = _active
+    _active = None
+    logging.getLogger().removeHandler(handler)
+    writer.stop()
+
+
+
+
+def set_detail(detail):
+    """
+    :param detail: "file" - one log line (and printed line) per file, "stage" - only summaries per stage.
+    """
+    global _detail
+
+    if detail not in DETAILS:
+        raise ValueError(f"Unknown log detail: {detail}")
+    _detail = detail
+    FILE_LOG.setLevel(logging.WARNING if detail == "stage" else logging.NOTSET)
+
+
+
+
+def file_event(message, console=None):
+    """
+    Logs one per-file line and prints console, both left out with detail "stage".
+
+    :param message: Log message, e.g. "Moved: {path} -> {run_folder}".
+    :param console: (Optional) Line printed to the terminal.
+    """
+    if _detail == "stage":
+        return
+    FILE_LOG.info(message)
+    if console is not None:
+        print(console)
+
+
+
+
+def stage_summary(message):
+    """
+    Logs and prints a summary of a per-file loop when per-file lines are left out (detail "stage").
+    """
+    if _detail != "stage":
+        return
+    logging.info(message)
+    print(message)
@@ -0,0 +1,266 @@
+# Per-stage metrics for PECmd_looper.py.
+#
+# Stages and per-file operations record counters (files scanned, bytes copied, ...) and
+# timings (subprocess time, JSON decode time, ...) into the current recorder. Every stage
+# writes one JSON line with its duration, counters and timing histograms, every run ends
+# with a summary line. One JSONL file is written per run. A single stage can be profiled
+# with cProfile or tracemalloc.
+#
+# Recording is always on (cheap), the JSONL stream only when a folder was given to start_run().
+
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from datetime import datetime
+from collections import defaultdict
+
+PROFILE_MODES = ("cprofile", "tracemalloc")
+
+
+
+
+def summarize(values):
+    """
+    Histogram summary of observed values: count, sum, min, p50, p95, max.
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        "count": len(ordered),
+        "sum": sum(ordered),
+        "min": ordered[0],
+        "p50": ordered[min(last, int(0.50 * len(ordered)))],
+        "p95": ordered[min(last, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+
+
+
+class MetricsRecorder:
+    """
+    Counters and histograms of one run, written as JSONL events.
+    """
+
+    def __init__(self, folder=None, run=0, profile_stage=None, profile_mode="cprofile"):
+        """
+        :param folder: (Optional) Folder for metrics_{time}_run{run}.jsonl and profiles, None - no stream.
+        :param run: Run number written into every event.
+        :param profile_stage: (Optional) Name of the stage to profile.
+        :param profile_mode: (Optional) "cprofile" or "tracemalloc".
+        """
+        if profile_mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {profile_mode}")
+
+        self.folder = folder
+        self.run = run
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.lock = threading.Lock()  # Analyze workers record from threads
+
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(list)
+        self.stage_counters = None
+        self.stage_histograms = None
+        self.started = time.perf_counter()
+
+        self.stages = 0
+        self.stream = None
+        self.path = None
+        if folder:
+            self.path = os.path.join(folder, f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}_run{run}.jsonl")
+
+
+    def emit(self, event):
+        if self.path:
+            if self.stream is None:  # Opened on the first event, runs without stages leave no file
+                os.makedirs(self.folder, exist_ok=True)
+                self.stream = open(self.path, "a", encoding="utf-8")
+            event = {"time": datetime.now().isoformat(timespec="milliseconds"), "run": self.run, **event}
+            self.stream.write(json.dumps(event) + "\n")
+            self.stream.flush()
+
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+            if self.stage_counters is not None:
+                self.stage_counters[name] += value
+
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].append(value)
+            if self.stage_histograms is not None:
+                self.stage_histograms[name].append(value)
+
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Observes the duration of the block in seconds under name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+
+    @contextlib.contextmanager
+    def stage(self, name, description=None):
+        """
+        Times one stage, logs start and end and emits a stage event with the counters
+        and histograms recorded during the stage.
+
+        :param name: Short stage name, e.g. "copy".
+        :param description: (Optional) Log message, e.g. "Fetching Prefetch files".
+        """
+        description = description or name
+        logging.info(f"{description}...")
+
+        with self.lock:
+            self.stage_counters = defaultdict(int)
+            self.stage_histograms = defaultdict(list)
+
+        profiler = None
+        if name == self.profile_stage:
+            profiler = self._start_profile()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            event = {"event": "stage", "stage": name, "seconds": seconds}
+            if profiler is not None:
+                event["profile"] = self._stop_profile(name, profiler)
+
+            with self.lock:
+                event["counters"] = dict(self.stage_counters)
+                event["histograms"] = {key: summarize(values) for key, values in self.stage_histograms.items()}
+                self.stage_counters = None
+                self.stage_histograms = None
+            self.observe(f"stage_{name}_seconds", seconds)
+            self.stages += 1
+
+            self.emit(event)
+            logging.info(f"{description} completed in {seconds:.2f} seconds...")
+
+
+    def _start_profile(self):
+        import cProfile  # Profilers are only loaded when a stage is profiled
+        import tracemalloc
+
+        if self.profile_mode == "tracemalloc":
+            tracemalloc.start(10)
+            return tracemalloc
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+
+    def _stop_profile(self, name, profiler):
+        """
+        Stops profiling of the stage, logs the top entries and returns a profile summary.
+        """
+        import pstats
+        import tracemalloc
+
+        if profiler is tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            for stat in top:
+                logging.info(f"tracemalloc {name}: {stat}")
+            return {"mode": "tracemalloc", "peak_bytes": peak, "top": [str(stat) for stat in top]}
+
+        profiler.disable()
+        summary = {"mode": "cprofile"}
+        if self.folder:
+            os.makedirs(self.folder, exist_ok=True)
+            summary["file"] = os.path.join(self.folder, f"profile_{name}_run{self.run}.prof")
+            profiler.dump_stats(summary["file"])
+
+        stats = pstats.Stats(profiler)
+        top = []
+        for (file_name, line, function), (_, calls, _, cumulative, _) in list(stats.stats.items()):
+            top.append((cumulative, calls, f"{file_name}:{line}({function})"))
+        top = sorted(top, reverse=True)[:15]
+        for cumulative, calls, function in top:
+            logging.info(f"cProfile {name}: {cumulative:.3f}s {calls} calls {function}")
+        summary["top"] = [{"function": function, "calls": calls, "cumulative": cumulative} for cumulative, calls, function in top]
+        return summary
+
+
+    def close(self):
+        """
+        Emits the run summary and closes the stream.
+        """
+        if not self.stages:
+            return
+        with self.lock:
+            event = {
+                "event": "run",
+                "seconds": time.perf_counter() - self.started,
+                "counters": dict(self.counters),
+                "histograms": {key: summarize(values) for key, values in self.histograms.items()},
+            }
+        self.emit(event)
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+            logging.info(f"Metrics written to {self.path}")
+
+
+
+
+_recorder = MetricsRecorder()
+
+
+
+
+def start_run(folder=None, run=0, profile_stage=None, profile_mode="cprofile"):
+    """
+    Closes the current recorder and starts recording a new run, returns the new recorder.
+    Parameters are the same as MetricsRecorder.
+    """
+    global _recorder
+    _recorder.close()
+    _recorder = MetricsRecorder(folder, run, profile_stage, profile_mode)
+    return _recorder
+
+
+def current():
+    """
+    Returns the recorder of the current run.
+    """
+    return _recorder
+
+
+def end_run():
+    """
+    Writes the summary of the current run, recording goes on without a stream.
+    """
+    start_run()
+
+
+def count(name, value=1):
+    _recorder.count(name, value)
+
+
+def observe(name, value):
+    _recorder.observe(name, value)
+
+
+def timer(name):
+    return _recorder.timer(name)
+
+
+def stage(name, description=None):
+    return _recorder.stage(name, description)
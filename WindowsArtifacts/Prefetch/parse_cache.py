@@ -0,0 +1,184 @@
+# Persistent parse cache for PECmd_looper.py.
+#
+# Parsed records are stored on disk by SHA-256 digest of the .pf content, so an unchanged
+# Prefetch file is never parsed twice. Files with the same path, size and mtime as
+# last time reuse the known digest without reading the file.
+#
+# Layout:
+#   <cache_folder>/index.json                     - version key, path fast path, entry sizes/last use
+#   <cache_folder>/objects/<digest[:2]>/<digest>.json - parsed record
+
+import os
+import json
+import time
+import hashlib
+import logging
+
+
+
+
+def file_digest(file_path):
+    """
+    Returns the SHA-256 hex digest of the file content.
+
+    :param file_path: File to hash.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+
+
+class ParseCache:
+    """
+    Content addressed cache of parsed Prefetch records with size based (least recently used) eviction.
+    The whole cache is dropped when version_key changes (other parser or PECmd version).
+    """
+
+    def __init__(self, cache_folder, version_key, max_bytes=256 * 1024 * 1024):
+        """
+        :param cache_folder: Folder where the cache is kept.
+        :param version_key: Identifies the parser producing the records, e.g. analyze_pool backend version_key().
+        :param max_bytes: (Optional) Maximum size of stored records.
+        """
+        self.cache_folder = cache_folder
+        self.version_key = version_key
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_folder, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        self.paths = {}    # file path -> [size, mtime_ns, digest]
+        self.entries = {}  # digest -> [record size, last use]
+        self._load_index()
+
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Parse cache index unreadable, starting empty: {e}")
+            return
+
+        if index.get("version") != self.version_key:
+            logging.info("Parse cache version changed, dropping cached records.")
+            for digest in index.get("entries", {}):
+                self._remove_object(digest)
+            return
+
+        self.paths = index.get("paths", {})
+        self.entries = index.get("entries", {})
+
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_folder, "objects", digest[:2], digest + ".json")
+
+
+    def _remove_object(self, digest):
+        try:
+            os.remove(self._object_path(digest))
+        except OSError:
+            pass
+
+
+    def _digest(self, file_path):
+        """
+        Returns the content digest, from the path/size/mtime fast path when the file did not change.
+        """
+        stat = os.stat(file_path)
+        known = self.paths.get(file_path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = file_digest(file_path)
+        self.paths[file_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+    def get(self, file_path):
+        """
+        Returns the cached record for the file or None when the content was not parsed before.
+
+        :param file_path: Prefetch file.
+        """
+        try:
+            digest = self._digest(file_path)
+        except OSError:
+            digest = None  # Deleted or being rewritten since it was listed, parsed (and reported) as usual
+        if digest in self.entries:
+            try:
+                with open(self._object_path(digest), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                self.entries[digest][1] = time.time()
+                self.hits += 1
+                return record
+            except (json.JSONDecodeError, OSError):
+                del self.entries[digest]
+
+        self.misses += 1
+        return None
+
+
+    def put(self, file_path, record):
+        """
+        Stores the parsed record of the file.
+
+        :param file_path: Prefetch file the record was parsed from.
+        :param record: Parsed record (PECmd JSON content or prefetch_parser record).
+        """
+        try:
+            digest = self._digest(file_path)
+        except OSError as e:
+            logging.warning(f"Not cached, {file_path} is gone: {e}")
+            return
+        object_path = self._object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+        data = json.dumps(record)
+        with open(object_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(object_path + ".tmp", object_path)
+        self.entries[digest] = [len(data), time.time()]
+
+
+    def _evict(self):
+        total = sum(size for size, _ in self.entries.values())
+        if total <= self.max_bytes:
+            return
+
+        for digest, (size, _) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            self._remove_object(digest)
+            del self.entries[digest]
+            self.evicted += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+    def save(self):
+        """
+        Evicts records over max_bytes and writes the index.
+        """
+        self._evict()
+        # Forget fast path entries pointing to evicted or never stored records
+        self.paths = {path: known for path, known in self.paths.items() if known[2] in self.entries}
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        index = {"version": self.version_key, "paths": self.paths, "entries": self.entries}
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+
+    def log_stats(self):
+        """
+        Writes hit/miss/eviction counters into the log.
+        """
+        logging.info(f"Parse cache: {self.hits} hits, {self.misses} misses, {self.evicted} evicted, {len(self.entries)} records stored.")
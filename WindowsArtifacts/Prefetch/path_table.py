@@ -0,0 +1,149 @@
+# Compact in-memory representation of Prefetch records.
+#
+# Directories/FilesLoaded paths such as \VOLUME{...}\WINDOWS\SYSTEM32\NTDLL.DLL repeat across
+# thousands of records. Every distinct path is stored once in a PathTable and gets an integer
+# ID, a record keeps its paths as array('I') of IDs (4 bytes per entry instead of a list of
+# string references). Comparisons are set operations on integers, strings are only resolved
+# for output.
+
+import json
+import logging
+from array import array
+
+import json_stream
+
+LIST_FIELDS = ("Directories", "FilesLoaded")
+ID_TYPECODE = "I"  # Unsigned 32-bit on all supported platforms
+
+
+
+
+class PathTable:
+    """
+    Maps path strings to consecutive integer IDs and back.
+    Instances are callable, so they can be passed as intern function to json_stream.iter_records.
+    """
+    __slots__ = ("ids", "paths")
+
+    def __init__(self):
+        self.ids = {}
+        self.paths = []
+
+
+    def __len__(self):
+        return len(self.paths)
+
+
+    def __call__(self, path):
+        path_id = self.ids.get(path)
+        if path_id is None:
+            path_id = self.ids[path] = len(self.paths)
+            self.paths.append(path)
+        return path_id
+
+
+    def path(self, path_id):
+        return self.paths[path_id]
+
+
+    def resolve(self, path_ids):
+        """
+        Returns the paths of the IDs, sorted by path.
+        """
+        paths = self.paths
+        return sorted(paths[path_id] for path_id in path_ids)
+
+
+
+
+# Table shared by everything loaded in this process
+PATHS = PathTable()
+
+
+
+
+class PrefetchEntry:
+    """
+    One Prefetch record with Directories and FilesLoaded as arrays of PathTable IDs in stored order.
+    """
+    __slots__ = ("executable", "hash", "run_count", "last_run", "directories", "files_loaded")
+
+    def __init__(self, executable, hash_value, run_count=None, last_run=None, directories=(), files_loaded=()):
+        self.executable = executable
+        self.hash = hash_value
+        self.run_count = run_count
+        self.last_run = last_run
+        self.directories = array(ID_TYPECODE, directories)
+        self.files_loaded = array(ID_TYPECODE, files_loaded)
+
+
+    @property
+    def name(self):
+        return f"{self.executable}-{self.hash}"
+
+
+    @classmethod
+    def from_record(cls, record, table=PATHS):
+        """
+        Builds an entry from a PECmd-style record. List fields may be ", " joined strings, lists of
+        paths or lists of IDs already interned into table (json_stream.iter_records with intern=table).
+        """
+        lists = []
+        for field in LIST_FIELDS:
+            value = record.get(field) or ()
+            if isinstance(value, str):
+                value = json_stream.split_entries(value)
+            lists.append([entry if isinstance(entry, int) else table(entry) for entry in value])
+
+        return cls(
+            record.get("ExecutableName", "Unknown"),
+            record.get("Hash", "NoHash"),
+            record.get("RunCount"),
+            record.get("LastRun"),
+            *lists,
+        )
+
+
+    def ids(self, field):
+        """
+        ID array of "Directories" or "FilesLoaded".
+        """
+        return self.directories if field == "Directories" else self.files_loaded
+
+
+    def difference(self, other, field):
+        """
+        IDs of field present in this entry but not in other (None counts as empty).
+        """
+        if other is None:
+            return set(self.ids(field))
+        return set(self.ids(field)).difference(other.ids(field))
+
+
+
+
+def load_entries(json_file, table=PATHS):
+    """
+    Yields a PrefetchEntry for every record of a PECmd JSON (or JSONL) file, paths are interned while streaming.
+
+    :param json_file: PECmd output file.
+    :param table: (Optional) PathTable, the process wide table by default.
+    """
+    for record in json_stream.iter_records(json_file, ("ExecutableName", "Hash", "RunCount", "LastRun"), list_keys=LIST_FIELDS, intern=table):
+        yield PrefetchEntry.from_record(record, table)
+
+
+
+
+def load_files(json_files, table=PATHS):
+    """
+    Loads all records of the files into {"ExecutableName-Hash": PrefetchEntry}, unreadable files are logged and skipped.
+    """
+    entries = {}
+    for json_file in json_files:
+        try:
+            for entry in load_entries(json_file, table):
+                entries[entry.name] = entry
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Error reading {json_file}: {e}")
+    return entries
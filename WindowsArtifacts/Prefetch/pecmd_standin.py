@@ -0,0 +1,51 @@
+# Local stand-in for PECmd.exe used to run and measure the analyze stage without Windows.
+# Accepts the PECmd arguments used by cmd_template in PECmd_looper.py and writes the same
+# JSON fields using prefetch_parser.
+#
+# Example command template:
+#   python pecmd_standin.py -f "{}" --json /tmp/Prefetch --jsonf /tmp/Prefetch/{}.json
+#
+# --delay emulates PECmd.exe (.NET) startup time.
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import prefetch_parser
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PECmd.exe stand-in")
+    parser.add_argument("-f", dest="file", required=True, help="Prefetch file to parse")
+    parser.add_argument("--json", dest="json_dir", help="Folder for JSON output")
+    parser.add_argument("--jsonf", dest="json_file", help="JSON output file name")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to sleep before parsing")
+    args = parser.parse_args()
+
+    if args.delay:
+        time.sleep(args.delay)
+
+    try:
+        record = prefetch_parser.parse_prefetch(args.file)
+    except (prefetch_parser.PrefetchParseError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    json_file = args.json_file or os.path.splitext(os.path.basename(args.file))[0] + ".json"
+    if args.json_dir and not os.path.dirname(json_file):
+        json_file = os.path.join(args.json_dir, json_file)
+
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    return 0
+
+
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
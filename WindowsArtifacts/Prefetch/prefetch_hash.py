@@ -0,0 +1,328 @@
+# Prefetch file name hash of an executable path.
+#
+# Windows names a Prefetch file EXECUTABLE-XXXXXXXX.pf, XXXXXXXX is a hash of the upper case
+# device path (\DEVICE\HARDDISKVOLUME2\WINDOWS\SYSTEM32\NOTEPAD.EXE) in UTF-16 little-endian:
+#   "xp"    - Windows XP / 2003 (SCCA version 17)
+#   "vista" - Windows Vista (version 23)
+#   "2008"  - Windows 7 / 2008 and later (versions 23, 26, 30, 31), same values as "vista"
+#             computed 8 bytes at a time
+# For hosting programs (svchost.exe, rundll32.exe, dllhost.exe, ...) Windows hashes the
+# command line too, it can be given as command_line.
+#
+# HashIndex maps hashes back to known executable paths, built from a path list or from
+# parsed records (Directories/FilesLoaded). Paths given with a drive letter or as PECmd
+# \VOLUME{...} need the device path of the volume: volume_map, learn_volume_map() from
+# records, or every \DEVICE\HARDDISKVOLUMEn up to DEFAULT_VOLUMES.
+#
+# Example:
+#   python prefetch_hash.py "C:\Windows\System32\notepad.exe" --volume C:=\DEVICE\HARDDISKVOLUME2
+#   python prefetch_hash.py --paths paths.txt --attribute C:\Testing\Prefetch
+
+import os
+import json
+import ntpath
+import argparse
+
+import json_stream
+
+DEFAULT_VOLUMES = 8  # \DEVICE\HARDDISKVOLUME1-8 are tried for paths without a mapped volume
+EXECUTABLE_NAME_LENGTH = 29  # Longer executable names are cut in Prefetch file names
+VARIANTS = ("xp", "vista", "2008")
+
+
+
+
+def hash_xp(data):
+    """
+    Windows XP / 2003 Prefetch hash of UTF-16LE bytes.
+    """
+    hash_value = 0
+    for character in data:
+        hash_value = (hash_value * 37 + character) % 0x100000000
+    hash_value = (hash_value * 314159269) % 0x100000000
+    if hash_value > 0x80000000:
+        hash_value = 0x100000000 - hash_value
+    return (abs(hash_value) % 1000000007) % 0x100000000
+
+
+def hash_vista(data):
+    """
+    Windows Vista Prefetch hash of UTF-16LE bytes.
+    """
+    hash_value = 314159
+    for character in data:
+        hash_value = (hash_value * 37 + character) % 0x100000000
+    return hash_value
+
+
+def hash_2008(data):
+    """
+    Windows 7 / 2008 and later Prefetch hash of UTF-16LE bytes, 8 bytes per step.
+    """
+    hash_value = 314159
+    index = 0
+    length = len(data)
+    while index + 8 < length:
+        value = data[index + 1] * 37 + data[index + 2]
+        value = value * 37 + data[index + 3]
+        value = value * 37 + data[index + 4]
+        value = value * 37 + data[index + 5]
+        value = value * 37 + data[index + 6]
+        value = value * 37 + data[index] * 442596621 + data[index + 7]
+        hash_value = (value - hash_value * 803794207) % 0x100000000
+        index += 8
+    while index < length:
+        hash_value = (hash_value * 37 + data[index]) % 0x100000000
+        index += 1
+    return hash_value
+
+
+HASH_FUNCTIONS = {"xp": hash_xp, "vista": hash_vista, "2008": hash_2008}
+
+
+
+
+def _volume_prefix(path):
+    """
+    Returns the volume part of a path ("C:" or "\\VOLUME{...}") or None for device paths.
+    """
+    if len(path) >= 2 and path[1] == ":":
+        return path[:2]
+    if path.startswith("\\VOLUME{"):
+        end = path.find("}")
+        return path[:end + 1] if end > 0 else None
+    return None
+
+
+def device_path(path, volume_map=None):
+    """
+    Upper case path with the volume replaced by its device path when volume_map has it.
+
+    :param path: Executable path, e.g. C:\\Windows\\notepad.exe or \\VOLUME{...}\\WINDOWS\\NOTEPAD.EXE.
+    :param volume_map: (Optional) {"C:" or "\\VOLUME{...}": "\\DEVICE\\HARDDISKVOLUMEn"}.
+    """
+    path = path.upper().replace("/", "\\")
+    prefix = _volume_prefix(path)
+    if prefix and volume_map:
+        for volume, device in volume_map.items():
+            if volume.upper().rstrip("\\") == prefix:
+                return device.upper().rstrip("\\") + path[len(prefix):]
+    return path
+
+
+def candidate_device_paths(path, volume_map=None, volumes=DEFAULT_VOLUMES):
+    """
+    Device paths the executable can have: the mapped one, or one per \\DEVICE\\HARDDISKVOLUMEn
+    when the volume of the path is not known.
+    """
+    path = device_path(path, volume_map)
+    prefix = _volume_prefix(path)
+    if prefix is None:
+        return [path]
+    return [f"\\DEVICE\\HARDDISKVOLUME{number}{path[len(prefix):]}" for number in range(1, volumes + 1)]
+
+
+
+
+def prefetch_hash(path, variant="2008", volume_map=None, command_line=None):
+    """
+    Returns the hash of the Prefetch file name as 8 upper case hex digits.
+
+    :param path: Device path, or a path whose volume is in volume_map.
+    :param variant: (Optional) "xp", "vista" or "2008".
+    :param volume_map: (Optional) Volume to device path mapping, see device_path.
+    :param command_line: (Optional) Command line of hosting programs, appended to the path.
+    """
+    data = (device_path(path, volume_map) + (command_line or "")).encode("utf-16-le")
+    return f"{HASH_FUNCTIONS[variant](data):08X}"
+
+
+def prefetch_name(path, variant="2008", volume_map=None, command_line=None):
+    """
+    Returns the Prefetch file name, e.g. NOTEPAD.EXE-D8414F97.pf.
+    """
+    executable = ntpath.basename(path.replace("/", "\\")).upper()[:EXECUTABLE_NAME_LENGTH]
+    return f"{executable}-{prefetch_hash(path, variant, volume_map, command_line)}.pf"
+
+
+def candidate_names(paths, volume_map=None, variants=VARIANTS, volumes=DEFAULT_VOLUMES):
+    """
+    Returns every Prefetch file name the executables can have (all variants and candidate volumes),
+    used to select exact files instead of all files with the executable's prefix.
+
+    :param paths: Executable paths.
+    """
+    names = set()
+    for path in paths:
+        for candidate in candidate_device_paths(path, volume_map, volumes):
+            for variant in dict.fromkeys("2008" if variant == "vista" else variant for variant in variants):
+                names.add(prefetch_name(candidate, variant))
+    return sorted(names)
+
+
+
+
+def _list_field(record, field):
+    value = record.get(field) or ()
+    return json_stream.split_entries(value) if isinstance(value, str) else list(value)
+
+
+def learn_volume_map(records, volumes=DEFAULT_VOLUMES):
+    """
+    Finds the device path of \\VOLUME{...} prefixes (PECmd output) by hashing the executable's
+    FilesLoaded path on every candidate volume until it matches the record's Hash.
+
+    :param records: PECmd-style records with ExecutableName, Hash and FilesLoaded.
+    :return: {"\\VOLUME{...}": "\\DEVICE\\HARDDISKVOLUMEn"}
+    """
+    volume_map = {}
+    for record in records:
+        executable = "\\" + str(record.get("ExecutableName", "")).upper()
+        hash_value = str(record.get("Hash", "")).upper()
+        for path in _list_field(record, "FilesLoaded"):
+            path = path.strip().upper()
+            prefix = _volume_prefix(path)
+            if not path.endswith(executable) or prefix is None or prefix in volume_map:
+                continue
+            for candidate in candidate_device_paths(path, None, volumes):
+                if hash_value in (prefetch_hash(candidate, "2008"), prefetch_hash(candidate, "xp")):
+                    volume_map[prefix] = candidate[:len(candidate) - len(path) + len(prefix)]
+                    break
+    return volume_map
+
+
+
+
+class HashIndex:
+    """
+    Prefetch hash -> known executable device paths.
+    """
+
+    def __init__(self, variants=VARIANTS):
+        """
+        :param variants: (Optional) Hash variants computed for every path.
+        """
+        self.variants = tuple(dict.fromkeys("2008" if variant == "vista" else variant for variant in variants))
+        self.paths = {}  # hash -> set of device paths
+
+
+    def __len__(self):
+        return len(self.paths)
+
+
+    def add(self, path, volume_map=None, volumes=DEFAULT_VOLUMES, command_line=None):
+        """
+        Adds one executable path on its mapped volume, or on every candidate volume.
+        """
+        for candidate in candidate_device_paths(path, volume_map, volumes):
+            for variant in self.variants:
+                self.paths.setdefault(prefetch_hash(candidate, variant, command_line=command_line), set()).add(candidate)
+
+
+    def add_records(self, records, volume_map=None, volumes=DEFAULT_VOLUMES):
+        """
+        Adds the executable of every record in each of its Directories plus matching FilesLoaded paths.
+
+        :param records: PECmd-style records (ExecutableName, Directories, FilesLoaded).
+        :param volume_map: (Optional) Known volumes, e.g. from learn_volume_map.
+        """
+        for record in records:
+            executable = str(record.get("ExecutableName", "")).upper()
+            if not executable:
+                continue
+            paths = {f"{directory.strip()}\\{executable}" for directory in _list_field(record, "Directories") if directory.strip()}
+            paths.update(path.strip() for path in _list_field(record, "FilesLoaded") if path.strip().upper().endswith("\\" + executable))
+            for path in paths:
+                self.add(path, volume_map, volumes)
+
+
+    def lookup(self, hash_value):
+        """
+        Known device paths of a hash, sorted (empty when unknown).
+        """
+        return sorted(self.paths.get(hash_value.upper(), ()))
+
+
+    def attribute(self, hashes):
+        """
+        Returns {hash: paths} for all known hashes of the iterable, unknown hashes are left out.
+        """
+        return {hash_value: self.lookup(hash_value) for hash_value in hashes if hash_value.upper() in self.paths}
+
+
+    def save(self, index_path):
+        with open(index_path, "w", encoding="utf-8") as f:
+            json.dump({"variants": self.variants, "paths": {key: sorted(value) for key, value in self.paths.items()}}, f)
+
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["variants"])
+        index.paths = {key: set(value) for key, value in data["paths"].items()}
+        return index
+
+
+
+
+def file_hash(file_name):
+    """
+    Hash part of a Prefetch or PECmd output file name (NOTEPAD.EXE-D8414F97.pf -> D8414F97), None if there is none.
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    _, _, hash_value = stem.rpartition("-")
+    return hash_value.upper() if len(hash_value) == 8 else None
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch file names of executable paths and attribution of unknown hashes")
+    parser.add_argument("executables", nargs="*", help="Executable paths, e.g. C:\\Windows\\System32\\notepad.exe")
+    parser.add_argument("--volume", action="append", default=[], help="Volume mapping, e.g. C:=\\DEVICE\\HARDDISKVOLUME2 (repeatable)")
+    parser.add_argument("--command-line", help="Command line of a hosting program (svchost.exe, rundll32.exe, ...)")
+    parser.add_argument("--paths", help="File with one executable path per line for the index")
+    parser.add_argument("--records", help="PECmd JSON output folder, record paths are added to the index")
+    parser.add_argument("--attribute", help="Folder with .pf/.json files whose hashes are looked up in the index")
+    args = parser.parse_args()
+
+    volume_map = dict(mapping.split("=", 1) for mapping in args.volume)
+    for path in args.executables:
+        for variant in VARIANTS:
+            if args.command_line or _volume_prefix(device_path(path, volume_map)) is None:
+                print(f"{variant:5} {prefetch_name(path, variant, volume_map, args.command_line)}")
+            else:
+                print(f"{variant:5} {', '.join(prefetch_name(candidate, variant) for candidate in candidate_device_paths(path, volume_map))}")
+
+    if not args.attribute:
+        return
+
+    index = HashIndex()
+    for path in args.executables:
+        index.add(path, volume_map, command_line=args.command_line)
+    if args.paths:
+        with open(args.paths, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    index.add(line.strip(), volume_map)
+    if args.records:
+        records = []
+        for name in sorted(os.listdir(args.records)):
+            if name.lower().endswith(".json"):
+                records.extend(json_stream.iter_records(os.path.join(args.records, name), ("ExecutableName", "Hash"), list_keys=("Directories", "FilesLoaded")))
+        volume_map = {**learn_volume_map(records), **volume_map}
+        index.add_records(records, volume_map)
+
+    hashes = sorted({file_hash(name) for name in os.listdir(args.attribute)} - {None})
+    attributed = index.attribute(hashes)
+    for hash_value in hashes:
+        print(f"{hash_value}: {', '.join(attributed.get(hash_value, ())) or 'unknown'}")
+    print(f"{len(attributed)} of {len(hashes)} hashes attributed, index of {len(index)} hashes")
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,588 @@
+# Pure Python parser for Microsoft Windows Prefetch (.pf) files.
+# Handles SCCA format versions 17 (XP/2003), 23 (Vista/7), 26 (8/8.1) and 30/31 (10/11),
+# including MAM (Xpress Huffman) compressed files written by Windows 10 and newer.
+#
+# Output mirrors the fields of PECmd JSON output (ExecutableName, Hash, LastRun, PreviousRun0-6,
+# RunCount, Directories, FilesLoaded, ...) so results can be used without running PECmd.exe.
+#
+# Format references:
+# https://github.com/libyal/libscca/blob/main/documentation/Windows%20Prefetch%20File%20(PF)%20format.asciidoc
+# https://learn.microsoft.com/en-us/openspecs/windows_protocols/ms-xca/
+
+import os
+import mmap
+import struct
+import functools
+from datetime import datetime, timedelta, timezone
+
+PARSER_VERSION = "1"
+
+SCCA_SIGNATURE = b"SCCA"
+MAM_SIGNATURE = b"MAM"
+
+VERSION_NAMES = {
+    17: "WinXpOrWin2K3",
+    23: "VistaOr7",
+    26: "Windows8",
+    30: "Windows10OrWindows11",
+    31: "Windows11",
+}
+
+# Size of one file metrics entry and one volume information entry per format version
+METRICS_ENTRY_SIZE = {17: 20, 23: 32, 26: 32, 30: 32, 31: 32}
+VOLUME_ENTRY_SIZE = {17: 40, 23: 104, 26: 104, 30: 96, 31: 96}
+TRACE_CHAIN_ENTRY_SIZE = {17: 12, 23: 12, 26: 12, 30: 8, 31: 8}
+
+# Header and file information up to the run count of every format version
+HEADER_SIZE = 212
+
+FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class PrefetchParseError(Exception):
+    """
+    Raised when a file is not a Prefetch file or its structure is damaged.
+    """
+
+
+
+
+def filetime_to_str(filetime):
+    """
+    Converts a Windows FILETIME value (100ns intervals since 1601-01-01 UTC) to the
+    "YYYY-MM-DD HH:MM:SS" format used by PECmd. Returns an empty string for empty values.
+
+    :param filetime: FILETIME as integer.
+    """
+    if not filetime:
+        return ""
+    try:
+        return (FILETIME_EPOCH + timedelta(microseconds=filetime // 10)).strftime(TIME_FORMAT)
+    except OverflowError:
+        return ""
+
+
+
+
+def _build_decoding_table(table_bytes):
+    """
+    Builds the 2^15 entry Huffman decoding table for one Xpress Huffman chunk.
+    Every entry holds (symbol << 4) | code_length.
+
+    :param table_bytes: 256 bytes holding 512 4-bit code lengths.
+    """
+    lengths = []
+    for byte in table_bytes:
+        lengths.append(byte & 0x0F)
+        lengths.append(byte >> 4)
+
+    table = []
+    for bit_length in range(1, 16):
+        entry = bit_length
+        count = 1 << (15 - bit_length)
+        for symbol, symbol_length in enumerate(lengths):
+            if symbol_length == bit_length:
+                table.extend([(symbol << 4) | entry] * count)
+
+    if len(table) > 1 << 15:
+        raise PrefetchParseError("Invalid Huffman table: too many codes")
+    if len(table) < 1 << 15:
+        # Incomplete code, unused entries can never be decoded from valid input
+        table.extend([0] * ((1 << 15) - len(table)))
+    return table
+
+
+
+
+def xpress_huffman_decompress(data, output_size, limit=None):
+    """
+    Decompresses LZ77 + Huffman (Xpress Huffman) data as described in MS-XCA 2.2.4.
+
+    :param data: Compressed bytes.
+    :param output_size: Size of the decompressed data.
+    :param limit: (Optional) Stop once this many bytes are decompressed.
+    """
+    data = bytes(data)
+    input_size = len(data)
+    output = bytearray()
+    output_size = output_size if limit is None else min(output_size, limit)
+    position = 0
+
+    def read16(offset):
+        if offset + 2 <= input_size:
+            return data[offset] | (data[offset + 1] << 8)
+        return data[offset] if offset < input_size else 0
+
+    while len(output) < output_size:
+        if position + 256 > input_size:
+            raise PrefetchParseError("Truncated Xpress Huffman data")
+
+        table = _build_decoding_table(data[position:position + 256])
+        position += 256
+
+        next_bits = (read16(position) << 16) | read16(position + 2)
+        position += 4
+        extra_bits = 16
+        block_end = len(output) + 65536
+
+        while len(output) < block_end and len(output) < output_size:
+            entry = table[next_bits >> 17]
+            bit_length = entry & 0x0F
+            if not bit_length:
+                raise PrefetchParseError("Invalid Huffman code")
+            symbol = entry >> 4
+
+            next_bits = (next_bits << bit_length) & 0xFFFFFFFF
+            extra_bits -= bit_length
+            if extra_bits < 0:
+                next_bits += read16(position) << -extra_bits
+                extra_bits += 16
+                position += 2
+
+            if symbol < 256:
+                output.append(symbol)
+                continue
+
+            symbol -= 256
+            length = symbol & 0x0F
+            offset_bits = symbol >> 4
+
+            if length == 15:
+                if position >= input_size:
+                    raise PrefetchParseError("Truncated Xpress Huffman match length")
+                length = data[position]
+                position += 1
+                if length == 255:
+                    length = read16(position)
+                    position += 2
+                    if length == 0:
+                        length = struct.unpack_from("<I", data, position)[0]
+                        position += 4
+                    if length < 15:
+                        raise PrefetchParseError("Invalid Xpress Huffman match length")
+                    length -= 15
+                length += 15
+            length += 3
+
+            offset = (next_bits >> (32 - offset_bits)) | (1 << offset_bits)
+            next_bits = (next_bits << offset_bits) & 0xFFFFFFFF
+            extra_bits -= offset_bits
+            if extra_bits < 0:
+                next_bits += read16(position) << -extra_bits
+                extra_bits += 16
+                position += 2
+
+            start = len(output) - offset
+            if start < 0:
+                raise PrefetchParseError("Invalid Xpress Huffman match offset")
+            if offset >= length:
+                output += output[start:start + length]
+            else:
+                # Overlapping match repeats the last `offset` bytes
+                pattern = output[start:]
+                output += (pattern * (length // offset + 1))[:length]
+
+    return bytes(output[:output_size])
+
+
+
+
+def decompress_mam(data, limit=None):
+    """
+    Decompresses a MAM compressed Prefetch file (Windows 10 and newer).
+    Returns the data unchanged when it is not compressed.
+
+    :param data: Raw file content.
+    :param limit: (Optional) Stop once this many bytes are decompressed.
+    """
+    if data[:3] != MAM_SIGNATURE:
+        return bytes(data)
+
+    if len(data) < 8:
+        raise PrefetchParseError("Truncated MAM header")
+
+    flags = data[3]
+    if flags & 0x0F != 4:
+        raise PrefetchParseError(f"Unsupported MAM compression format: 0x{flags:02x}")
+
+    output_size = struct.unpack_from("<I", data, 4)[0]
+    data_offset = 12 if flags & 0x80 else 8  # 0x80 - header includes a CRC32
+
+    return xpress_huffman_decompress(memoryview(data)[data_offset:], output_size, limit)
+
+
+
+
+def _read_utf16(data, offset, char_count=None):
+    """
+    Reads an UTF-16 little-endian string, either of given length or up to the terminating NUL.
+    """
+    if char_count is None:
+        end = offset
+        while end + 1 < len(data) and (data[end] or data[end + 1]):
+            end += 2
+    else:
+        end = offset + char_count * 2
+    return bytes(data[offset:end]).decode("utf-16-le", errors="replace")
+
+
+
+
+def _read_header(data):
+    """
+    Reads the SCCA header and file information section shared by every format version.
+    """
+    if len(data) < 84 or data[4:8] != SCCA_SIGNATURE:
+        raise PrefetchParseError("Not a Prefetch file (missing SCCA signature)")
+
+    version = struct.unpack_from("<I", data, 0)[0]
+    if version not in VERSION_NAMES:
+        raise PrefetchParseError(f"Unsupported Prefetch version: {version}")
+
+    header = {
+        "version": version,
+        "file_size": struct.unpack_from("<I", data, 12)[0],
+        "executable_name": _read_utf16(data[16:76], 0),
+        "hash": struct.unpack_from("<I", data, 76)[0],
+    }
+
+    (header["metrics_offset"], header["metrics_count"],
+     header["trace_chains_offset"], header["trace_chains_count"],
+     header["filenames_offset"], header["filenames_size"],
+     header["volumes_offset"], header["volumes_count"],
+     header["volumes_size"]) = struct.unpack_from("<9I", data, 84)
+
+    if version == 17:
+        run_times = [struct.unpack_from("<Q", data, 120)[0]]
+        run_count = struct.unpack_from("<I", data, 144)[0]
+    elif version == 23:
+        run_times = [struct.unpack_from("<Q", data, 128)[0]]
+        run_count = struct.unpack_from("<I", data, 152)[0]
+    else:
+        run_times = list(struct.unpack_from("<8Q", data, 128))
+        # Windows 10 "variant 2" file information is 8 bytes shorter
+        run_count_offset = 200 if header["metrics_offset"] == 0x128 else 208
+        run_count = struct.unpack_from("<I", data, run_count_offset)[0]
+
+    header["run_times"] = run_times
+    header["run_count"] = run_count
+    return header
+
+
+
+
+def _read_files_loaded(data, header):
+    """
+    Resolves the file names referenced by the file metrics array.
+    """
+    entry_size = METRICS_ENTRY_SIZE[header["version"]]
+    name_fields = 8 if header["version"] == 17 else 12
+    filenames_offset = header["filenames_offset"]
+
+    files_loaded = []
+    for index in range(header["metrics_count"]):
+        entry_offset = header["metrics_offset"] + index * entry_size
+        name_offset, name_length = struct.unpack_from("<2I", data, entry_offset + name_fields)
+        files_loaded.append(_read_utf16(data, filenames_offset + name_offset, name_length))
+    return files_loaded
+
+
+
+
+def _read_volumes(data, header):
+    """
+    Reads the volume information entries and their directory strings.
+    """
+    entry_size = VOLUME_ENTRY_SIZE[header["version"]]
+    base = header["volumes_offset"]
+
+    volumes = []
+    for index in range(header["volumes_count"]):
+        entry_offset = base + index * entry_size
+        (path_offset, path_length, created, serial,
+         _refs_offset, _refs_size, dirs_offset, dirs_count) = struct.unpack_from("<2IQ5I", data, entry_offset)
+
+        directories = []
+        offset = base + dirs_offset
+        for _ in range(dirs_count):
+            length = struct.unpack_from("<H", data, offset)[0]
+            directories.append(_read_utf16(data, offset + 2, length))
+            offset += 2 + (length + 1) * 2
+
+        volumes.append({
+            "name": _read_utf16(data, base + path_offset, path_length),
+            "serial": f"{serial:X}",
+            "created": filetime_to_str(created),
+            "directories": directories,
+        })
+    return volumes
+
+
+
+
+class PrefetchRecord:
+    """
+    Prefetch file whose sections are decoded on first access.
+
+    Header, run times and run count are decoded when the record is created, file metrics,
+    trace chains, filename strings and volumes/directories only when their property is used.
+    Uncompressed files opened with open_prefetch() are memory-mapped, a summary() touches only
+    the pages of the header and the volume entries. MAM compressed files are only
+    decompressed as far as the accessed section requires.
+    """
+
+    def __init__(self, data, source_filename=None):
+        """
+        :param data: Raw (possibly MAM compressed) file content, bytes or mmap.
+        :param source_filename: (Optional) Path of the file, added as SourceFilename by to_dict().
+        """
+        self.source_filename = source_filename
+        self._raw = data
+        self._compressed = data[:3] == MAM_SIGNATURE
+        self._data = None if self._compressed else data
+        self._partial = b""
+
+        try:
+            header = _read_header(self._data_upto(HEADER_SIZE))
+        except struct.error as e:
+            raise PrefetchParseError(f"Damaged Prefetch header: {e}") from e
+        self.version = header["version"]
+        self.executable_name = header["executable_name"]
+        self.hash = f"{header['hash']:08X}"
+        self.file_size = header["file_size"]
+        self.run_count = header["run_count"]
+        self.run_times = [filetime_to_str(value) for value in header["run_times"]]
+        self.run_times += [""] * (8 - len(self.run_times))
+        self.files_loaded_count = header["metrics_count"]
+        self._header = header
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def close(self):
+        """
+        Releases the memory map, decoded sections stay available.
+        """
+        close = getattr(self._raw, "close", None)
+        if close is not None:
+            try:
+                close()
+            except BufferError:
+                pass  # A decoder still holds a view, the map is released with it
+
+
+    @property
+    def last_run(self):
+        return self.run_times[0]
+
+
+    def _data_upto(self, end):
+        """
+        Returns decompressed data holding at least the first `end` bytes (all data when uncompressed).
+        """
+        if self._data is not None:
+            return self._data
+        if len(self._partial) < end:
+            self._partial = decompress_mam(self._raw, end)
+        return self._partial
+
+
+    @property
+    def data(self):
+        """
+        The whole decompressed file.
+        """
+        if self._data is None:
+            self._data = decompress_mam(self._raw)
+            self._partial = b""
+        return self._data
+
+
+    def _decode(self, reader, end):
+        try:
+            return reader(self._data_upto(end), self._header)
+        except (struct.error, IndexError) as e:
+            raise PrefetchParseError(f"Damaged Prefetch file: {e}") from e
+
+
+    @functools.cached_property
+    def files_loaded(self):
+        header = self._header
+        end = header["filenames_offset"] + header["filenames_size"]
+        return self._decode(_read_files_loaded, end)
+
+
+    @functools.cached_property
+    def trace_chains(self):
+        """
+        Total block load count of every trace chain entry.
+        """
+        header = self._header
+        entry_size = TRACE_CHAIN_ENTRY_SIZE[self.version]
+        end = header["trace_chains_offset"] + header["trace_chains_count"] * entry_size
+        count_offset = 0 if self.version >= 30 else 4
+
+        def read(data, header):
+            return [
+                struct.unpack_from("<I", data, header["trace_chains_offset"] + index * entry_size + count_offset)[0]
+                for index in range(header["trace_chains_count"])
+            ]
+        return self._decode(read, end)
+
+
+    @functools.cached_property
+    def filename_strings(self):
+        """
+        Every string of the filename strings section in stored order.
+        """
+        header = self._header
+        start = header["filenames_offset"]
+        end = start + header["filenames_size"]
+        section = bytes(self._data_upto(end)[start:end]).decode("utf-16-le", errors="replace")
+        return [name for name in section.split("\0") if name]
+
+
+    @functools.cached_property
+    def volumes(self):
+        return self._decode(_read_volumes, self.file_size)
+
+
+    @property
+    def directories(self):
+        return [directory for volume in self.volumes for directory in volume["directories"]]
+
+
+    @functools.cached_property
+    def directories_count(self):
+        """
+        Number of directory strings, read from the volume entries without decoding the strings.
+        """
+        header = self._header
+        entry_size = VOLUME_ENTRY_SIZE[self.version]
+        end = header["volumes_offset"] + header["volumes_count"] * entry_size
+
+        def read(data, header):
+            return sum(
+                struct.unpack_from("<I", data, header["volumes_offset"] + index * entry_size + 32)[0]
+                for index in range(header["volumes_count"])
+            )
+        return self._decode(read, end)
+
+
+    def summary(self):
+        """
+        Fields needed by process_json_files: ExecutableName, Hash, LastRun, RunCount and the
+        number of Directories and FilesLoaded entries (same keys as json_stream.iter_records counts).
+        """
+        return {
+            "ExecutableName": self.executable_name,
+            "Hash": self.hash,
+            "LastRun": self.last_run,
+            "RunCount": self.run_count,
+            "DirectoriesCount": self.directories_count,
+            "FilesLoadedCount": self.files_loaded_count,
+        }
+
+
+    def to_dict(self):
+        """
+        All sections with the keys PECmd writes into its JSON output.
+        """
+        record = {
+            "ExecutableName": self.executable_name,
+            "Hash": self.hash,
+            "Size": self.file_size,
+            "Version": VERSION_NAMES[self.version],
+            "RunCount": self.run_count,
+            "LastRun": self.last_run,
+        }
+        for index, run_time in enumerate(self.run_times[1:]):
+            record[f"PreviousRun{index}"] = run_time
+
+        for index, volume in enumerate(self.volumes):
+            record[f"Volume{index}Name"] = volume["name"]
+            record[f"Volume{index}Serial"] = volume["serial"]
+            record[f"Volume{index}Created"] = volume["created"]
+
+        record["Directories"] = ", ".join(self.directories)
+        record["FilesLoaded"] = ", ".join(self.files_loaded)
+        return record
+
+
+
+
+def open_prefetch(file_path):
+    """
+    Opens a Prefetch file as memory-mapped PrefetchRecord, use as context manager to release the map.
+
+    :param file_path: Path to the .pf file.
+    """
+    with open(file_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            data = b""  # Empty files cannot be mapped
+    try:
+        return PrefetchRecord(data, file_path)
+    except BaseException:
+        if isinstance(data, mmap.mmap):
+            data.close()
+        raise
+
+
+
+
+def parse_prefetch_bytes(data):
+    """
+    Parses the content of a Prefetch file and returns a dictionary with the same keys PECmd
+    writes into its JSON output.
+
+    :param data: Raw (possibly MAM compressed) file content.
+    """
+    return PrefetchRecord(data).to_dict()
+
+
+
+
+def _source_fields(file_path):
+    stat = os.stat(file_path)
+    return {"SourceModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime(TIME_FORMAT)}
+
+
+
+
+def parse_prefetch(file_path):
+    """
+    Parses a Prefetch file in-process, no PECmd.exe or JSON output needed.
+
+    :param file_path: Path to the .pf file.
+    """
+    with open_prefetch(file_path) as prefetch:
+        record = {"SourceFilename": file_path}
+        record.update(prefetch.to_dict())
+
+    record.update(_source_fields(file_path))
+    return record
+
+
+
+
+def summarize_prefetch(file_path):
+    """
+    Reads only header, run times, run count and the Directories/FilesLoaded counts of a Prefetch file.
+
+    :param file_path: Path to the .pf file.
+    """
+    with open_prefetch(file_path) as prefetch:
+        record = {"SourceFilename": file_path}
+        record.update(prefetch.summary())
+
+    record.update(_source_fields(file_path))
+    return record
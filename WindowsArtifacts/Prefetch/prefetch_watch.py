@@ -0,0 +1,74 @@
+# Waits for Windows to write Prefetch files instead of sleeping a fixed time.
+#
+# The source Prefetch folder is polled (stat of the target files) with exponential backoff.
+# The wait ends as soon as target files changed against a baseline and were left alone
+# for `settle` seconds, or when max_wait is reached.
+
+import time
+
+import dir_index
+
+
+
+
+def snapshot(source_folder, prefix="", suffix=".pf"):
+    """
+    Returns {file name: (size, mtime_ns)} of the target files.
+
+    :param source_folder: Prefetch folder to watch.
+    :param prefix: (Optional) Prefix of the target files.
+    :param suffix: (Optional) Suffix of the target files.
+    """
+    index = dir_index.get_index(source_folder)
+    index.refresh(force=True)  # Prefetch files are rewritten in place, folder mtime does not change
+    return {info.name: (info.size, info.mtime_ns) for info in index.files(prefix, suffix)}
+
+
+
+
+def wait_for_prefetch(source_folder, prefix="", suffix=".pf", baseline=None, max_wait=30.0, settle=2.0,
+                      poll=0.1, max_poll=2.0, require_change=True, sleep=time.sleep, clock=time.monotonic):
+    """
+    Polls the target files until they changed against the baseline and stayed unchanged for `settle` seconds.
+
+    :param source_folder: Prefetch folder to watch.
+    :param prefix: (Optional) Prefix of the target files.
+    :param suffix: (Optional) Suffix of the target files.
+    :param baseline: (Optional) snapshot() taken before the program was started, by default the current state.
+    :param max_wait: (Optional) Upper bound of the wait in seconds.
+    :param settle: (Optional) Seconds without any change before files are considered written.
+    :param poll: (Optional) First poll interval, doubled after every poll without change up to max_poll.
+    :param max_poll: (Optional) Longest poll interval.
+    :param require_change: (Optional) False - only wait until the files are quiet, e.g. after closing the program.
+    :param sleep: (Optional) Sleep function, replaceable in tests.
+    :param clock: (Optional) Monotonic clock function, replaceable in tests.
+    :return: Dictionary with "waited" seconds, "changed" file names and "timed_out".
+    """
+    start = clock()
+    current = snapshot(source_folder, prefix, suffix)
+    if baseline is None:
+        baseline = current
+
+    last_change = start
+    interval = poll
+
+    while True:
+        now = clock()
+        changed = sorted(name for name in current if baseline.get(name) != current[name])
+
+        if (changed or not require_change) and now - last_change >= settle:
+            return {"waited": now - start, "changed": changed, "timed_out": False}
+        if now - start >= max_wait:
+            return {"waited": now - start, "changed": changed, "timed_out": True}
+
+        wait = min(interval, max_wait - (now - start))
+        if changed or not require_change:
+            wait = min(wait, last_change + settle - now)
+        sleep(max(0.0, wait))
+        interval = min(interval * 2, max_poll)
+
+        latest = snapshot(source_folder, prefix, suffix)
+        if latest != current:
+            current = latest
+            last_change = clock()
+            interval = poll  # Files are being written, look again soon
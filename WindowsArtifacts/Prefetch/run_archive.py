@@ -0,0 +1,264 @@
+# Content addressed run archive for option 9 of PECmd_looper.py.
+#
+# Every .pf file and parsed output of a run is stored once by SHA-256 digest of its content,
+# a small manifest per run maps file names to blobs. A run only costs the files that
+# changed since earlier runs. Blobs and manifests are written to a temporary file first
+# and renamed, a run is either fully archived or not at all.
+#
+# Layout:
+#   <archive_folder>/blobs/<digest[:2]>/<digest>  - file content
+#   <archive_folder>/runs/<run>.json              - manifest: {name: {digest, size, mtime_ns}}
+#
+# Rehydrate a run for re-analysis:
+#   python run_archive.py C:\\Testing\\Prefetch\\archive 4 C:\\Testing\\Rehydrated
+
+import os
+import json
+import hashlib
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+import bulk_copy
+import dir_index
+
+
+
+
+def _write_atomic(path, data):
+    """
+    Writes bytes to a temporary file in the target folder and renames it to path.
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+
+
+class RunArchive:
+    """
+    Deduplicated store of the files of all runs.
+    """
+
+    def __init__(self, archive_folder):
+        """
+        :param archive_folder: Folder of the archive, created when missing.
+        """
+        self.archive_folder = archive_folder
+        self.blobs_folder = os.path.join(archive_folder, "blobs")
+        self.runs_folder = os.path.join(archive_folder, "runs")
+        os.makedirs(self.blobs_folder, exist_ok=True)
+        os.makedirs(self.runs_folder, exist_ok=True)
+
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_folder, digest[:2], digest)
+
+
+    def manifest_path(self, run):
+        return os.path.join(self.runs_folder, f"{run}.json")
+
+
+    def add_file(self, file_path):
+        """
+        Stores the file content, returns (digest, size, stored) - stored is False when the blob already existed.
+        The file is read once: hashed while it is copied into a temporary blob.
+        """
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=self.blobs_folder, prefix=".tmp_")
+        size = 0
+        try:
+            with open(file_path, "rb") as source, os.fdopen(handle, "wb") as temp:
+                for block in iter(lambda: source.read(1024 * 1024), b""):
+                    digest.update(block)
+                    temp.write(block)
+                    size += len(block)
+
+            digest = digest.hexdigest()
+            blob_path = self.blob_path(digest)
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+                return digest, size, False
+
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+            return digest, size, True
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+    def add_bytes(self, data):
+        """
+        Stores content given as bytes, returns (digest, size, stored).
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            return digest, len(data), False
+        _write_atomic(blob_path, data)
+        return digest, len(data), True
+
+
+    def archive_run(self, run, folder_path, suffixes=(".pf", ".json"), records=None):
+        """
+        Archives all matching files of the work folder as run `run`, an existing manifest of the run is replaced.
+
+        :param run: Run number.
+        :param folder_path: Work folder with the run's .pf files and PECmd output.
+        :param suffixes: (Optional) File name suffixes to archive (case-insensitive).
+        :param records: (Optional) {file name: record} parsed in-process (backend "native"), stored as JSON.
+        :return: Dictionary with files, new_blobs, bytes_stored and bytes_deduplicated.
+        """
+        files = {}
+        stats = {"files": 0, "new_blobs": 0, "bytes_stored": 0, "bytes_deduplicated": 0}
+
+        def account(name, digest, size, stored, mtime_ns):
+            files[name] = {"digest": digest, "size": size, "mtime_ns": mtime_ns}
+            stats["files"] += 1
+            if stored:
+                stats["new_blobs"] += 1
+                stats["bytes_stored"] += size
+            else:
+                stats["bytes_deduplicated"] += size
+
+        suffixes = tuple(suffix.lower() for suffix in suffixes)
+        for info in dir_index.get_index(folder_path).files():
+            if info.name.lower().endswith(suffixes):
+                account(info.name, *self.add_file(info.path), info.mtime_ns)
+
+        for name, record in (records or {}).items():
+            account(name, *self.add_bytes(json.dumps(record).encode("utf-8")), None)
+
+        self.write_manifest(run, files)
+
+        logging.info(
+            f"Archived run {run}: {stats['files']} files, {stats['new_blobs']} new blobs "
+            f"({stats['bytes_stored']} bytes), {stats['bytes_deduplicated']} bytes deduplicated"
+        )
+        return stats
+
+
+    def write_manifest(self, run, files):
+        """
+        Writes the manifest of a run from files already stored with add_file/add_bytes.
+
+        :param run: Run number, an existing manifest of the run is replaced.
+        :param files: {file name: {"digest", "size", "mtime_ns"}}.
+        """
+        manifest = {"run": run, "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "files": files}
+        _write_atomic(self.manifest_path(run), json.dumps(manifest, indent=1).encode("utf-8"))
+
+
+    def runs(self):
+        """
+        Returns archived run numbers in ascending order.
+        """
+        runs = []
+        for name in os.listdir(self.runs_folder):
+            run, extension = os.path.splitext(name)
+            if extension == ".json" and run.isdigit():
+                runs.append(int(run))
+        return sorted(runs)
+
+
+    def manifest(self, run):
+        """
+        Returns {file name: {"digest", "size", "mtime_ns"}} of an archived run.
+        """
+        with open(self.manifest_path(run), "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+
+
+    def files(self, run, prefix="", suffix=""):
+        """
+        Returns (name, blob path) of the matching files of a run ordered by name.
+        Blob paths can be read directly instead of rehydrating the run.
+        """
+        return [
+            (name, self.blob_path(entry["digest"]))
+            for name, entry in sorted(self.manifest(run).items())
+            if name.startswith(prefix) and name.endswith(suffix)
+        ]
+
+
+    def rehydrate(self, run, destination_folder, prefix="", suffix="", method="copy"):
+        """
+        Restores the files of an archived run with their original names and mtimes.
+
+        :param run: Run number.
+        :param destination_folder: Folder the files are written to, created when missing.
+        :param prefix: (Optional) Restore only files with this prefix.
+        :param suffix: (Optional) Restore only files with this suffix.
+        :param method: (Optional) "copy", "reflink" or "hardlink" (fast, but editing the file changes the archive).
+        :return: List of restored file paths.
+        """
+        os.makedirs(destination_folder, exist_ok=True)
+        manifest = self.manifest(run)
+        restored = []
+        for name, blob_path in self.files(run, prefix, suffix):
+            destination_path = os.path.join(destination_folder, name)
+            bulk_copy.copy_file(blob_path, destination_path, method)
+            mtime_ns = manifest[name]["mtime_ns"]
+            if mtime_ns is not None and method != "hardlink":
+                os.utime(destination_path, ns=(mtime_ns, mtime_ns))
+            restored.append(destination_path)
+
+        logging.info(f"Rehydrated run {run}: {len(restored)} files into {destination_folder}")
+        return restored
+
+
+    def prune(self):
+        """
+        Removes blobs not referenced by any manifest, returns the number of removed blobs.
+        """
+        referenced = set()
+        for run in self.runs():
+            referenced.update(entry["digest"] for entry in self.manifest(run).values())
+
+        removed = 0
+        for root, _, names in os.walk(self.blobs_folder):
+            for name in names:
+                if name not in referenced and not name.startswith(".tmp_"):
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rehydrate an archived PECmd_looper run")
+    parser.add_argument("archive", help="Archive folder")
+    parser.add_argument("run", type=int, nargs="?", help="Run number, omit to list archived runs")
+    parser.add_argument("destination", nargs="?", help="Folder the run's files are restored to")
+    parser.add_argument("--suffix", default="", help="Restore only files with this suffix, e.g. .pf")
+    parser.add_argument("--method", choices=bulk_copy.COPY_METHODS, default="copy", help="How files are restored")
+    args = parser.parse_args()
+
+    archive = RunArchive(args.archive)
+    if args.run is None or args.destination is None:
+        for run in archive.runs():
+            manifest = archive.manifest(run)
+            print(f"RUN {run}: {len(manifest)} files, {sum(entry['size'] for entry in manifest.values())} bytes")
+        return
+
+    for path in archive.rehydrate(args.run, args.destination, suffix=args.suffix, method=args.method):
+        print(f"Restored: {path}")
+
+
+
+
+if __name__ == "__main__":
+
+    main()
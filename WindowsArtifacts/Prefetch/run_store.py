@@ -0,0 +1,124 @@
+# SQLite run history for PECmd_looper.py.
+#
+# Every record written into the log by process_json_files/process_records is also stored
+# here, keyed by run counter, executable and hash, so results of many runs can be queried
+# without re-parsing log lines.
+
+import sqlite3
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    run INTEGER NOT NULL,
+    executable TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    last_run TEXT,
+    run_count INTEGER,
+    dir_count INTEGER,
+    file_count INTEGER,
+    recorded TEXT NOT NULL,
+    PRIMARY KEY (run, executable, hash)
+);
+CREATE INDEX IF NOT EXISTS records_hash ON records (hash, run);
+CREATE INDEX IF NOT EXISTS records_executable ON records (executable, run);
+CREATE INDEX IF NOT EXISTS records_last_run ON records (last_run);
+"""
+
+
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+
+
+class RunStore:
+    """
+    Run history database, one row per Prefetch record and run.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: SQLite database file, created when missing.
+        """
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def add_run(self, run, rows):
+        """
+        Stores all records of one run in a single transaction, records of a repeated run number are replaced.
+
+        :param run: Run counter.
+        :param rows: Dictionaries with executable, hash, last_run, run_count, dir_count and file_count.
+        """
+        recorded = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run, row["executable"], row["hash"], row["last_run"], _to_int(row["run_count"]),
+                     _to_int(row["dir_count"]), _to_int(row["file_count"]), recorded)
+                    for row in rows
+                ],
+            )
+
+
+    def runs(self):
+        """
+        Returns stored run numbers in ascending order.
+        """
+        return [run for (run,) in self.connection.execute("SELECT DISTINCT run FROM records ORDER BY run")]
+
+
+    def run_count_deltas(self, run_a, run_b):
+        """
+        RunCount change per executable/hash between two runs, records missing in run_a count as 0.
+        Returns (executable, hash, run_count_a, run_count_b, delta) tuples.
+        """
+        return self.connection.execute(
+            """
+            SELECT b.executable, b.hash, a.run_count, b.run_count, b.run_count - IFNULL(a.run_count, 0)
+            FROM records b
+            LEFT JOIN records a ON a.run = ? AND a.executable = b.executable AND a.hash = b.hash
+            WHERE b.run = ?
+            ORDER BY b.executable, b.hash
+            """,
+            (run_a, run_b),
+        ).fetchall()
+
+
+    def unchanged_last_run(self, run_a, run_b):
+        """
+        Records present in both runs whose LastRun did not move.
+        Returns (executable, hash, last_run, run_count_a, run_count_b) tuples.
+        """
+        return self.connection.execute(
+            """
+            SELECT b.executable, b.hash, b.last_run, a.run_count, b.run_count
+            FROM records b
+            JOIN records a ON a.run = ? AND a.executable = b.executable AND a.hash = b.hash
+            WHERE b.run = ? AND a.last_run = b.last_run
+            ORDER BY b.executable, b.hash
+            """,
+            (run_a, run_b),
+        ).fetchall()
+
+
+    def history(self, hash_value):
+        """
+        All stored runs of one hash.
+        Returns (run, executable, last_run, run_count, dir_count, file_count) tuples.
+        """
+        return self.connection.execute(
+            "SELECT run, executable, last_run, run_count, dir_count, file_count FROM records WHERE hash = ? ORDER BY run",
+            (hash_value,),
+        ).fetchall()
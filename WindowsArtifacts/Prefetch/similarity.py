@@ -0,0 +1,413 @@
+# Near-duplicate Prefetch records across a corpus (MinHash / locality-sensitive hashing).
+#
+# Every record is reduced to the set of its FilesLoaded (optionally also Directories) paths
+# without the volume part (\VOLUME{...}, \DEVICE\HARDDISKVOLUMEn), so the same program on other
+# hosts, under another path or renamed still has the same set. Paths are interned to integer IDs
+# (path_table.PathTable) and every set is summarized by a MinHash signature, the share of equal
+# signature values estimates the Jaccard similarity of two sets.
+#
+# Signatures are split into bands, records with an equal band land in the same bucket (sorted
+# band keys, looked up with searchsorted). Only records sharing a bucket are compared, so
+# clustering takes near-linear time instead of comparing all pairs:
+#   clusters()  - groups of records whose estimated similarity is at least the threshold
+#   similar()   - records similar to one record
+#   jaccard()   - exact Jaccard similarity of two records
+#
+# Records are read from PECmd JSON output or a merged corpus.jsonl (corpus.py), requires numpy.
+#
+# Example:
+#   python similarity.py D:\Triage\CorpusResults\corpus.jsonl --threshold 0.8 --csv clusters.csv
+
+import os
+import re
+import csv
+import glob
+import logging
+import argparse
+from array import array
+
+import numpy as np
+
+import json_stream
+import path_table
+
+NUM_PERM = 128  # Signature length, the estimate error is about 1 / sqrt(NUM_PERM)
+DEFAULT_THRESHOLD = 0.8
+CHUNK_ENTRIES = 1 << 20  # Set entries hashed at once
+EMPTY = np.uint32(0xFFFFFFFF)  # Signature value of records without paths
+RECORD_KEYS = ("ExecutableName", "Hash", "Host")
+VOLUME_PATTERN = re.compile(r"^\\(?:VOLUME\{[^}]*\}|DEVICE\\HARDDISKVOLUME\d+)", re.IGNORECASE)
+
+
+
+
+def normalize_path(path):
+    """
+    Upper case path without its volume, \\VOLUME{...}\\WINDOWS\\SYSTEM32\\NTDLL.DLL -> \\WINDOWS\\SYSTEM32\\NTDLL.DLL.
+    """
+    return VOLUME_PATTERN.sub("", path.strip().upper(), count=1)
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Returns (bands, rows) with bands * rows <= num_perm whose LSH threshold (1 / bands) ** (1 / rows)
+    is closest to the similarity threshold.
+    """
+    return min(
+        ((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+        key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold),
+    )
+
+
+
+
+class SimilarityBuilder:
+    """
+    Collects the path sets of records, build() computes the signatures of all of them at once.
+    """
+
+    def __init__(self, fields=("FilesLoaded",)):
+        """
+        :param fields: (Optional) List fields forming the set, "FilesLoaded" and/or "Directories".
+        """
+        self.fields = tuple(fields)
+        self.table = path_table.PathTable()
+        self.raw_ids = {}           # Path as read -> ID of its normalized path
+        self.labels = []            # (host, executable, hash) per record
+        self.ids = array("I")       # Sorted distinct path IDs of all records, one after another
+        self.offsets = array("q", [0])
+
+
+    def __len__(self):
+        return len(self.labels)
+
+
+    def intern(self, path):
+        path_id = self.raw_ids.get(path)
+        if path_id is None:
+            path_id = self.raw_ids[path] = self.table(normalize_path(path))
+        return path_id
+
+
+    def add(self, host, record):
+        """
+        Adds one PECmd-style record, list fields may be ", " joined strings, lists of paths or
+        lists of IDs interned with self.intern.
+        """
+        path_ids = set()
+        for field in self.fields:
+            value = record.get(field) or ()
+            if isinstance(value, str):
+                value = json_stream.split_entries(value)
+            if value and isinstance(value[0], int):
+                path_ids.update(value)
+            else:
+                path_ids.update(map(self.intern, value))
+
+        self.labels.append((host, record.get("ExecutableName", "Unknown"), record.get("Hash", "NoHash")))
+        self.ids.extend(sorted(path_ids))
+        self.offsets.append(len(self.ids))
+
+
+    def add_file(self, json_file, host=""):
+        """
+        Adds all records of a PECmd JSON/JSONL file or corpus.jsonl (host from "Host" when present).
+        """
+        for record in json_stream.iter_records(json_file, RECORD_KEYS, list_keys=self.fields, intern=self.intern):
+            self.add(record.get("Host", host), record)
+
+
+    def build(self, num_perm=NUM_PERM, threshold=DEFAULT_THRESHOLD, seed=1):
+        """
+        :param num_perm: (Optional) Signature length.
+        :param threshold: (Optional) Similarity the LSH bands are tuned for.
+        :param seed: (Optional) Seed of the hash functions, indexes with the same seed are comparable.
+        """
+        return SimilarityIndex(
+            self.labels,
+            np.frombuffer(self.ids, dtype=np.uint32) if len(self.ids) else np.zeros(0, dtype=np.uint32),
+            np.frombuffer(self.offsets, dtype=np.int64),
+            num_perm, threshold, seed, self.table,
+        )
+
+
+
+
+class SimilarityIndex:
+    """
+    MinHash signatures and LSH buckets of all records, one row per record.
+    """
+
+    def __init__(self, labels, ids, offsets, num_perm=NUM_PERM, threshold=DEFAULT_THRESHOLD, seed=1, table=None):
+        """
+        :param labels: (host, executable, hash) per record.
+        :param ids: Sorted distinct path IDs of all records, one after another.
+        :param offsets: Start of every record in ids plus the end (len(labels) + 1 values).
+        :param table: (Optional) path_table.PathTable the IDs belong to.
+        """
+        self.labels = labels
+        self.table = table
+        self.ids = ids
+        self.offsets = offsets
+        self.threshold = threshold
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing of path IDs: (a * id + b) >> 32 with odd 64-bit a, wrapping uint64 arithmetic
+        self.hash_a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.hash_b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self.band_weights = rng.integers(0, 1 << 63, self.rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+        self.sizes = np.diff(offsets)
+        self.signatures = self._signatures()
+        self.band_keys, self.band_orders = self._buckets()
+
+
+    def __len__(self):
+        return len(self.labels)
+
+
+    def _signatures(self):
+        count = len(self.labels)
+        signatures = np.full((len(self.hash_a), count), EMPTY, dtype=np.uint32)  # Transposed while filled
+        if not len(self.ids):
+            return np.ascontiguousarray(signatures.T)
+
+        # Records whose entries fit into one chunk (at least one record per chunk)
+        chunks = []
+        start = 0
+        while start < count:
+            end = int(np.searchsorted(self.offsets, self.offsets[start] + CHUNK_ENTRIES, "right")) - 1
+            end = min(max(end, start + 1), count)
+            rows = start + np.flatnonzero(self.sizes[start:end])
+            if len(rows):
+                low, high = self.offsets[start], self.offsets[end]
+                chunks.append((rows, self.ids[low:high], self.offsets[rows] - low))
+            start = end
+
+        # Every path ID is hashed once per function, records gather the hashes of their IDs
+        universe = np.arange(int(self.ids.max()) + 1, dtype=np.uint64)
+        for perm, (a, b) in enumerate(zip(self.hash_a, self.hash_b)):
+            hashes = ((universe * a + b) >> np.uint64(32)).astype(np.uint32)
+            for rows, chunk, starts in chunks:
+                signatures[perm, rows] = np.minimum.reduceat(np.take(hashes, chunk), starts)
+        return np.ascontiguousarray(signatures.T)
+
+
+    def _band_key(self, signatures, band):
+        block = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+        return (block * self.band_weights).sum(axis=1, dtype=np.uint64) + np.uint64(band)
+
+
+    def _buckets(self):
+        keys = np.empty((self.bands, len(self.labels)), dtype=np.uint64)
+        orders = np.empty((self.bands, len(self.labels)), dtype=np.int64)
+        for band in range(self.bands):
+            band_key = self._band_key(self.signatures, band)
+            orders[band] = np.argsort(band_key, kind="stable")
+            keys[band] = band_key[orders[band]]
+        return keys, orders
+
+
+    def estimate(self, rows_a, rows_b):
+        """
+        Estimated Jaccard similarity of row pairs (share of equal signature values), 0 for empty records.
+        """
+        rows_a = np.asarray(rows_a, dtype=np.int64)
+        rows_b = np.asarray(rows_b, dtype=np.int64)
+        scores = np.empty(len(rows_a))
+        for start in range(0, len(rows_a), 65536):
+            part = slice(start, start + 65536)
+            scores[part] = (self.signatures[rows_a[part]] == self.signatures[rows_b[part]]).mean(axis=1)
+        scores[(self.sizes[rows_a] == 0) | (self.sizes[rows_b] == 0)] = 0.0
+        return scores
+
+
+    def paths(self, row):
+        """
+        Path IDs of a record (sorted array), self.table.resolve() returns the paths.
+        """
+        return self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+
+    def jaccard(self, row_a, row_b):
+        """
+        Exact Jaccard similarity of two records.
+        """
+        paths_a, paths_b = self.paths(row_a), self.paths(row_b)
+        union = len(paths_a) + len(paths_b)
+        if not union:
+            return 0.0
+        shared = len(np.intersect1d(paths_a, paths_b, assume_unique=True))
+        return shared / (union - shared)
+
+
+    def candidate_pairs(self):
+        """
+        Distinct (row, row) pairs sharing at least one bucket, every bucket member is paired
+        with the first member of its bucket only (linear in the bucket size).
+        """
+        positions = np.arange(len(self.labels))
+        heads_all, members_all = [], []
+        for keys, order in zip(self.band_keys, self.band_orders):
+            starts = np.ones(len(keys), dtype=bool)
+            starts[1:] = keys[1:] != keys[:-1]
+            heads = order[np.maximum.accumulate(np.where(starts, positions, 0))]
+            followers = ~starts
+            heads_all.append(heads[followers])
+            members_all.append(order[followers])
+
+        heads = np.concatenate(heads_all) if heads_all else np.zeros(0, dtype=np.int64)
+        members = np.concatenate(members_all) if members_all else np.zeros(0, dtype=np.int64)
+        keep = (self.sizes[heads] > 0) & (self.sizes[members] > 0)
+        pairs = np.unique(np.stack([np.minimum(heads, members), np.maximum(heads, members)], axis=1)[keep], axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+
+    def clusters(self, threshold=None, min_size=2):
+        """
+        Groups records connected by candidate pairs with an estimated similarity of at least threshold.
+
+        :param threshold: (Optional) Minimum estimated similarity, the index threshold by default.
+        :param min_size: (Optional) Smallest cluster returned.
+        :return: List of row arrays, largest cluster first, the first row of each is its lowest row.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        rows_a, rows_b = self.candidate_pairs()
+        keep = self.estimate(rows_a, rows_b) >= threshold
+        rows_a, rows_b = rows_a[keep], rows_b[keep]
+
+        # Connected components by minimum label propagation with pointer jumping
+        components = np.arange(len(self.labels))
+        while True:
+            lowest = np.minimum(components[rows_a], components[rows_b])
+            previous = components.copy()
+            np.minimum.at(components, rows_a, lowest)
+            np.minimum.at(components, rows_b, lowest)
+            components = components[components]
+            if np.array_equal(components, previous):
+                break
+
+        order = np.argsort(components, kind="stable")
+        boundaries = np.flatnonzero(np.diff(components[order])) + 1
+        groups = [group for group in np.split(order, boundaries) if len(group) >= min_size]
+        groups.sort(key=lambda group: (-len(group), group[0]))
+        return groups
+
+
+    def similar(self, row, threshold=None):
+        """
+        Records sharing a bucket with the row and reaching the threshold, most similar first.
+
+        :return: List of (row, estimated similarity).
+        """
+        threshold = self.threshold if threshold is None else threshold
+        candidates = set()
+        for band, (keys, order) in enumerate(zip(self.band_keys, self.band_orders)):
+            key = self._band_key(self.signatures[row:row + 1], band)[0]
+            low, high = np.searchsorted(keys, key, "left"), np.searchsorted(keys, key, "right")
+            candidates.update(order[low:high].tolist())
+        candidates.discard(row)
+        if not candidates:
+            return []
+
+        candidates = np.fromiter(candidates, dtype=np.int64)
+        scores = self.estimate(np.full(len(candidates), row), candidates)
+        return sorted(
+            ((int(candidate), float(score)) for candidate, score in zip(candidates, scores) if score >= threshold),
+            key=lambda item: -item[1],
+        )
+
+
+    def write_csv(self, csv_path, groups, exact=False):
+        """
+        Writes one line per cluster member with its similarity to the first member of the cluster.
+
+        :param exact: (Optional) Also compute the exact Jaccard similarity.
+        """
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Cluster", "Host", "ExecutableName", "Hash", "Paths", "Estimate"] + (["Jaccard"] if exact else []))
+            for cluster, group in enumerate(groups):
+                scores = self.estimate(np.full(len(group), group[0]), group)
+                for row, score in zip(group, scores):
+                    line = [cluster, *self.labels[row], int(self.sizes[row]), f"{score:.3f}"]
+                    if exact:
+                        line.append(f"{self.jaccard(group[0], row):.3f}")
+                    writer.writerow(line)
+
+
+
+
+def load_files(paths, fields=("FilesLoaded",), builder=None, host=""):
+    """
+    Adds the records of JSON/JSONL files to the builder, unreadable files are logged and skipped.
+
+    :param paths: Files, folders (all .json/.jsonl files in them) or glob patterns.
+    :param fields: (Optional) List fields forming the set.
+    :param builder: (Optional) SimilarityBuilder, a new one by default.
+    :param host: (Optional) Label of records without "Host", e.g. the run they belong to.
+    """
+    builder = SimilarityBuilder(fields) if builder is None else builder
+    for pattern in paths:
+        if os.path.isdir(pattern):
+            files = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith((".json", ".jsonl"))
+            )
+        else:
+            files = sorted(glob.glob(pattern)) or [pattern]
+        for json_file in files:
+            try:
+                builder.add_file(json_file, host)
+            except (ValueError, OSError) as e:
+                logging.error(f"Error reading {json_file}: {e}")
+    return builder
+
+
+
+
+def print_clusters(index, groups, limit=20, members=10):
+    """
+    Prints the largest clusters with the executables they contain.
+    """
+    print(f"\n{len(groups)} clusters of near-duplicate records ({sum(len(group) for group in groups)} of {len(index)} records).")
+    for cluster, group in enumerate(groups[:limit]):
+        executables = sorted({index.labels[row][1] for row in group})
+        print(f"\nCluster {cluster}: {len(group)} records, executables: {', '.join(executables)}")
+        scores = index.estimate(np.full(len(group), group[0]), group)
+        for row, score in list(zip(group, scores))[:members]:
+            host, executable, hash_value = index.labels[row]
+            print(f"  {score:.2f}  {host + ' ' if host else ''}{executable}-{hash_value} ({index.sizes[row]} paths)")
+        if len(group) > members:
+            print(f"  ... {len(group) - members} more")
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clusters of Prefetch records with nearly the same FilesLoaded (MinHash/LSH)")
+    parser.add_argument("paths", nargs="+", help="PECmd JSON files, folders, glob patterns or corpus.jsonl")
+    parser.add_argument("--directories", action="store_true", help="Include Directories in the compared sets")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum estimated Jaccard similarity")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM, help="Signature length")
+    parser.add_argument("--min-size", type=int, default=2, help="Smallest cluster reported")
+    parser.add_argument("--csv", help="Write all clusters to this CSV file")
+    parser.add_argument("--exact", action="store_true", help="Add the exact Jaccard similarity to the CSV")
+    args = parser.parse_args()
+
+    fields = ("FilesLoaded", "Directories") if args.directories else ("FilesLoaded",)
+    builder = load_files(args.paths, fields)
+    index = builder.build(args.num_perm, args.threshold)
+    groups = index.clusters(min_size=args.min_size)
+    print_clusters(index, groups)
+    if args.csv:
+        index.write_csv(args.csv, groups, args.exact)
+        print(f"\nClusters saved to {args.csv}")
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,157 @@
+# Non-interactive diff of all run snapshots created by option 9, either run folders
+# (move_specific_files, folder\{counter}) or runs of the run archive (run_archive.py).
+#
+# Every snapshot is read once into path_table.PrefetchEntry records, Directories/FilesLoaded
+# paths are interned into one PathTable and kept as integer ID arrays. Added/removed paths
+# between consecutive runs are set operations on integers.
+
+import os
+import json
+import logging
+
+import columnar
+import path_table
+import run_archive
+
+LIST_FIELDS = path_table.LIST_FIELDS
+
+
+
+
+def find_run_folders(folder_path):
+    """
+    Returns (run number, folder) for every numbered subfolder, ordered by run number.
+
+    :param folder_path: Work folder containing the run folders.
+    """
+    runs = []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name.isdigit():
+                runs.append((int(entry.name), entry.path))
+    return sorted(runs)
+
+
+
+
+def load_snapshot(run_folder, analysis_search, table):
+    """
+    Reads all matching JSON files (and the columnar container) of one run.
+    Returns {"ExecutableName-Hash": path_table.PrefetchEntry}.
+
+    :param run_folder: Folder with the PECmd JSON output of one run.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    :param table: path_table.PathTable shared by all runs.
+    """
+    prefix, suffix = analysis_search
+
+    with os.scandir(run_folder) as entries:
+        json_files = sorted(
+            entry.path for entry in entries
+            if entry.is_file() and entry.name.startswith(prefix) and entry.name.endswith(suffix)
+        )
+
+    return path_table.load_files(json_files + columnar.find(run_folder), table)
+
+
+
+
+def load_archived_snapshot(archive, run, analysis_search, table):
+    """
+    Same as load_snapshot for a run of the run archive, blobs are read in place.
+
+    :param archive: run_archive.RunArchive.
+    :param run: Archived run number.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    :param table: path_table.PathTable shared by all runs.
+    """
+    prefix, suffix = analysis_search
+    json_files = [blob_path for _, blob_path in archive.files(run, prefix, suffix) + archive.files(run, columnar.CONTAINER_NAME)]
+    return path_table.load_files(json_files, table)
+
+
+
+
+def diff_snapshots(snapshots, table):
+    """
+    Computes added/removed Directories and FilesLoaded per record between every pair of consecutive runs.
+
+    :param snapshots: List of (run number, snapshot) ordered by run number.
+    :param table: path_table.PathTable used to load the snapshots.
+    :return: List of dictionaries: run, previous_run, record, status ("new", "missing", "changed")
+             and added/removed paths per field. Unchanged records are left out.
+    """
+    diffs = []
+
+    for (previous_run, previous), (run, current) in zip(snapshots, snapshots[1:]):
+        for name in sorted(previous.keys() | current.keys()):
+            before = previous.get(name)
+            after = current.get(name)
+
+            if before is None:
+                status = "new"
+            elif after is None:
+                status = "missing"
+            elif before.directories == after.directories and before.files_loaded == after.files_loaded:
+                continue  # Same paths in the same order, no set operations needed
+            else:
+                status = "changed"
+
+            diff = {"run": run, "previous_run": previous_run, "record": name, "status": status}
+            for field in LIST_FIELDS:
+                added = after.difference(before, field) if after else set()
+                removed = before.difference(after, field) if before else set()
+                diff[field] = {"added": table.resolve(added), "removed": table.resolve(removed)}
+
+            if status == "changed" and not any(diff[field]["added"] or diff[field]["removed"] for field in LIST_FIELDS):
+                continue  # Only the order changed
+            diffs.append(diff)
+
+    return diffs
+
+
+
+
+def diff_run_folders(folder_path, analysis_search):
+    """
+    Loads every run folder once and diffs all consecutive runs.
+
+    :param folder_path: Work folder containing the run folders.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    """
+    table = path_table.PathTable()
+    snapshots = [
+        (run, load_snapshot(run_folder, analysis_search, table))
+        for run, run_folder in find_run_folders(folder_path)
+    ]
+    logging.info(f"Loaded {len(snapshots)} run snapshots, {len(table)} distinct paths.")
+    return diff_snapshots(snapshots, table)
+
+
+
+
+def diff_archive(archive_folder, analysis_search):
+    """
+    Loads every archived run once and diffs all consecutive runs.
+
+    :param archive_folder: Folder of the run archive.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    """
+    archive = run_archive.RunArchive(archive_folder)
+    table = path_table.PathTable()
+    snapshots = [
+        (run, load_archived_snapshot(archive, run, analysis_search, table))
+        for run in archive.runs()
+    ]
+    logging.info(f"Loaded {len(snapshots)} archived runs, {len(table)} distinct paths.")
+    return diff_snapshots(snapshots, table)
+
+
+
+
+def write_diff_report(diffs, report_path):
+    """
+    Writes the diff result as JSON.
+    """
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(diffs, f, indent=4)
@@ -0,0 +1,260 @@
+# Synthetic Prefetch corpus generator for benchmarks and tests without Windows.
+#
+# Writes SCCA version 30 Prefetch files (optionally MAM / Xpress Huffman compressed like
+# Windows 10+ does) and PECmd-style JSON output with configurable FilesLoaded/Directories
+# sizes and run-history churn between runs. Output is deterministic for a given seed.
+
+import os
+import json
+import random
+import struct
+
+import prefetch_parser
+
+EXECUTABLES = ("CHROME.EXE", "MSEDGE.EXE", "SVCHOST.EXE", "EXPLORER.EXE", "RUNDLL32.EXE", "POWERSHELL.EXE")
+VOLUME_NAME = "\\VOLUME{01db6e4c5a3b2f10-b4d5c0fe}"
+FILETIME_START = 133824319710000000  # 2025-01-27
+FILETIME_SECOND = 10_000_000
+
+
+
+
+def _utf16z(text):
+    return text.encode("utf-16-le") + b"\0\0"
+
+
+
+
+def build_prefetch(executable_name, hash_value, run_times, run_count, files_loaded, directories, volume_name=VOLUME_NAME, serial=0xB4D5C0FE):
+    """
+    Builds an uncompressed SCCA version 30 Prefetch file.
+
+    :param executable_name: Executable name stored in the header.
+    :param hash_value: Prefetch hash as integer.
+    :param run_times: Up to 8 FILETIME values, newest first.
+    :param run_count: Run count.
+    :param files_loaded: File names of the file metrics array.
+    :param directories: Directory names of the single volume.
+    """
+    header_size = 84
+    info_size = 220
+    metrics_offset = header_size + info_size
+
+    metrics = bytearray()
+    strings = bytearray()
+    for name in files_loaded:
+        metrics += struct.pack("<6IQ", 0, 0, 0, len(strings), len(name), 0, 0)
+        strings += _utf16z(name)
+
+    filenames_offset = metrics_offset + len(metrics)
+    volumes_offset = filenames_offset + len(strings)
+
+    volume_entry_size = prefetch_parser.VOLUME_ENTRY_SIZE[30]
+    volume_extra = bytearray(_utf16z(volume_name))
+    directories_offset = volume_entry_size + len(volume_extra)
+    for directory in directories:
+        volume_extra += struct.pack("<H", len(directory)) + _utf16z(directory)
+
+    volume = bytearray(volume_entry_size)
+    struct.pack_into("<2IQ5I", volume, 0, volume_entry_size, len(volume_name), FILETIME_START, serial, 0, 0, directories_offset, len(directories))
+    volumes = volume + volume_extra
+
+    data = bytearray(header_size + info_size)
+    struct.pack_into("<I4sII", data, 0, 30, b"SCCA", 17, 0)
+    name = executable_name.encode("utf-16-le")[:58]
+    data[16:16 + len(name)] = name
+    struct.pack_into("<I", data, 76, hash_value)
+    struct.pack_into("<9I", data, 84, metrics_offset, len(files_loaded), metrics_offset + len(metrics), 0,
+                     filenames_offset, len(strings), volumes_offset, 1, len(volumes))
+    struct.pack_into("<8Q", data, 128, *(list(run_times) + [0] * 8)[:8])
+    struct.pack_into("<I", data, 208, run_count)
+
+    data += metrics + strings + volumes
+    struct.pack_into("<I", data, 12, len(data))
+    return bytes(data)
+
+
+
+
+class _BitWriter:
+    """
+    Writes the Xpress Huffman bit stream: 16-bit little-endian words filled from the top bit,
+    with extra length bytes placed where the decoder reads them.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.slots = []
+        self.value = 0
+        self.bits = 0
+        self.total = 0
+        self.words = 2  # Decoder reads two words up front
+        self.slots.append(self._reserve())
+        self.slots.append(self._reserve())
+
+    def _reserve(self):
+        self.output += b"\0\0"
+        return len(self.output) - 2
+
+    def write(self, value, count):
+        for shift in range(count - 1, -1, -1):
+            self.value = (self.value << 1) | ((value >> shift) & 1)
+            self.bits += 1
+            if self.bits == 16:
+                struct.pack_into("<H", self.output, self.slots.pop(0), self.value)
+                self.value = 0
+                self.bits = 0
+        self.total += count
+        if self.total > 16 * (self.words - 1):
+            self.slots.append(self._reserve())
+            self.words += 1
+
+    def flush(self):
+        if self.bits:
+            struct.pack_into("<H", self.output, self.slots.pop(0), (self.value << (16 - self.bits)) & 0xFFFF)
+
+
+
+
+def compress_mam(data):
+    """
+    Compresses data into a MAM (Xpress Huffman) Prefetch container.
+    Uses a flat 9-bit code for all 512 symbols and a single-candidate match finder,
+    the ratio is poor but the output is valid for every Xpress Huffman decoder.
+
+    :param data: Uncompressed Prefetch file.
+    """
+    output = bytearray(b"MAM\x04" + struct.pack("<I", len(data)))
+
+    for block_start in range(0, max(len(data), 1), 65536):
+        block_end = min(block_start + 65536, len(data))
+        output += b"\x99" * 256  # Code length 9 for every symbol
+        writer = _BitWriter(output)
+        last_seen = {}
+
+        position = block_start
+        while position < block_end:
+            key = data[position:position + 3]
+            candidate = last_seen.get(key)
+            last_seen[key] = position
+
+            length = 0
+            if candidate is not None and position - candidate < 65536:
+                limit = min(block_end - position, 65535 + 3)
+                while length < limit and data[candidate + length] == data[position + length]:
+                    length += 1
+
+            if length < 3:
+                writer.write(data[position], 9)
+                position += 1
+                continue
+
+            offset = position - candidate
+            offset_bits = offset.bit_length() - 1
+            extra = length - 3
+            writer.write(256 + (offset_bits << 4) + min(extra, 15), 9)
+            if extra >= 15:
+                if extra - 15 < 255:
+                    output.append(extra - 15)
+                else:
+                    output.append(255)
+                    output += struct.pack("<H", extra)
+            writer.write(offset - (1 << offset_bits), offset_bits)
+            position += length
+
+        writer.flush()
+
+    return bytes(output)
+
+
+
+
+def _record(executable_name, hash_value, run_times, run_count, files_loaded, directories):
+    """
+    PECmd-style JSON record for the generated file.
+    """
+    times = [prefetch_parser.filetime_to_str(value) for value in run_times] + [""] * 8
+    record = {"ExecutableName": executable_name, "Hash": f"{hash_value:08X}", "RunCount": run_count, "LastRun": times[0]}
+    for index in range(7):
+        record[f"PreviousRun{index}"] = times[index + 1]
+    record["Directories"] = ", ".join(directories)
+    record["FilesLoaded"] = ", ".join(files_loaded)
+    return record
+
+
+
+
+def generate_states(file_count=100, files_loaded=150, directories=30, runs=1, churn=0.1, seed=0):
+    """
+    Generates the state of every Prefetch file for every run.
+    Between runs `churn` of the files are executed again: run count grows, a run time is added
+    and `churn` of their FilesLoaded entries are replaced.
+
+    :return: List of runs, every run is a list of (executable, hash, run_times, run_count, files_loaded, directories).
+    """
+    rng = random.Random(seed)
+    path_pool = [
+        f"{VOLUME_NAME}\\WINDOWS\\SYSTEM32\\{rng.choice(('NT', 'KERNEL', 'USER', 'GDI', 'WIN'))}{index}.DLL"
+        for index in range(max(files_loaded * 4, 1000))
+    ]
+    directory_pool = [f"{VOLUME_NAME}\\DIR{index}\\SUB{index % 17}" for index in range(max(directories * 4, 200))]
+
+    state = []
+    for index in range(file_count):
+        executable = EXECUTABLES[index % len(EXECUTABLES)]
+        hash_value = rng.getrandbits(32)
+        run_times = [FILETIME_START + rng.randrange(86400) * FILETIME_SECOND]
+        state.append([executable, hash_value, run_times, 1, rng.sample(path_pool, files_loaded), rng.sample(directory_pool, directories)])
+
+    history = []
+    for run in range(runs):
+        if run:
+            for entry in rng.sample(state, int(file_count * churn)):
+                entry[2] = [entry[2][0] + rng.randrange(1, 3600) * FILETIME_SECOND] + entry[2][:7]
+                entry[3] += 1
+                files = entry[4][:]
+                for position in rng.sample(range(len(files)), int(len(files) * churn)):
+                    files[position] = rng.choice(path_pool)
+                entry[4] = files
+        history.append([tuple(entry) for entry in state])
+    return history
+
+
+
+
+def write_prefetch_files(folder, state, compress=True):
+    """
+    Writes one .pf file per entry of a generated run state, returns the written paths.
+
+    :param folder: Output folder.
+    :param state: One run from generate_states().
+    :param compress: (Optional) MAM compress files like Windows 10+.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for executable, hash_value, run_times, run_count, files_loaded, directories in state:
+        data = build_prefetch(executable, hash_value, run_times, run_count, files_loaded, directories)
+        path = os.path.join(folder, f"{executable}-{hash_value:08X}.pf")
+        with open(path, "wb") as f:
+            f.write(compress_mam(data) if compress else data)
+        paths.append(path)
+    return paths
+
+
+
+
+def write_json_outputs(folder, state):
+    """
+    Writes PECmd-style {filename}.json output per entry of a generated run state, returns the written paths.
+
+    :param folder: Output folder.
+    :param state: One run from generate_states().
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for executable, hash_value, run_times, run_count, files_loaded, directories in state:
+        path = os.path.join(folder, f"{executable}-{hash_value:08X}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(_record(executable, hash_value, run_times, run_count, files_loaded, directories), f)
+        paths.append(path)
+    return paths
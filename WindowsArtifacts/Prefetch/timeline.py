@@ -0,0 +1,312 @@
+# Execution timeline across all Prefetch records and runs.
+#
+# LastRun/PreviousRun0-6 and RunCount of every record of every run (and host) are loaded into
+# NumPy arrays once. All further work is vectorized:
+#   events()       - deduplicated execution times with the run they were first seen in
+#   run_deltas()   - per record and run: RunCount growth and number of new execution times
+#   run_summary()  - totals of run_deltas() per run
+#   silent_runs()  - runs where RunCount grew by more than the new execution times show
+#                    (executions whose time was pushed out of the 8 stored run times or not recorded)
+#   merged()       - one timeline per executable over all its hashes (paths) and hosts
+#
+# Records are read from run folders (folder\{counter}), the run archive (run_archive.py)
+# or a merged multi-host corpus (corpus.py).
+
+import os
+import csv
+import logging
+
+import numpy as np
+
+import columnar
+import json_stream
+import run_archive
+import snapshot_diff
+
+RUN_TIME_KEYS = ("LastRun",) + tuple(f"PreviousRun{index}" for index in range(7))
+RECORD_KEYS = ("ExecutableName", "Hash", "RunCount") + RUN_TIME_KEYS
+NAT = np.iinfo(np.int64).min  # datetime64 NaT as int64
+
+
+
+
+class TimelineBuilder:
+    """
+    Collects records in plain lists, build() converts them into a Timeline in one step.
+    """
+
+    def __init__(self):
+        self.keys = {}          # (host, executable, hash) -> key id
+        self.key_names = []     # key id -> (host, executable, hash)
+        self.key_ids = []
+        self.runs = []
+        self.run_counts = []
+        self.run_times = []     # 8 times per record as int64 seconds, NAT for empty or malformed times
+        self.parsed_times = {}  # Run time string -> seconds, the same times repeat in every run
+
+
+    def add(self, host, run, record):
+        """
+        Adds one PECmd-style record of one run.
+
+        :param host: Host label, "" for a single machine.
+        :param run: Run number.
+        :param record: Dictionary with ExecutableName, Hash, RunCount, LastRun and PreviousRun0-6.
+        """
+        name = (host, record.get("ExecutableName", "Unknown"), record.get("Hash", "NoHash"))
+        key_id = self.keys.get(name)
+        if key_id is None:
+            key_id = self.keys[name] = len(self.key_names)
+            self.key_names.append(name)
+
+        self.key_ids.append(key_id)
+        self.runs.append(run)
+        try:
+            self.run_counts.append(int(record.get("RunCount", -1)))
+        except (TypeError, ValueError):
+            self.run_counts.append(-1)
+        self.run_times.extend(self.parse_time(record.get(key) or "") for key in RUN_TIME_KEYS)
+
+
+    def parse_time(self, value):
+        """
+        Seconds since 1970 of one run time string, NAT when it is empty or not a date.
+        """
+        value = str(value)
+        seconds = self.parsed_times.get(value)
+        if seconds is None:
+            try:
+                seconds = int(np.datetime64(value, "s").astype(np.int64))
+            except (ValueError, OverflowError):
+                logging.warning(f"Invalid run time ignored: {value}")
+                seconds = NAT
+            self.parsed_times[value] = seconds
+        return seconds
+
+
+    def build(self):
+        return Timeline(
+            self.key_names,
+            np.array(self.key_ids, dtype=np.int64),
+            np.array(self.runs, dtype=np.int64),
+            np.array(self.run_counts, dtype=np.int64),
+            np.array(self.run_times, dtype=np.int64).view("datetime64[s]").reshape(-1, len(RUN_TIME_KEYS)),
+        )
+
+
+
+
+class Timeline:
+    """
+    Records of all runs as arrays, one row per record and run.
+    """
+
+    def __init__(self, key_names, key_ids, runs, run_counts, run_times):
+        """
+        :param key_names: (host, executable, hash) per key id.
+        :param key_ids: Key id per row.
+        :param runs: Run number per row.
+        :param run_counts: RunCount per row (-1 unknown).
+        :param run_times: datetime64[s] array (rows x 8), NaT for empty or malformed run times.
+        """
+        self.key_names = key_names
+        self.key_ids = key_ids
+        self.runs = runs
+        self.run_counts = run_counts
+        self.run_times = run_times
+
+        # Executable id per key, keys of the same executable on any host share it
+        executables = np.array([name[1] for name in key_names] or [""], dtype=object)
+        self.executable_names, self.key_executables = np.unique(executables, return_inverse=True)
+
+
+    def __len__(self):
+        return len(self.key_ids)
+
+
+    def events(self):
+        """
+        Deduplicated execution events.
+        Returns a dictionary of arrays ordered by key and time: key, time (datetime64[s]) and first_run.
+        """
+        times = self.run_times.astype(np.int64)
+        valid = times != NAT
+        slots = valid.sum(axis=1)
+        keys = np.repeat(self.key_ids, slots)
+        runs = np.repeat(self.runs, slots)
+        times = times[valid]
+
+        order = np.lexsort((runs, times, keys))
+        keys, times, runs = keys[order], times[order], runs[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (times[1:] != times[:-1])
+
+        return {"key": keys[first], "time": times[first].astype("datetime64[s]"), "first_run": runs[first]}
+
+
+    def run_deltas(self):
+        """
+        Change of every record against its previous run.
+        Returns a dictionary of arrays ordered by key and run: key, run, previous_run (-1 first seen),
+        run_count, run_count_delta (0 when first seen or unknown) and new_times.
+        """
+        order = np.lexsort((self.runs, self.key_ids))
+        keys, runs, run_counts = self.key_ids[order], self.runs[order], self.run_counts[order]
+
+        continued = np.zeros(len(keys), dtype=bool)
+        continued[1:] = keys[1:] == keys[:-1]
+        previous_run = np.where(continued, np.roll(runs, 1), -1)
+        previous_count = np.roll(run_counts, 1)
+        known = continued & (run_counts >= 0) & (previous_count >= 0)
+        delta = np.where(known, run_counts - previous_count, 0)
+
+        # New times per (key, run): events counted at the run they were first seen in
+        events = self.events()
+        run_span = int(self.runs.max()) + 1 if len(self.runs) else 1
+        event_codes, event_counts = np.unique(events["key"] * run_span + events["first_run"], return_counts=True)
+        codes = keys * run_span + runs
+        if len(event_codes):
+            position = np.minimum(np.searchsorted(event_codes, codes), len(event_codes) - 1)
+            new_times = np.where(event_codes[position] == codes, event_counts[position], 0)
+        else:
+            new_times = np.zeros(len(codes), dtype=np.int64)
+
+        return {
+            "key": keys,
+            "run": runs,
+            "previous_run": previous_run,
+            "run_count": run_counts,
+            "run_count_delta": delta,
+            "new_times": new_times,
+        }
+
+
+    def silent_runs(self):
+        """
+        Rows where RunCount grew by more than the number of new execution times.
+        Returns the run_deltas() arrays filtered to those rows plus "unexplained" executions.
+        """
+        deltas = self.run_deltas()
+        first_seen = deltas["previous_run"] < 0
+        unexplained = np.where(first_seen, 0, deltas["run_count_delta"] - deltas["new_times"])
+        mask = unexplained > 0
+        result = {name: values[mask] for name, values in deltas.items()}
+        result["unexplained"] = unexplained[mask]
+        return result
+
+
+    def run_summary(self):
+        """
+        Totals per run over all records: run, records, new_times and run_count_delta.
+        """
+        deltas = self.run_deltas()
+        runs, inverse, records = np.unique(deltas["run"], return_inverse=True, return_counts=True)
+        return {
+            "run": runs,
+            "records": records,
+            "new_times": np.bincount(inverse, weights=deltas["new_times"], minlength=len(runs)).astype(np.int64),
+            "run_count_delta": np.bincount(inverse, weights=deltas["run_count_delta"], minlength=len(runs)).astype(np.int64),
+        }
+
+
+    def merged(self, executable=None):
+        """
+        Execution events merged per executable over all hashes and hosts, ordered by executable and time.
+        Returns a dictionary of arrays: executable (name id into executable_names), key, time, first_run,
+        and "groups" (start index of every executable) for slicing.
+
+        :param executable: (Optional) Only events of this executable name.
+        """
+        events = self.events()
+        executables = self.key_executables[events["key"]]
+        order = np.lexsort((events["time"].astype(np.int64), executables))
+        result = {"executable": executables[order], **{name: values[order] for name, values in events.items()}}
+
+        if executable is not None:
+            matches = np.flatnonzero(self.executable_names == executable)
+            mask = result["executable"] == (matches[0] if len(matches) else -1)
+            result = {name: values[mask] for name, values in result.items()}
+
+        boundaries = np.ones(len(result["executable"]), dtype=bool)
+        boundaries[1:] = result["executable"][1:] != result["executable"][:-1]
+        result["groups"] = np.flatnonzero(boundaries)
+        return result
+
+
+    def write_csv(self, csv_path):
+        """
+        Writes the merged timeline: host, executable, hash, time, first seen run.
+        """
+        merged = self.merged()
+        times = np.datetime_as_string(merged["time"], unit="s")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Host", "ExecutableName", "Hash", "Time", "FirstSeenRun"])
+            for key, time, first_run in zip(merged["key"].tolist(), times.tolist(), merged["first_run"].tolist()):
+                host, executable, hash_value = self.key_names[key]
+                writer.writerow([host, executable, hash_value, time.replace("T", " "), first_run])
+
+
+
+
+def load_run_folders(folder_path, analysis_search, host="", builder=None):
+    """
+    Adds the records of every run folder (folder_path\\{counter}) to the builder.
+
+    :param folder_path: Work folder containing the run folders.
+    :param analysis_search: (prefix, suffix) of the JSON files.
+    :param host: (Optional) Host label of these runs.
+    :param builder: (Optional) TimelineBuilder shared by several hosts, a new one by default.
+    """
+    builder = builder or TimelineBuilder()
+    prefix, suffix = analysis_search
+    for run, run_folder in snapshot_diff.find_run_folders(folder_path):
+        with os.scandir(run_folder) as entries:
+            json_files = sorted(
+                entry.path for entry in entries
+                if entry.is_file() and entry.name.startswith(prefix) and entry.name.endswith(suffix)
+            )
+        _add_files(builder, host, run, json_files + columnar.find(run_folder))
+    return builder
+
+
+
+
+def load_archive(archive_folder, analysis_search, host="", builder=None):
+    """
+    Adds the records of every archived run to the builder, parameters as load_run_folders.
+    """
+    builder = builder or TimelineBuilder()
+    archive = run_archive.RunArchive(archive_folder)
+    prefix, suffix = analysis_search
+    for run in archive.runs():
+        files = archive.files(run, prefix, suffix) + archive.files(run, columnar.CONTAINER_NAME)
+        _add_files(builder, host, run, [blob_path for _, blob_path in files])
+    return builder
+
+
+
+
+def load_corpus(corpus_path, run=0, builder=None):
+    """
+    Adds the records of a merged corpus dataset (corpus.py) to the builder, hosts are taken from "Host".
+
+    :param corpus_path: Merged corpus.jsonl.
+    :param run: (Optional) Run number of the collection.
+    :param builder: (Optional) TimelineBuilder, a new one by default.
+    """
+    builder = builder or TimelineBuilder()
+    for record in json_stream.iter_records(corpus_path, RECORD_KEYS + ("Host",)):
+        builder.add(record.get("Host", ""), run, record)
+    return builder
+
+
+
+
+def _add_files(builder, host, run, json_files):
+    for json_file in json_files:
+        try:
+            for record in json_stream.iter_records(json_file, RECORD_KEYS):
+                builder.add(host, run, record)
+        except (ValueError, OSError) as e:
+            logging.error(f"Error reading {json_file}: {e}")